@@ -0,0 +1,374 @@
+"""Nhật ký hoạt động có cấu trúc và có chỉ mục.
+
+Mỗi bản ghi là một dòng JSON:
+
+    {"ts": 1760000000.123, "time": "2025-10-09 12:00:00", "level": "INFO",
+     "user": "vanh", "op": "return_book", "title": "Dế Mèn", "actor": "vanh",
+     "message": "Trả sách: Dế Mèn"}
+
+và được ghi vào hai nơi:
+
+- logs/<user>.jsonl: lịch sử của một người dùng
+- logs/_audit.jsonl: mọi người dùng theo thứ tự ghi, cho truy vấn của admin
+
+Mỗi file .jsonl có file chỉ mục .idx bên cạnh, gồm các mục 16 byte
+(khóa thời gian float64, offset uint64) theo thứ tự ghi. Lấy N bản ghi cuối
+hay một khoảng thời gian chỉ cần tìm nhị phân trên .idx rồi seek vào
+.jsonl, không phải đọc lại cả file.
+
+Khi file .jsonl vượt quá kích thước hoặc thời gian cho phép (RotationPolicy),
+nó được nén thành đoạn logs/<name>.<khóa đầu tính bằng ms>.jsonl.gz và một
+file mới được bắt đầu. Các đoạn quá cũ hoặc vượt quá số lượng giữ lại bị
+xóa. tail/time_range đọc qua các đoạn đã nén khi file hiện tại không đủ,
+nên người đọc không cần biết file đã được xoay.
+"""
+import bisect
+import gzip
+import heapq
+import json
+import os
+import re
+import shutil
+import struct
+import time
+from collections import deque
+
+try:
+    import fcntl  # Khóa file khi nhiều client cùng ghi một thư mục logs
+except ImportError:  # Windows
+    fcntl = None
+
+AUDIT_NAME = '_audit'  # không trùng tên người dùng
+INDEX_ENTRY = struct.Struct('<dQ')
+HOUR = 3600
+DAY = 24 * HOUR
+
+_SEGMENT = re.compile(r'^(.*)\.(\d+)\.jsonl\.gz$')
+
+
+class RotationPolicy:
+    """Khi nào xoay file nhật ký và giữ lại các đoạn đã nén bao lâu.
+
+    max_bytes/max_age (giây): xoay khi file hiện tại vượt một trong hai.
+    retention (giây)/keep: xóa đoạn cũ hơn retention hoặc ngoài keep đoạn
+    mới nhất của mỗi file. Giá trị 0 hoặc None là không giới hạn.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024, max_age=DAY, retention=30 * DAY, keep=50):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention = retention
+        self.keep = keep
+
+
+def data_path(log_dir, name):
+    return os.path.join(log_dir, f"{name}.jsonl")
+
+def index_path(log_dir, name):
+    return os.path.join(log_dir, f"{name}.idx")
+
+def segment_path(log_dir, name, first_key):
+    return os.path.join(log_dir, f"{name}.{int(first_key * 1000)}.jsonl.gz")
+
+def segments(log_dir, name):
+    """Các đoạn đã xoay của name: [(khóa đầu, đường dẫn)], cũ trước mới sau"""
+    result = []
+    try:
+        entries = os.scandir(log_dir)
+    except FileNotFoundError:
+        return result
+    with entries:
+        for entry in entries:
+            match = _SEGMENT.match(entry.name)
+            if match and match.group(1) == name:
+                result.append((int(match.group(2)) / 1000, entry.path))
+    result.sort()
+    return result
+
+
+class IndexedLog:
+    """Một cặp file .jsonl/.idx đang mở để ghi"""
+
+    def __init__(self, log_dir, name, policy=None):
+        self.log_dir = log_dir
+        self.name = name
+        self.policy = policy
+        self.last_key = None
+        self._open()
+
+    def _open(self):
+        # Không buffer: mỗi lần write là một lần ghi nối cả lô xuống file
+        self.data = open(data_path(self.log_dir, self.name), 'ab', buffering=0)
+        self.index = open(index_path(self.log_dir, self.name), 'ab', buffering=0)
+        self.first_key = None
+
+    def _is_current(self):
+        try:
+            return os.stat(self.data.name).st_ino == os.fstat(self.data.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _lock(self):
+        while True:
+            if fcntl is not None:
+                fcntl.flock(self.data, fcntl.LOCK_EX)
+            if self._is_current():
+                return
+            # Tiến trình khác đã xoay file trong lúc chờ khóa: mở file mới
+            self.close()
+            self._open()
+
+    def _should_rotate(self, size):
+        policy = self.policy
+        if policy is None or size == 0:
+            return False
+        if policy.max_bytes and size >= policy.max_bytes:
+            return True
+        if policy.max_age:
+            if self.first_key is None:
+                self.first_key = _first_key(self.index.name)
+            return self.first_key is not None and time.time() - self.first_key >= policy.max_age
+        return False
+
+    def _rotate(self):
+        """Nén file hiện tại thành một đoạn rồi bắt đầu file mới (đang giữ khóa)"""
+        first_key = _first_key(self.index.name) or time.time()
+        path = segment_path(self.log_dir, self.name, first_key)
+        while os.path.exists(path):
+            first_key += 0.001
+            path = segment_path(self.log_dir, self.name, first_key)
+        with open(self.data.name, 'rb') as src, gzip.open(path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + '.tmp', path)
+        os.unlink(self.data.name)
+        os.unlink(self.index.name)
+        self.close()
+        self._open()
+        self._lock()
+        prune(self.log_dir, self.name, self.policy)
+
+    def append(self, records):
+        """Ghi một lô (ts, dòng JSON đã mã hóa) và các mục chỉ mục tương ứng"""
+        self._lock()
+        try:
+            offset = self.data.seek(0, os.SEEK_END)
+            if self._should_rotate(offset):
+                self._rotate()
+                offset = 0
+            if self.last_key is None:
+                self.last_key = _last_key(self.index)
+            entries = []
+            for ts, line in records:
+                # Khóa không giảm để tìm nhị phân được, kể cả khi đồng hồ
+                # của hai client ghi chung thư mục lệch nhau một chút
+                self.last_key = ts if self.last_key is None else max(ts, self.last_key)
+                entries.append(INDEX_ENTRY.pack(self.last_key, offset))
+                offset += len(line)
+            self.data.write(b''.join(line for _, line in records))
+            self.index.write(b''.join(entries))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.data, fcntl.LOCK_UN)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+def _first_key(path):
+    try:
+        with open(path, 'rb') as f:
+            entry = f.read(INDEX_ENTRY.size)
+    except FileNotFoundError:
+        return None
+    return INDEX_ENTRY.unpack(entry)[0] if len(entry) == INDEX_ENTRY.size else None
+
+def _last_key(index_file):
+    size = os.fstat(index_file.fileno()).st_size
+    if size < INDEX_ENTRY.size:
+        return None
+    with open(index_file.name, 'rb') as f:
+        f.seek(size - size % INDEX_ENTRY.size - INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+
+def encode(record):
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+def prune(log_dir, name, policy, now=None):
+    """Xóa các đoạn đã xoay của name vượt quá thời hạn hoặc số lượng giữ lại"""
+    if policy is None:
+        return
+    now = time.time() if now is None else now
+    found = segments(log_dir, name)
+    expired = found[:-policy.keep] if policy.keep else []
+    for _, path in found[len(expired):]:
+        # Đoạn được nén ngay sau bản ghi cuối cùng của nó: mtime ~ bản ghi mới nhất
+        if policy.retention and os.path.getmtime(path) < now - policy.retention:
+            expired.append((None, path))
+    for _, path in expired:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # tiến trình khác đã xóa
+
+def prune_all(log_dir, policy):
+    """Áp dụng thời hạn lưu giữ cho mọi file trong log_dir (kể cả người dùng lâu không hoạt động)"""
+    try:
+        names = {match.group(1) for match in map(_SEGMENT.match, os.listdir(log_dir)) if match}
+    except FileNotFoundError:
+        return
+    for name in names:
+        prune(log_dir, name, policy)
+
+
+# --- Đọc ---
+
+class _Index:
+    """Xem file .idx như một dãy (key, offset) mà không đọc cả file"""
+
+    def __init__(self, f):
+        self.f = f
+        self.length = os.fstat(f.fileno()).st_size // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        self.f.seek(i * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self.f.read(INDEX_ENTRY.size))
+
+    def key(self, i):
+        return self[i][0]
+
+
+def _read_from(log_dir, name, position, stop_key=None):
+    """Đọc các bản ghi từ mục thứ position của chỉ mục đến hết (hoặc đến khi khóa > stop_key)"""
+    try:
+        index_file = open(index_path(log_dir, name), 'rb')
+        data = open(data_path(log_dir, name), 'rb')
+    except FileNotFoundError:
+        return
+    with index_file, data:
+        index = _Index(index_file)
+        if position >= len(index):
+            return
+        _, offset = index[position]
+        # Chỉ mục có thể ghi sau file dữ liệu một chút: chỉ đọc tới mục cuối cùng đã có
+        data.seek(offset)
+        for i in range(position, len(index)):
+            line = data.readline()
+            if not line:
+                return
+            record = json.loads(line)
+            if stop_key is not None and index.key(i) > stop_key:
+                return
+            yield record
+
+def _bisect(log_dir, name, key):
+    try:
+        with open(index_path(log_dir, name), 'rb') as f:
+            return bisect.bisect_left(_Index(f), key, key=lambda entry: entry[0])
+    except FileNotFoundError:
+        return 0
+
+def _length(log_dir, name):
+    try:
+        return os.path.getsize(index_path(log_dir, name)) // INDEX_ENTRY.size
+    except FileNotFoundError:
+        return 0
+
+def _read_segment(path):
+    try:
+        f = gzip.open(path, 'rt', encoding='utf-8')
+    except FileNotFoundError:  # vừa bị xóa theo thời hạn lưu giữ
+        return
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def tail(log_dir, name, n):
+    """N bản ghi mới nhất của name (kể cả trong các đoạn đã xoay), cũ trước mới sau"""
+    records = list(_read_from(log_dir, name, max(0, _length(log_dir, name) - n)))
+    if len(records) < n:
+        # Chỉ giải nén các đoạn mới nhất cho tới khi đủ n bản ghi
+        for _, path in reversed(segments(log_dir, name)):
+            records[:0] = deque(_read_segment(path), maxlen=n - len(records))
+            if len(records) >= n:
+                break
+    return records
+
+def time_range(log_dir, name, start=None, end=None):
+    """Các bản ghi có ts trong [start, end] (None là không giới hạn)"""
+    def wanted(record):
+        return (start is None or record['ts'] >= start) and (end is None or record['ts'] <= end)
+
+    found = segments(log_dir, name)
+    current_first = _first_key(index_path(log_dir, name))
+    for i, (first_key, path) in enumerate(found):
+        if end is not None and first_key > end:
+            return
+        # Một đoạn kết thúc trước khóa đầu của đoạn sau (làm tròn tới ms)
+        next_key = found[i + 1][0] if i + 1 < len(found) else current_first
+        if start is not None and next_key is not None and next_key + 0.001 < start:
+            continue
+        yield from filter(wanted, _read_segment(path))
+
+    position = _bisect(log_dir, name, start) if start is not None else 0
+    yield from filter(wanted, _read_from(log_dir, name, position, stop_key=end))
+
+def query(log_dir, start=None, end=None, users=None, ops=None, title=None, limit=None):
+    """Truy vấn nhật ký của mọi người dùng (admin).
+
+    Có users thì chỉ đọc logs/<user>.jsonl của những người đó (tìm theo
+    chỉ mục thời gian của từng file rồi trộn theo ts), không phải đọc mọi
+    bản ghi của logs/_audit.jsonl trong khoảng thời gian. Không có users
+    thì đọc logs/_audit.jsonl. Trả về tối đa limit bản ghi mới nhất thỏa
+    điều kiện, cũ trước mới sau.
+    """
+    ops = set(ops) if ops else None
+    matches = deque(maxlen=limit) if limit else []
+    if users:
+        # Tên người dùng là tên file: bỏ qua tên có thể trỏ ra ngoài log_dir
+        names = sorted({user for user in users if user and os.path.basename(user) == user
+                        and not user.startswith('.') and user != AUDIT_NAME})
+        if limit and ops is None and title is None and end is None:
+            # Chỉ cần limit bản ghi mới nhất: đọc đuôi mỗi file qua chỉ mục
+            sources = ([record for record in tail(log_dir, name, limit)
+                        if start is None or record['ts'] >= start] for name in names)
+        else:
+            sources = (time_range(log_dir, name, start, end) for name in names)
+        records = heapq.merge(*sources, key=lambda record: record['ts'])
+    else:
+        records = time_range(log_dir, AUDIT_NAME, start, end)
+    for record in records:
+        if ops is not None and record.get('op') not in ops:
+            continue
+        if title is not None and record.get('title') != title:
+            continue
+        matches.append(record)
+    return list(matches)
+
+def legacy_tail(log_dir, name, n):
+    """N dòng cuối của file .log dạng văn bản cũ (đọc tuần tự, không nạp cả file)"""
+    path = os.path.join(log_dir, f"{name}.log")
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in deque(f, maxlen=n)]
+
+def parse_time(text):
+    """'2025-10-09' hoặc '2025-10-09 12:00' -> epoch, chuỗi rỗng -> None"""
+    text = text.strip()
+    if not text:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"Không hiểu thời gian: {text}")
+
+def format_record(record, with_user=False):
+    prefix = f"[{record['user']}] " if with_user else ""
+    return f"{record['time']} - {record['level']} - {prefix}{record['message']}"
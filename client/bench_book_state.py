@@ -0,0 +1,159 @@
+"""Đo chi phí nạp đối tượng Book: định dạng state cũ so với định dạng gọn hiện tại.
+
+Hai catalog giống nhau được ghi vào hai MappingStorage (trong bộ nhớ, không
+cần ZEO server), một catalog bằng lớp LegacyBook giữ nguyên __getstate__ /
+__setstate__ cũ (sao chép toàn bộ __dict__, ngày dạng chuỗi, dựng
+BookQueue và list mặc định mỗi lần nạp). Với mỗi định dạng đo:
+
+- số sách nạp được mỗi giây từ một connection có cache rỗng
+- kích thước trung bình một bản ghi Book trong storage
+- bộ nhớ cache tăng thêm cho mỗi quyển sách đã nạp (tracemalloc)
+
+    cd client
+    python bench_book_state.py
+    python bench_book_state.py --books 50000 --rounds 5 --json book_state.json
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+import transaction
+from ZODB import DB
+from ZODB.MappingStorage import MappingStorage
+from BTrees.OOBTree import OOBTree
+
+from models.book import Book, TIME_FORMAT
+from models.book_queue import BookQueue
+
+
+class LegacyBook(Book):
+    """Book với state như trước khi có định dạng gọn (chỉ dùng để so sánh)"""
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in [k for k in state if k.startswith('_v_')]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.borrower = None
+        self.borrow_date = None
+        self.queue = BookQueue()
+        self.pending_requests = []
+        self.__dict__.update(state)
+        self.__dict__.pop('_is_locked', None)
+        self.__dict__.pop('_lock_holder', None)
+
+
+def make_book(cls, i, rng, legacy):
+    """Sách thứ i: khoảng 1/3 đang được mượn, 1/10 có yêu cầu chờ duyệt"""
+    book = cls(f"Sách {i:06d}", f"Tác giả {i % 997}")
+    now = int(time.time())
+    stamp = (lambda t: time.strftime(TIME_FORMAT, time.localtime(t))) if legacy else (lambda t: t)
+    if legacy:
+        book.borrower = None
+        book.borrow_date = None
+        book.pending_requests = []
+    if rng.random() < 0.33:
+        book.available = False
+        book.borrower = f"user{rng.randrange(200)}"
+        book.borrow_date = stamp(now - rng.randrange(86400))
+    if rng.random() < 0.1:
+        requests = [(f"user{rng.randrange(200)}", stamp(now - j)) for j in range(rng.randrange(1, 4))]
+        book.pending_requests = requests if legacy else tuple(requests)
+    return book
+
+def build(cls, n_books, legacy, seed):
+    """Tạo DB trong bộ nhớ chứa n_books sách, trả về (db, oid của các sách)"""
+    db = DB(MappingStorage(), cache_size=n_books * 4 + 1000)
+    rng = random.Random(seed)
+    tm = transaction.TransactionManager()
+    connection = db.open(transaction_manager=tm)
+    books = connection.root()['books'] = OOBTree()
+    for i in range(n_books):
+        book = make_book(cls, i, rng, legacy)
+        books[book.title] = book
+        if i % 5000 == 4999:
+            tm.savepoint(optimistic=True)
+    tm.commit()
+    oids = [book._p_oid for book in books.values()]
+    connection.close()
+    return db, oids
+
+def record_size(db, oids):
+    storage = db.storage
+    return sum(len(storage.load(oid)[0]) for oid in oids) / len(oids)
+
+def load_all(db, oids):
+    """Nạp mọi sách từ một connection có cache rỗng: (giây, byte bộ nhớ tăng thêm)"""
+    connection = db.open()
+    connection.cacheMinimize()
+    books = [connection.get(oid) for oid in oids]  # ghost, chưa nạp state
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for book in books:
+        book._p_activate()
+    elapsed = time.perf_counter() - start
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    connection.cacheMinimize()
+    connection.close()
+    return elapsed, grown
+
+def measure(name, cls, n_books, rounds, legacy, seed):
+    db, oids = build(cls, n_books, legacy, seed)
+    try:
+        # Đo thời gian không bật tracemalloc, lấy lần nhanh nhất
+        best = float('inf')
+        for _ in range(rounds):
+            connection = db.open()
+            connection.cacheMinimize()
+            books = [connection.get(oid) for oid in oids]
+            start = time.perf_counter()
+            for book in books:
+                book._p_activate()
+            best = min(best, time.perf_counter() - start)
+            connection.cacheMinimize()
+            connection.close()
+        _, grown = load_all(db, oids)
+        return {
+            'format': name,
+            'books': n_books,
+            'loads_per_s': round(n_books / best),
+            'record_bytes': round(record_size(db, oids), 1),
+            'memory_per_book': round(grown / n_books, 1),
+        }
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh định dạng state của Book")
+    parser.add_argument('--books', type=int, default=20000, help='số sách trong catalog')
+    parser.add_argument('--rounds', type=int, default=3, help='số lần nạp, lấy lần nhanh nhất')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    results = [measure('cũ', LegacyBook, args.books, args.rounds, True, args.seed),
+               measure('gọn', Book, args.books, args.rounds, False, args.seed)]
+
+    print(f"{'Định dạng':<10}{'sách/s':>12}{'byte/bản ghi':>15}{'byte bộ nhớ/sách':>20}")
+    for r in results:
+        print(f"{r['format']:<10}{r['loads_per_s']:>12}{r['record_bytes']:>15}{r['memory_per_book']:>20}")
+    old, new = results
+    print(f"\n⚡ Nạp nhanh hơn {new['loads_per_s'] / old['loads_per_s']:.1f} lần, "
+          f"bản ghi nhỏ hơn {1 - new['record_bytes'] / old['record_bytes']:.0%}, "
+          f"bộ nhớ mỗi sách giảm {1 - new['memory_per_book'] / old['memory_per_book']:.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
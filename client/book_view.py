@@ -0,0 +1,103 @@
+from storage import PAGE_SIZE, catalog_keys, catalog_page
+
+
+class StatusChange:
+    """Một dòng thay đổi trong bảng trạng thái (row None = sách không còn)"""
+
+    def __init__(self, title, old_row, new_row):
+        self.title = title
+        self.old_row = old_row
+        self.new_row = new_row
+
+    @property
+    def borrower_changed(self):
+        old_borrower = self.old_row['borrower'] if self.old_row else None
+        new_borrower = self.new_row['borrower'] if self.new_row else None
+        return old_borrower != new_borrower
+
+
+class BookStatusView:
+    """Bảng trạng thái của trang sách đang hiển thị, giữ sẵn trong bộ nhớ.
+
+    Trang là khoảng khóa (first, last] của catalog: first là cursor của
+    trang (None = đầu catalog), last là khóa cuối khi trang được mở (None =
+    tới cuối catalog). Sách được thêm/xóa trong khoảng đó thành dòng mới hay
+    dòng bị xóa, các trang khác không bao giờ được đọc.
+
+    Mỗi lần có thay đổi chỉ cập nhật dòng của những sách đã đổi và chỉ in
+    ra những dòng khác với lần hiển thị trước.
+    """
+
+    def __init__(self, page_size=PAGE_SIZE):
+        self.rows = {}
+        self.page_size = page_size
+        self.first = None
+        self.last = None
+        self.seeded = False
+
+    def __contains__(self, title):
+        return title in self.rows
+
+    def show_page(self, cursor):
+        """Đổi sang trang bắt đầu sau cursor (gọi từ thread menu)"""
+        self.first = cursor
+        self.seeded = False
+
+    def seed(self, catalog):
+        """Đọc trang hiện tại (một catalog_page), trả về tên các sách của trang"""
+        page, self.last = catalog_page(catalog, self.first, self.page_size)
+        self.seeded = True
+        return {title for title, _ in page}
+
+    def window(self, catalog):
+        """Tên các sách hiện có trong khoảng của trang"""
+        return set(catalog_keys(catalog, self.first, self.last))
+
+    @staticmethod
+    def make_row(book):
+        """Trạng thái hiển thị của một quyển sách"""
+        queue = getattr(book, 'queue', None)
+        return {
+            'available': book.available,
+            'borrower': book.borrower,
+            'queue': tuple(u for u, _ in queue.waiting_list) if queue is not None else ()
+        }
+
+    def apply(self, title, book):
+        """Cập nhật dòng của một sách (book None = đã bị xóa), trả về StatusChange hoặc None"""
+        old_row = self.rows.get(title)
+        if book is None:
+            if old_row is None:
+                return None
+            del self.rows[title]
+            return StatusChange(title, old_row, None)
+
+        new_row = self.make_row(book)
+        if new_row == old_row:
+            return None
+        self.rows[title] = new_row
+        return StatusChange(title, old_row, new_row)
+
+    def clear(self):
+        self.rows.clear()
+
+    @staticmethod
+    def render_row(title, row):
+        status = "✅ Có sẵn" if row['available'] else f"❌ Đang mượn bởi {row['borrower']}"
+        lines = [f"- {title}: {status}"]
+        if row['queue']:
+            lines.append(f"  👥 Hàng đợi: {', '.join(row['queue'])}")
+        return lines
+
+    def render_changes(self, changes):
+        """Chỉ render các dòng đã thay đổi"""
+        lines = []
+        for change in sorted(changes, key=lambda c: c.title):
+            if change.new_row is None:
+                lines.append(f"- {change.title}: 🗑️ Đã bị xóa")
+                continue
+            row_lines = self.render_row(change.title, change.new_row)
+            if change.old_row is None:
+                row_lines[0] += " 🆕"
+            lines.extend(row_lines)
+        return lines
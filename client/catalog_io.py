@@ -0,0 +1,142 @@
+"""Nhập / xuất catalog sách hàng loạt dạng CSV hoặc JSONL.
+
+File được đọc và ghi tuần tự, sách được ghi theo lô (mỗi lô một transaction,
+có savepoint trong lô) và cache được dọn sau mỗi lô hay mỗi đoạn (xuất dữ
+liệu nạp trước cả đoạn bằng prefetch), nên bộ nhớ không tăng theo kích
+thước catalog. Sách đã có trong catalog được bỏ qua.
+
+    cd client
+    python catalog_io.py import books.csv --batch-size 2000
+    python catalog_io.py export catalog.jsonl
+    python catalog_io.py export - --format csv > catalog.csv
+
+CSV cần dòng tiêu đề có cột title và author (các cột khác bị bỏ qua); mỗi
+dòng JSONL là một object có khóa title và author. File xuất có thêm
+available và borrower.
+"""
+import argparse
+import csv
+import getpass
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from client_config import load_config, open_storage, open_db
+from report import write_rows
+from service import IMPORT_BATCH_SIZE, IMPORT_SAVEPOINT_EVERY, LibraryService
+from storage import iter_catalog
+
+FIELDS = ('title', 'author', 'available', 'borrower')
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+@contextmanager
+def _open(path, mode):
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+    else:
+        with open(path, mode, encoding='utf-8', newline='') as f:
+            yield f
+
+def read_records(f, fmt):
+    """Đọc dần (title, author) từ file CSV hoặc JSONL"""
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield row.get('title'), row.get('author')
+    else:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record.get('title'), record.get('author')
+
+def export_books(books_root, f, fmt):
+    """Ghi toàn bộ catalog ra file, trả về số sách đã ghi"""
+    rows = ({'title': title, 'author': book.author, 'available': book.available, 'borrower': book.borrower}
+            for title, book in iter_catalog(books_root['books'], books_root._p_jar))
+    return write_rows(rows, FIELDS, fmt, f)
+
+def _admin(config):
+    """Đăng nhập admin qua server accounts (nhập sách cần quyền admin)"""
+    storage = open_storage('accounts', 8000, config)
+    db = open_db(storage, config)
+    try:
+        connection = db.open()
+        password = config.password if config.password is not None else getpass.getpass("🔑 Mật khẩu: ")
+        user = LibraryService(accounts_root=connection.root()).login(config.user, password)
+        connection.close()
+        return user
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nhập / xuất catalog sách hàng loạt")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', help="file CSV/JSONL, '-' là stdin/stdout")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='mặc định đoán theo đuôi file')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='số sách mỗi transaction')
+    parser.add_argument('--savepoint-every', type=int, default=IMPORT_SAVEPOINT_EVERY,
+                        help='số sách giữa hai savepoint trong một lô')
+    parser.add_argument('--user', default='admin', help='tài khoản admin dùng để nhập')
+    parser.add_argument('--password', help='mật khẩu (mặc định hỏi khi chạy)')
+    config = load_config(argv, parser=parser)
+    fmt = detect_format(config.path, config.format)
+    # Thông báo ra stderr để có thể xuất thẳng ra stdout
+    report = sys.stderr
+
+    actor = None
+    if config.command == 'import':
+        actor = _admin(config)
+        if actor is None:
+            print("⚠️ Tên đăng nhập hoặc mật khẩu không đúng!", file=report)
+            return 1
+
+    storage = open_storage('books', 8001, config)
+    db = open_db(storage, config)
+    connection = db.open()
+    books_root = connection.root()
+    tm = connection.transaction_manager
+    start = time.perf_counter()
+    try:
+        if config.command == 'export':
+            if 'books' not in books_root:
+                print("Chưa có sách nào trong thư viện!", file=report)
+                return 0
+            with _open(config.path, 'w') as f:
+                count = export_books(books_root, f, fmt)
+            elapsed = time.perf_counter() - start
+            print(f"✅ Đã xuất {count} sách trong {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} sách/s)",
+                  file=report)
+            return 0
+
+        service = LibraryService(books_root, transaction_manager=tm)
+        service.prepare_books()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - start
+            done = stats['added'] + stats['skipped']
+            print(f"   lô {stats['batches']}: {stats['added']} mới, {stats['skipped']} đã có "
+                  f"({done / max(elapsed, 1e-9):.0f} sách/s)", file=report)
+
+        with _open(config.path, 'r') as f:
+            stats, message = service.import_books(read_records(f, fmt), actor, config.batch_size,
+                                                  config.savepoint_every, progress)
+        print(message, file=report)
+        if stats is None:
+            return 1
+        if stats['invalid']:
+            print(f"⚠️ {stats['invalid']} dòng không có tên sách", file=report)
+        print(f"⏱️ {time.perf_counter() - start:.1f}s", file=report)
+        return 0
+    finally:
+        tm.abort()
+        connection.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import threading
+from ZEO import ClientStorage
+from storage import is_btree_catalog
+
+
+class NotifyingClientStorage(ClientStorage.ClientStorage):
+    """ClientStorage gọi lại các listener khi server gửi invalidation"""
+
+    def __init__(self, *args, **kwargs):
+        # Phải có trước khi ClientStorage kết nối (có thể nhận invalidation ngay)
+        self._invalidation_listeners = []
+        super().__init__(*args, **kwargs)
+
+    def add_invalidation_listener(self, listener):
+        """listener(oids) được gọi với danh sách OID, hoặc None khi cả cache bị xóa"""
+        self._invalidation_listeners.append(listener)
+
+    def invalidateTransaction(self, tid, oids):
+        super().invalidateTransaction(tid, oids)
+        for listener in self._invalidation_listeners:
+            listener(oids)
+
+    def invalidateCache(self):
+        super().invalidateCache()
+        for listener in self._invalidation_listeners:
+            listener(None)
+
+
+class Changes:
+    """Tập thay đổi được gom lại giữa hai lần wait()"""
+
+    def __init__(self, titles, catalog_changed, refresh_all, watched=False):
+        self.titles = titles
+        self.catalog_changed = catalog_changed
+        self.refresh_all = refresh_all
+        self.watched = watched
+
+
+def _btree_oids(tree):
+    """Lấy OID của tất cả các node (BTree và bucket) của một BTree"""
+    oids = {tree._p_oid}
+    tree._p_activate()
+    state = tree.__getstate__()
+    if not state or len(state) < 2:
+        # BTree rỗng hoặc chỉ có một bucket nằm ngay trong record của BTree
+        return oids
+    for child in state[0][::2]:
+        if isinstance(child, type(tree)):
+            oids |= _btree_oids(child)
+        else:
+            oids.add(child._p_oid)
+    return oids
+
+
+def _book_oids(book):
+    """Các OID mà khi thay đổi thì trạng thái hiển thị của sách thay đổi"""
+    oids = {book._p_oid}
+    queue = getattr(book, 'queue', None)
+    if queue is not None and queue._p_oid is not None:
+        oids.add(queue._p_oid)
+        # Thêm/bớt người trong hàng đợi chỉ ghi vào BTree của hàng đợi
+        entries = getattr(queue, '_entries', None)
+        if entries is not None and entries._p_oid is not None:
+            oids |= _btree_oids(entries)
+    return oids
+
+
+def borrower_oids(index, username):
+    """Các node của chỉ mục by_borrower và tập sách username đang mượn.
+
+    Một trong các node này đổi khi username được mượn thêm hoặc trả bớt
+    sách, kể cả những sách không có trên màn hình.
+    """
+    oids = _btree_oids(index.by_borrower)
+    titles = index.by_borrower.get(username)
+    if titles is not None:
+        oids |= _btree_oids(titles)
+    return oids
+
+
+class ChangeFeed:
+    """Nhận invalidation từ ZEO và chỉ báo lại những sách đã thay đổi.
+
+    Thread đọc gọi wait() và bị chặn cho tới khi có thay đổi nên client
+    rảnh không tốn CPU và không tải gì từ server.
+
+    Chỉ các sách đang hiển thị được track; OID không có trong bảng track
+    chỉ được xét tiếp khi là node của catalog (sách được thêm/xóa) hoặc
+    node được watch (ví dụ chỉ mục sách đang mượn), không bao giờ phải
+    duyệt cả catalog để dựng bảng OID.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._oid_titles = {}
+        self._title_oids = {}
+        self._catalog_oids = set()
+        self._watch_oids = set()
+        self._reset()
+
+    def _reset(self):
+        self._titles = set()
+        self._catalog_changed = False
+        self._refresh_all = False
+        self._watched = False
+
+    def attach(self, storage):
+        storage.add_invalidation_listener(self._on_invalidate)
+
+    def track_catalog(self, catalog):
+        """Ghi nhớ các node của catalog để phát hiện sách được thêm/xóa"""
+        if is_btree_catalog(catalog):
+            oids = _btree_oids(catalog)
+        else:
+            oids = {catalog._p_oid}
+        with self._cond:
+            self._catalog_oids = oids
+
+    def watch(self, oids):
+        """Báo watched khi một trong các OID này bị invalidate (thay tập cũ)"""
+        with self._cond:
+            self._watch_oids = set(oids)
+
+    def track(self, title, book):
+        """Ghi nhớ các OID của một quyển sách đã được đọc"""
+        oids = _book_oids(book)
+        with self._cond:
+            self._untrack(title)
+            self._title_oids[title] = oids
+            for oid in oids:
+                self._oid_titles[oid] = title
+
+    def untrack(self, title):
+        with self._cond:
+            self._untrack(title)
+
+    def _untrack(self, title):
+        for oid in self._title_oids.pop(title, ()):
+            self._oid_titles.pop(oid, None)
+
+    def publish(self, titles=None):
+        """Báo thay đổi do chính client này commit (server không gửi lại)"""
+        with self._cond:
+            if titles is None:
+                self._refresh_all = True
+            else:
+                self._titles.update(titles)
+            self._cond.notify_all()
+
+    def _on_invalidate(self, oids):
+        # Chạy trên thread IO của ZEO: chỉ gom OID, không tải đối tượng
+        with self._cond:
+            if oids is None:
+                self._refresh_all = True
+            else:
+                for oid in oids:
+                    title = self._oid_titles.get(oid)
+                    if title is not None:
+                        self._titles.add(title)
+                    elif oid in self._catalog_oids:
+                        self._catalog_changed = True
+                    elif oid in self._watch_oids:
+                        self._watched = True
+            if self._pending():
+                self._cond.notify_all()
+
+    def _pending(self):
+        return self._titles or self._catalog_changed or self._refresh_all or self._watched
+
+    def wait(self, timeout=None):
+        """Chờ tới khi có thay đổi, trả về Changes hoặc None nếu hết thời gian"""
+        with self._cond:
+            if not self._cond.wait_for(self._pending, timeout):
+                return None
+            changes = Changes(self._titles, self._catalog_changed, self._refresh_all, self._watched)
+            self._reset()
+            return changes
@@ -1,52 +1,86 @@
 from ZEO import ClientStorage
 import ZODB
 import transaction
-from persistent.mapping import PersistentMapping
 from operations import *
+from storage import PAGE_SIZE
+from service import LibraryService
+from models.book_index import get_book_index, get_pending_index
+from sessions import SessionManager
+from change_feed import ChangeFeed, NotifyingClientStorage, borrower_oids
+from book_view import BookStatusView
+from library_client import LibraryClient
+from client_config import load_config, logging_options, print_cache_report
+import atexit
 import threading
 import time
 import os
 import logging
 import sys
 from datetime import datetime
-from queue import Queue
 import platform
-from utils import get_user_logger
+from utils import configure_logging, get_user_logger, log_event
 
 # Tạo thư mục logs trong thư mục hiện tại
 current_dir = os.path.dirname(os.path.abspath(__file__))
 logs_dir = os.path.join(current_dir, "logs")
 os.makedirs(logs_dir, exist_ok=True)
 
+# Cấu hình cache và nhật ký (client.ini hoặc tham số dòng lệnh)
+config = load_config(description="Client thư viện mini")
+configure_logging(**logging_options(config))
+
 # Tạo system logger
 system_logger = get_user_logger('system')
 system_logger.info("=== Hệ thống thư viện khởi động ===")
 
-# Queue để thông báo cập nhật
-update_queue = Queue()
-# Thiết lập update_queue cho operations
-set_update_queue(update_queue)
+# Change feed nhận invalidation từ ZEO để cập nhật real-time
+change_feed = ChangeFeed()
+# Thiết lập change feed cho operations
+set_change_feed(change_feed)
+
+# Bảng trạng thái sách mà thread auto refresh cập nhật dần
+status_view = BookStatusView()
+
+def on_open(name, storage):
+    # Nhận invalidation của books ngay từ lúc kết nối
+    if name == 'books':
+        change_feed.attach(storage)
 
-# ⚙️ Kết nối ZEO server cho books
-books_storage = ClientStorage.ClientStorage(('127.0.0.1', 8001))
-books_db = ZODB.DB(books_storage)
-books_connection = books_db.open()
-books_root = books_connection.root()
+# ⚙️ Chỉ kết nối ZEO server khi cần: accounts (8000) để đăng nhập,
+# books (8001) sau khi đăng nhập. Mỗi thread có connection riêng từ pool.
+client = LibraryClient(config, storage_classes={'books': NotifyingClientStorage}, on_open=on_open)
 
-# ⚙️ Kết nối ZEO server cho accounts
-accounts_storage = ClientStorage.ClientStorage(('127.0.0.1', 8000))
-accounts_db = ZODB.DB(accounts_storage)
-accounts_connection = accounts_db.open()
-accounts_root = accounts_connection.root()
+def report_cache():
+    # Số đối tượng tải từ storage chỉ được đếm khi connection đóng
+    client.close_thread()
+    print_cache_report(client.databases)
+
+if config.cache_stats:
+    atexit.register(report_cache)
+tm = client.transaction_manager()
+accounts_root = client.root('accounts')
+books_root = None
 
 def refresh_display(books_root, current_user, force_sync=False):
     """Cập nhật hiển thị trạng thái sách"""
     if current_user and current_user.is_logged_in:
         if force_sync:
-            books_connection.sync()
-            transaction.begin()
+            # Transaction mới của thread chính đọc trạng thái mới nhất
+            tm.begin()
         print("\n📚 Trạng thái sách hiện tại:")
-        list_books(books_root, current_user)
+        # Hiển thị theo trang để catalog lớn không phải tải mọi quyển sách
+        show_page(None)
+        cursor = list_books(books_root, current_user, page_size=PAGE_SIZE)
+        while cursor is not None:
+            if input("👉 Enter để xem trang tiếp, 0 để dừng: ") == "0":
+                break
+            show_page(cursor)
+            cursor = list_books(books_root, current_user, page_size=PAGE_SIZE, cursor=cursor)
+
+def show_page(cursor):
+    """Cho thread auto refresh theo dõi trang vừa hiển thị thay cho trang cũ"""
+    status_view.show_page(cursor)
+    change_feed.publish()
 
 def show_terminal_notification(message):
     """Hiển thị thông báo nổi bật trên terminal"""
@@ -57,97 +91,131 @@ def show_terminal_notification(message):
     print("⏰ " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     print("=" * 60 + "\n")
 
-def auto_refresh(books_root, books_connection):
-    """Thread cập nhật real-time"""
-    last_state = {}  # Lưu trạng thái cuối cùng của mỗi sách
-    sync_interval = 0.5  # Giảm thời gian đồng bộ xuống 0.5 giây
-    last_sync_time = time.time()
-    
+def auto_refresh(client):
+    """Thread cập nhật real-time, chỉ đọc lại và in lại những sách đã thay đổi"""
+    # Connection riêng của thread này: không dùng chung cache và transaction
+    # với thread menu chính
+    refresh_tm = client.transaction_manager()
+    books_root = client.root('books')
+    # Mỗi lần đổi trang chỉ đọc trang đó và không in ra (refresh_display
+    # vừa hiển thị nó)
+    changes = None
+    refresh_all = True
+    initial = True
+    borrowed = None  # sách current_user đang mượn theo chỉ mục
+
     while True:
         try:
-            current_time = time.time()
-            
-            # Kiểm tra xem có cập nhật mới không
+            # Chờ invalidation từ server hoặc thay đổi của chính client này,
+            # không có thay đổi thì thread bị chặn và không tốn CPU
+            if not refresh_all:
+                changes = change_feed.wait()
+                refresh_all = changes.refresh_all
+
             try:
-                # Non-blocking check for updates
-                has_update = not update_queue.empty()
-                if has_update:
-                    update_queue.get_nowait()
-                    books_connection.sync()
-                    transaction.begin()
-                    last_sync_time = current_time  # Reset thời gian đồng bộ
-                # Nếu đã đến thời gian đồng bộ định kỳ
-                elif current_time - last_sync_time >= sync_interval:
-                    books_connection.sync()
-                    transaction.begin()
-                    last_sync_time = current_time
+                refresh_tm.begin()
             except Exception as e:
                 system_logger.error(f"Lỗi khi đồng bộ: {str(e)}")
+                change_feed.publish()  # Thử lại với một lần làm mới toàn bộ
+                time.sleep(1)
                 continue
 
-            # Kiểm tra thay đổi
-            current_state = {}
-            has_changes = False
-            
-            try:
-                # Cập nhật trạng thái sách
-                for book_id, book in books_root['books'].items():
-                    current_state[book_id] = {
-                        'available': book.available,
-                        'borrower': book.borrower,
-                        'queue': [(u, t) for u, t in book.queue.waiting_list] if hasattr(book, 'queue') else []
-                    }
-                    
-                    # So sánh trạng thái và kiểm tra thay đổi
-                    if book_id not in last_state or current_state[book_id] != last_state[book_id]:
-                        has_changes = True
-                        # Kiểm tra cụ thể những thay đổi
-                        if book_id in last_state:
-                            old_state = last_state[book_id]
-                            # Nếu có thay đổi về người mượn và người đang đăng nhập là người mượn mới
-                            if old_state['borrower'] != current_state[book_id]['borrower']:
-                                if current_state[book_id]['borrower'] == current_user.username:
-                                    show_terminal_notification(
-                                        f"📚 Bạn đã được mượn sách '{book_id}'"
-                                    )
-                
-                if has_changes:
-                    last_state = current_state.copy()
-                    print("\n🔄 Cập nhật trạng thái sách:")
-                    for book_id, book in books_root['books'].items():
-                        status = "✅ Có sẵn" if book.available else f"❌ Đang mượn bởi {book.borrower}"
-                        print(f"- {book.title}: {status}")
-                        if hasattr(book, 'queue') and book.queue.waiting_list:
-                            print(f"  👥 Hàng đợi: {', '.join([u for u, _ in book.queue.waiting_list])}")
-            
-            except Exception as e:
-                system_logger.error(f"Lỗi khi kiểm tra thay đổi: {str(e)}")
-                continue
-            
-            time.sleep(0.1)  # Giảm thời gian sleep để phản hồi nhanh hơn
-            
+            books = books_root['books']
+            index = get_book_index(books_root)
+            quiet = initial or not status_view.seeded
+            if not status_view.seeded:
+                # Trang mới: bỏ các dòng của trang cũ, chỉ đọc một catalog_page
+                for title in status_view.rows:
+                    change_feed.untrack(title)
+                status_view.clear()
+                titles = status_view.seed(books)
+                change_feed.track_catalog(books)
+            elif refresh_all:
+                # Chỉ đọc lại khoảng của trang đang hiển thị, không duyệt cả catalog
+                titles = status_view.window(books) | set(status_view.rows)
+                change_feed.track_catalog(books)
+            else:
+                titles = {title for title in changes.titles if title in status_view}
+                if changes.catalog_changed or any(title not in status_view for title in changes.titles):
+                    # Chỉ thêm/xóa các dòng của trang
+                    titles |= status_view.window(books) ^ set(status_view.rows)
+                if changes.catalog_changed:
+                    change_feed.track_catalog(books)
+                if index is not None and borrowed is not None:
+                    # Thay đổi của chính client này: server không gửi invalidation,
+                    # cập nhật tập sách đang mượn qua chỉ mục mà không báo
+                    for title in changes.titles:
+                        entry = index.entries.get(title)
+                        if entry is not None and entry[1] == current_user.username:
+                            borrowed.add(title)
+                        else:
+                            borrowed.discard(title)
+
+            # Chỉ đọc lại những sách đang hiển thị đã thay đổi
+            status_changes = []
+            for book_id in titles:
+                book = books.get(book_id)
+                if book is None:
+                    change_feed.untrack(book_id)
+                else:
+                    change_feed.track(book_id, book)
+                change = status_view.apply(book_id, book)
+                if change is not None:
+                    status_changes.append(change)
+
+            if index is not None and (refresh_all or changes.watched):
+                # Tra chỉ mục thay vì track mọi sách: biết được sách không có
+                # trên màn hình vừa được chuyển cho current_user
+                current = set(index.titles_borrowed_by(current_user.username))
+                if borrowed is not None and not initial:
+                    for title in sorted(current - borrowed):
+                        show_terminal_notification(f"📚 Bạn đã được mượn sách '{title}'")
+                borrowed = current
+                change_feed.watch(borrower_oids(index, current_user.username))
+            elif index is None and not initial:
+                for change in status_changes:
+                    if change.old_row and change.new_row and change.borrower_changed:
+                        if change.new_row['borrower'] == current_user.username:
+                            show_terminal_notification(f"📚 Bạn đã được mượn sách '{change.title}'")
+            refresh_all = False
+
+            if status_changes and not quiet:
+                print("\n🔄 Cập nhật trạng thái sách:")
+                for line in status_view.render_changes(status_changes):
+                    print(line)
+            initial = False
+
         except Exception as e:
             system_logger.error(f"Lỗi trong auto_refresh: {str(e)}")
+            refresh_all = True  # Không rõ thay đổi nào đã bị bỏ lỡ
             time.sleep(1)  # Đợi lâu hơn nếu có lỗi
 
-# Khởi động thread auto refresh với độ ưu tiên cao
-refresh_thread = threading.Thread(target=auto_refresh, args=(books_root, books_connection), daemon=True)
-refresh_thread.start()
+def open_books():
+    """Kết nối server books sau khi đăng nhập và khởi động thread auto refresh"""
+    books_root = client.root('books')
+    # Thử lại khi xung đột với client khác cũng đang tạo catalog/chỉ mục
+    LibraryService(books_root, transaction_manager=tm).prepare_books()
+    pending_index = get_pending_index(books_root)
+    if pending_index is not None and pending_index.has_legacy_times():
+        # Chỉ migrate_storage.py chuyển đổi, client không tự xây lại chỉ mục
+        print("⚠️ Chỉ mục yêu cầu mượn còn thời gian dạng cũ, admin cần chạy: python migrate_storage.py --books")
 
-# Khởi tạo thư viện và users nếu chưa có
-if 'books' not in books_root:
-    books_root['books'] = PersistentMapping()
-    transaction.commit()
+    # Khởi động thread auto refresh sau khi catalog đã sẵn sàng
+    refresh_thread = threading.Thread(target=auto_refresh, args=(client,), daemon=True)
+    refresh_thread.start()
+    return books_root
 
-if 'users' not in accounts_root:
-    accounts_root['users'] = PersistentMapping()
-    # Tạo tài khoản admin mặc định
-    admin = User('admin', 'admin123', role='admin')
-    accounts_root['users']['admin'] = admin
-    transaction.commit()
+LibraryService(accounts_root=accounts_root, transaction_manager=tm).prepare_accounts()
+
+# Phiên đăng nhập: kiểm tra quyền chỉ đọc phiên trong bộ nhớ
+sessions = SessionManager(accounts_root, transaction_manager=tm, ttl=config.session_ttl_hours * 3600,
+                          max_cached=config.session_cache_size)
+sessions.purge_expired()
+set_session_manager(sessions)
 
-# Xác thực người dùng
 current_user = None
+
+# Xác thực người dùng
 while not current_user:
     print("\n1. Đăng nhập")
     print("2. Đăng ký")
@@ -158,20 +226,17 @@ while not current_user:
     if choice == "1":
         current_user = login(accounts_root)
         if current_user:
-            logger = get_user_logger(current_user.username)
-            logger.info(f"Đăng nhập thành công - Vai trò: {current_user.role}")
+            log_event(current_user.username, 'login', f"Đăng nhập thành công - Vai trò: {current_user.role}")
+            books_root = open_books()
             refresh_display(books_root, current_user)  # Hiển thị trạng thái ban đầu
     elif choice == "2":
-        new_user = register(accounts_root)
-        if new_user:
-            # Tự động đăng nhập sau khi đăng ký thành công
-            current_user = new_user
-            current_user.is_logged_in = True
-            transaction.commit()
-            
-            logger = get_user_logger(current_user.username)
-            logger.info(f"Tài khoản được tạo và đăng nhập tự động - Vai trò: {current_user.role}")
+        # Tự động đăng nhập sau khi đăng ký thành công
+        current_user = register(accounts_root)
+        if current_user:
+            log_event(current_user.username, 'register',
+                      f"Tài khoản được tạo và đăng nhập tự động - Vai trò: {current_user.role}")
             print("✅ Đăng ký thành công và đã tự động đăng nhập!")
+            books_root = open_books()
             refresh_display(books_root, current_user)  # Hiển thị trạng thái ban đầu
     elif choice == "0":
         system_logger.info("Hệ thống đóng")
@@ -182,6 +247,10 @@ while not current_user:
 
 # Menu thao tác
 while True:
+    # Chỉ kiểm tra phiên trong bộ nhớ, không đọc ZODB
+    if not current_user.is_logged_in:
+        print("⏰ Phiên đăng nhập đã hết hạn, vui lòng chạy lại và đăng nhập.")
+        break
     print(f"\n📌 {current_user.username} ({current_user.role}), chọn thao tác:")
     if current_user.role == 'admin':
         print("1. Thêm sách")
@@ -192,6 +261,8 @@ while True:
         print("6. Xem tất cả sách")
         print("7. Xem lịch sử hoạt động")
         print("8. Làm mới danh sách")
+        print("9. Tra cứu nhật ký toàn hệ thống")
+        print("10. Tìm sách")
         print("0. Thoát")
     else:
         print("1. Mượn sách")
@@ -199,54 +270,55 @@ while True:
         print("3. Xem tất cả sách")
         print("4. Xem lịch sử hoạt động")
         print("5. Làm mới danh sách")
+        print("6. Tìm sách")
         print("0. Thoát")
 
     choice = input("👉 Chọn: ")
-    logger = get_user_logger(current_user.username)
 
     if current_user.role == 'admin':
         if choice == "1":
-            if add_book(books_root, current_user):
-                notify_update()
+            add_book(books_root, current_user)
         elif choice == "2":
-            if delete_book(books_root, current_user):
-                notify_update()
+            delete_book(books_root, current_user)
         elif choice == "3":
-            if approve_borrow_request(books_root, current_user):
-                notify_update()
+            approve_borrow_request(books_root, current_user)
         elif choice == "4":
-            if borrow_book(books_root, current_user):
-                notify_update()
+            borrow_book(books_root, current_user)
         elif choice == "5":
-            if return_book(books_root, current_user):
-                notify_update()
+            return_book(books_root, current_user)
         elif choice == "6":
             refresh_display(books_root, current_user, force_sync=True)
         elif choice == "7":
             view_logs(current_user.username)
         elif choice == "8":
             refresh_display(books_root, current_user, force_sync=True)
+        elif choice == "9":
+            search_logs(current_user)
+        elif choice == "10":
+            find_books(books_root, current_user)
         elif choice == "0":
-            logger.info("Đăng xuất")
+            logout(accounts_root, current_user)
+            log_event(current_user.username, 'logout', "Đăng xuất")
             print("👋 Tạm biệt!")
             break
         else:
             print("⚠️ Lựa chọn không hợp lệ.")
     else:
         if choice == "1":
-            if borrow_book(books_root, current_user):
-                notify_update()
+            borrow_book(books_root, current_user)
         elif choice == "2":
-            if return_book(books_root, current_user):
-                notify_update()
+            return_book(books_root, current_user)
         elif choice == "3":
             refresh_display(books_root, current_user, force_sync=True)
         elif choice == "4":
             view_logs(current_user.username)
         elif choice == "5":
             refresh_display(books_root, current_user, force_sync=True)
+        elif choice == "6":
+            find_books(books_root, current_user)
         elif choice == "0":
-            logger.info("Đăng xuất")
+            logout(accounts_root, current_user)
+            log_event(current_user.username, 'logout', "Đăng xuất")
             print("👋 Tạm biệt!")
             break
         else:
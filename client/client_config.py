@@ -0,0 +1,221 @@
+"""Cấu hình kết nối và cache cho các client ZEO/ZODB.
+
+Có hai tầng cache:
+
+- Cache của ZEO client (ClientStorage): lưu bản ghi đã tải từ server. Khi
+  đặt tên client và thư mục cache, cache được ghi ra file .zec nên lần khởi
+  động sau đọc catalog từ đĩa cục bộ thay vì tải lại qua mạng.
+- Cache đối tượng của ZODB (mỗi connection một cache): giới hạn theo số
+  đối tượng (cache_size) và/hoặc số byte (cache_size_bytes).
+
+Thứ tự ưu tiên: giá trị mặc định < file client.ini < tham số dòng lệnh.
+
+    [connection]
+    host = 127.0.0.1
+    pool_size = 4
+    multi_database = no
+
+    [cache]
+    dir = cache
+    persistent = yes
+    name = library
+    zeo_cache_size = 64MB
+    object_cache_size = 10000
+    object_cache_bytes = 0
+    report = no
+
+    [logging]
+    max_size = 4MB
+    max_age_hours = 24
+    retention_days = 30
+    max_segments = 50
+
+    [session]
+    ttl_hours = 8
+    cache_size = 1024
+"""
+import argparse
+import configparser
+import logging
+import os
+
+import ZODB
+from ZEO import ClientStorage
+from ZODB.ActivityMonitor import ActivityMonitor
+from zc.lockfile import LockError
+
+from runtime import DEFAULT_POOL_SIZE
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(CLIENT_DIR, 'client.ini')
+
+DEFAULTS = {
+    'host': '127.0.0.1',
+    'pool_size': DEFAULT_POOL_SIZE,
+    'multi_database': False,
+    'cache_dir': os.path.join(CLIENT_DIR, 'cache'),
+    'persistent_cache': True,
+    'cache_name': 'library',
+    'zeo_cache_size': 64 * 1024 * 1024,
+    'cache_size': 10000,
+    'cache_size_bytes': 0,
+    'cache_stats': False,
+    'log_max_bytes': 4 * 1024 * 1024,
+    'log_max_age_hours': 24,
+    'log_retention_days': 30,
+    'log_max_segments': 50,
+    'session_ttl_hours': 8,
+    'session_cache_size': 1024,
+}
+
+# Khóa trong file ini -> (section, tên thiết lập)
+INI_KEYS = {
+    ('connection', 'host'): 'host',
+    ('connection', 'pool_size'): 'pool_size',
+    ('connection', 'multi_database'): 'multi_database',
+    ('cache', 'dir'): 'cache_dir',
+    ('cache', 'persistent'): 'persistent_cache',
+    ('cache', 'name'): 'cache_name',
+    ('cache', 'zeo_cache_size'): 'zeo_cache_size',
+    ('cache', 'object_cache_size'): 'cache_size',
+    ('cache', 'object_cache_bytes'): 'cache_size_bytes',
+    ('cache', 'report'): 'cache_stats',
+    ('logging', 'max_size'): 'log_max_bytes',
+    ('logging', 'max_age_hours'): 'log_max_age_hours',
+    ('logging', 'retention_days'): 'log_retention_days',
+    ('logging', 'max_segments'): 'log_max_segments',
+    ('session', 'ttl_hours'): 'session_ttl_hours',
+    ('session', 'cache_size'): 'session_cache_size',
+}
+
+_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+
+def parse_size(value):
+    """Đổi '64MB', '512KB' hoặc '1048576' ra số byte"""
+    text = str(value).strip().upper()
+    for unit, factor in _UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)].strip()) * factor)
+    return int(text)
+
+def _read_ini(path, settings):
+    parser = configparser.ConfigParser()
+    if not parser.read(path, encoding='utf-8'):
+        return
+    for (section, key), name in INI_KEYS.items():
+        if not parser.has_option(section, key):
+            continue
+        default = DEFAULTS[name]
+        if isinstance(default, bool):
+            settings[name] = parser.getboolean(section, key)
+        elif name in ('zeo_cache_size', 'cache_size_bytes', 'log_max_bytes'):
+            settings[name] = parse_size(parser.get(section, key))
+        elif isinstance(default, int):
+            settings[name] = parser.getint(section, key)
+        else:
+            settings[name] = parser.get(section, key)
+    # Thư mục cache tương đối tính từ thư mục chứa file cấu hình
+    settings['cache_dir'] = os.path.join(os.path.dirname(os.path.abspath(path)), settings['cache_dir'])
+
+def add_arguments(parser):
+    """Thêm các tham số kết nối/cache vào một ArgumentParser"""
+    group = parser.add_argument_group('kết nối và cache')
+    group.add_argument('--config', default=DEFAULT_CONFIG, help='file cấu hình (mặc định client.ini)')
+    group.add_argument('--host', help='địa chỉ ZEO server')
+    group.add_argument('--pool-size', type=int, help='số connection tối đa mỗi database')
+    group.add_argument('--multi-database', action='store_true', default=None,
+                       help='gộp books và accounts thành một nhóm ZODB.DB(databases=...)')
+    group.add_argument('--cache-dir', help='thư mục chứa file cache của ZEO client')
+    group.add_argument('--cache-name', help='tiền tố tên file cache (mỗi tiến trình một tên)')
+    group.add_argument('--no-persistent-cache', dest='persistent_cache', action='store_false', default=None,
+                       help='chỉ dùng cache trong bộ nhớ')
+    group.add_argument('--zeo-cache-size', type=parse_size, help='dung lượng cache ZEO, ví dụ 128MB')
+    group.add_argument('--cache-size', type=int, help='số đối tượng tối đa trong cache của mỗi connection')
+    group.add_argument('--cache-size-bytes', type=parse_size, help='số byte tối đa trong cache của mỗi connection')
+    group.add_argument('--cache-stats', action='store_true', default=None, help='in tỉ lệ trúng cache khi thoát')
+    group = parser.add_argument_group('nhật ký')
+    group.add_argument('--log-max-size', dest='log_max_bytes', type=parse_size,
+                       help='xoay file nhật ký khi vượt kích thước này, ví dụ 4MB')
+    group.add_argument('--log-max-age-hours', type=int, help='xoay file nhật ký sau số giờ này')
+    group.add_argument('--log-retention-days', type=int, help='xóa nhật ký đã xoay cũ hơn số ngày này')
+    group.add_argument('--log-max-segments', type=int, help='số đoạn nhật ký đã xoay giữ lại cho mỗi file')
+    group = parser.add_argument_group('phiên đăng nhập')
+    group.add_argument('--session-ttl-hours', type=int, help='thời hạn của một phiên đăng nhập')
+    group.add_argument('--session-cache-size', type=int, help='số phiên giữ trong bộ nhớ')
+    return parser
+
+def load_config(argv=None, description=None, parser=None):
+    """Đọc cấu hình từ client.ini (nếu có) rồi ghi đè bằng tham số dòng lệnh.
+
+    Script có tham số riêng thì truyền parser của nó vào: các tham số đó
+    được giữ nguyên trong kết quả cùng với cấu hình.
+    """
+    parser = add_arguments(parser or argparse.ArgumentParser(description=description))
+    args = parser.parse_args(argv)
+    settings = {name: value for name, value in vars(args).items() if name not in DEFAULTS}
+    settings.update(DEFAULTS)
+    _read_ini(args.config, settings)
+    for name in DEFAULTS:
+        value = getattr(args, name, None)
+        if value is not None:
+            settings[name] = value
+    return argparse.Namespace(**settings)
+
+def logging_options(config):
+    """Tham số cho utils.configure_logging từ cấu hình"""
+    return {
+        'max_bytes': config.log_max_bytes,
+        'max_age': config.log_max_age_hours * 3600,
+        'retention': config.log_retention_days * 86400,
+        'keep': config.log_max_segments,
+    }
+
+def open_storage(name, port, config, storage_class=ClientStorage.ClientStorage):
+    """Mở ClientStorage với cache ZEO theo cấu hình.
+
+    Cache bền vững nằm ở <cache_dir>/<cache_name>-<name>-1.zec. Nếu file cache
+    đang bị một tiến trình khác giữ thì dùng cache trong bộ nhớ.
+    """
+    address = (config.host, port)
+    if config.persistent_cache:
+        os.makedirs(config.cache_dir, exist_ok=True)
+        try:
+            return storage_class(address, client=f"{config.cache_name}-{name}",
+                                 var=config.cache_dir, cache_size=config.zeo_cache_size)
+        except LockError:
+            logging.getLogger(__name__).warning(
+                "Cache %s-%s đang được dùng, chuyển sang cache trong bộ nhớ", config.cache_name, name)
+    return storage_class(address, cache_size=config.zeo_cache_size)
+
+def open_db(storage, config, **options):
+    """Tạo ZODB.DB với giới hạn cache đối tượng theo cấu hình"""
+    db = ZODB.DB(storage, pool_size=config.pool_size, cache_size=config.cache_size,
+                 cache_size_bytes=config.cache_size_bytes, **options)
+    if config.cache_stats:
+        # Đếm số đối tượng phải tải từ storage (tức là trượt cache đối tượng)
+        db.setActivityMonitor(ActivityMonitor())
+    return db
+
+def cache_report(name, db):
+    """Các dòng mô tả tỉ lệ trúng cache của một database"""
+    lines = [f"📊 Cache {name}:"]
+    cache = getattr(db.storage, '_cache', None)
+    if cache is not None:
+        adds, added_bytes, evicts, evicted_bytes, hits = cache.getStats()
+        # accesses chỉ đếm lần đọc thấy trong cache; mỗi lần trượt thì bản ghi
+        # được tải từ server rồi thêm vào cache (adds)
+        total = hits + adds
+        rate = hits / total * 100 if total else 0.0
+        lines.append(f"   ZEO: {hits} lượt đọc từ cache, {adds} lượt tải từ server "
+                     f"({added_bytes} byte), {evicts} lượt loại bỏ, tỉ lệ trúng ~{rate:.1f}%")
+    monitor = db.getActivityMonitor()
+    if monitor is not None:
+        activity = monitor.getActivityAnalysis(divisions=1)[0]
+        lines.append(f"   ZODB: {activity['loads']} đối tượng tải từ storage, "
+                     f"{db.cacheSize()} đối tượng đang trong cache")
+    return lines
+
+def print_cache_report(databases):
+    for name, db in databases.items():
+        for line in cache_report(name, db):
+            print(line)
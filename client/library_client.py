@@ -0,0 +1,54 @@
+import threading
+
+from ZEO import ClientStorage
+
+from client_config import open_storage, open_db
+from runtime import ClientRuntime
+
+# Cổng ZEO server của từng database
+PORTS = {'accounts': 8000, 'books': 8001}
+
+
+class LibraryClient(ClientRuntime):
+    """Client dùng chung cho cả tiến trình, chỉ kết nối server khi cần.
+
+    Không mở kết nối nào lúc khởi tạo: database được mở ở lần đầu một thread
+    gọi root(name). Nhờ vậy client chỉ nói chuyện với server accounts để
+    đăng nhập, còn server books (và thread auto refresh) chỉ được mở sau khi
+    người dùng đã đăng nhập.
+
+    on_open(name, storage) được gọi ngay sau khi mở ClientStorage, trước khi
+    tạo ZODB.DB, ví dụ để gắn change feed.
+    """
+
+    def __init__(self, config, storage_classes=None, on_open=None):
+        super().__init__(pool_size=config.pool_size, multi_database=config.multi_database)
+        self.config = config
+        self.storage_classes = storage_classes or {}
+        self.on_open = on_open
+        self._open_lock = threading.Lock()
+        self._group = {}  # databases= dùng chung khi chạy multi-database
+
+    def is_open(self, name):
+        return name in self.databases
+
+    def database(self, name):
+        db = self.databases.get(name)
+        if db is None:
+            with self._open_lock:
+                db = self.databases.get(name)
+                if db is None:
+                    db = self._open(name)
+        return db
+
+    def _open(self, name):
+        storage_class = self.storage_classes.get(name, ClientStorage.ClientStorage)
+        storage = open_storage(name, PORTS[name], self.config, storage_class)
+        if self.on_open is not None:
+            self.on_open(name, storage)
+        options = {}
+        if self.multi_database:
+            options = {'databases': self._group, 'database_name': name}
+        db = open_db(storage, self.config, **options)
+        self.add_database(name, db)
+        return db
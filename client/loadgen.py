@@ -0,0 +1,322 @@
+"""Sinh tải cho các thao tác thư viện và đo hiệu năng.
+
+Mô phỏng N client (thread, hoặc tiến trình x thread) cùng gọi LibraryService
+trên ZEO server (cổng 8000/8001, hoặc server tạm trong tiến trình với
+--local), theo một tỉ lệ thao tác cấu hình được. Kết quả gồm throughput,
+độ trễ p50/p95/p99, tỉ lệ xung đột và số lần thử lại của từng thao tác, in
+ra bảng và ghi JSON để so sánh giữa các lần chạy.
+
+    cd client
+    python loadgen.py --local --clients 8 --duration 20
+    python loadgen.py --processes 4 --clients 4 --mix borrow=5,return=4,list=1 --json run.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import ZODB
+from ZEO.ClientStorage import ClientStorage
+
+import retry
+from models.user import User
+from runtime import ClientRuntime
+from service import LibraryService
+from storage import (catalog_page, ensure_accounts_catalog, ensure_book_index,
+                     ensure_books_catalog, ensure_pending_index)
+
+DEFAULT_MIX = 'register=1,login=2,borrow=4,return=3,request=2,approve=1,list=3'
+OPERATIONS = ('register', 'login', 'borrow', 'return', 'request', 'approve', 'list')
+
+# Thao tác của loadgen -> tên thao tác trong retry.metrics
+RETRY_NAMES = {
+    'register': 'register',
+    'login': 'login',
+    'borrow': 'borrow',
+    'return': 'return_book',
+    'request': 'request_borrow',
+    'approve': 'approve',
+}
+
+PASSWORD = 'loadgen'
+
+
+def parse_mix(text):
+    """'borrow=4,return=3' -> {'borrow': 4.0, 'return': 3.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Thao tác không hợp lệ: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentiles(samples, points=(50, 95, 99)):
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    return {f"p{p}": round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+            for p in points}
+
+
+class SimulatedClient:
+    """Một người dùng giả lập: chọn thao tác theo tỉ lệ và ghi lại độ trễ"""
+
+    def __init__(self, runtime, client_id, titles, mix, seed):
+        self.runtime = runtime
+        self.username = f"lg{client_id:04d}"
+        self.titles = titles
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.rng = random.Random(seed)
+        self.user = None
+        self.admin = User('admin', PASSWORD, role='admin')
+        self.registered = itertools.count()
+        self.samples = {name: [] for name in self.names}
+        self.errors = {name: 0 for name in self.names}
+        self.rejected = {name: 0 for name in self.names}
+
+    def service(self):
+        # Connection và transaction manager riêng của thread này
+        return LibraryService(self.runtime.root('books'), self.runtime.root('accounts'),
+                              transaction_manager=self.runtime.transaction_manager())
+
+    def run(self, deadline, max_ops=None):
+        service = self.service()
+        self.user = service.login(self.username, PASSWORD)
+        done = 0
+        while time.monotonic() < deadline and (max_ops is None or done < max_ops):
+            op = self.rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = getattr(self, f"op_{op}")(service)
+            except Exception:
+                self.errors[op] += 1
+                service.transaction_manager.abort()
+                ok = True
+            self.samples[op].append(time.perf_counter() - start)
+            if not ok:
+                self.rejected[op] += 1
+            done += 1
+        self.runtime.close_thread()
+
+    # Mỗi thao tác trả về True nếu được chấp nhận (False: bị từ chối hợp lệ,
+    # ví dụ sách đang được mượn)
+
+    def op_register(self, service):
+        user, _ = service.register(f"{self.username}-{next(self.registered)}", PASSWORD)
+        return user is not None
+
+    def op_login(self, service):
+        return service.login(self.username, PASSWORD) is not None
+
+    def op_borrow(self, service):
+        success, _ = service.borrow(self.rng.choice(self.titles), self.username, confirm=True)
+        return bool(success)
+
+    def op_return(self, service):
+        service.transaction_manager.begin()
+        borrowed = service.books_borrowed_by(self.username)
+        if not borrowed:
+            return False
+        success, _ = service.return_book(self.rng.choice(list(borrowed)), self.user)
+        return bool(success)
+
+    def op_request(self, service):
+        success, _ = service.request_borrow(self.rng.choice(self.titles), self.username, confirm=True)
+        return bool(success)
+
+    def op_approve(self, service):
+        service.transaction_manager.begin()
+        pending = service.pending_requests()
+        if not pending:
+            return False
+        title = self.rng.choice(list(pending))
+        username = pending[title][0][0]
+        success, _ = service.approve(title, username, self.admin)
+        return bool(success)
+
+    def op_list(self, service):
+        service.transaction_manager.begin()
+        items, _ = catalog_page(service.books_root['books'])
+        for _, book in items:
+            book.available  # noqa: B018 - nạp bản ghi như khi hiển thị danh sách
+        service.transaction_manager.abort()
+        return True
+
+
+def open_runtime(host, ports, pool_size):
+    databases = {name: ZODB.DB(ClientStorage((host, port))) for name, port in ports.items()}
+    return ClientRuntime(databases, pool_size=pool_size)
+
+def prepare(host, ports, n_books, n_clients):
+    """Tạo catalog, sách mẫu và tài khoản cho các client giả lập"""
+    runtime = open_runtime(host, ports, pool_size=1)
+    tm = runtime.transaction_manager()
+    books_root = runtime.root('books')
+    accounts_root = runtime.root('accounts')
+    ensure_books_catalog(books_root)
+    ensure_book_index(books_root)
+    ensure_pending_index(books_root)
+    ensure_accounts_catalog(accounts_root)
+    tm.commit()
+
+    service = LibraryService(books_root, accounts_root, transaction_manager=tm)
+    admin = User('admin', PASSWORD, role='admin')
+    titles = [f"Loadgen {i:05d}" for i in range(n_books)]
+    for i, title in enumerate(titles):
+        if title not in books_root['books']:
+            service.add_book(title, f"Tác giả {i % 20}", admin)
+    for client_id in range(n_clients):
+        if not service.user_exists(f"lg{client_id:04d}"):
+            service.register(f"lg{client_id:04d}", PASSWORD)
+    runtime.close()
+    return titles
+
+def run_process(host, ports, first_id, n_threads, titles, mix, duration, max_ops, seed, results):
+    """Chạy n_threads client trong tiến trình hiện tại và gửi kết quả về results"""
+    retry.metrics.reset()
+    runtime = open_runtime(host, ports, pool_size=n_threads)
+    clients = [SimulatedClient(runtime, first_id + i, titles, mix, seed + first_id + i)
+               for i in range(n_threads)]
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=c.run, args=(deadline, max_ops)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    runtime.close()
+    results.put({
+        'samples': {op: [s for c in clients for s in c.samples[op]] for op in mix},
+        'errors': {op: sum(c.errors[op] for c in clients) for op in mix},
+        'rejected': {op: sum(c.rejected[op] for c in clients) for op in mix},
+        'retry': retry.metrics.snapshot(),
+    })
+
+def summarize(parts, mix, elapsed):
+    report = {}
+    for op in mix:
+        samples = [s for part in parts for s in part['samples'][op]]
+        retry_name = RETRY_NAMES.get(op)
+        attempts = conflicts = calls = failures = 0
+        for part in parts:
+            stats = part['retry'].get(retry_name)
+            if stats:
+                calls += stats['calls']
+                attempts += stats['attempts']
+                conflicts += stats['conflicts']
+                failures += stats['failures']
+        report[op] = {
+            'count': len(samples),
+            'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+            'errors': sum(part['errors'][op] for part in parts),
+            'rejected': sum(part['rejected'][op] for part in parts),
+            'latency_ms': percentiles(samples),
+            'conflicts': conflicts,
+            'retries': attempts - calls,
+            'conflict_rate': round(conflicts / attempts, 4) if attempts else 0.0,
+            'retry_exhausted': failures,  # hết lượt thử lại, tính vào errors
+        }
+    total = sum(r['count'] for r in report.values())
+    return {
+        'total_ops': total,
+        'throughput': round(total / elapsed, 2) if elapsed else None,
+        'operations': report,
+    }
+
+def print_report(summary):
+    print(f"\n{'thao tác':<10} {'số lượt':>8} {'ops/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'xung đột':>9} {'thử lại':>8} {'lỗi':>5}")
+    for op, r in summary['operations'].items():
+        lat = r['latency_ms']
+        print(f"{op:<10} {r['count']:>8} {r['throughput']:>8} {lat['p50'] or '-':>8} {lat['p95'] or '-':>8} "
+              f"{lat['p99'] or '-':>8} {r['conflict_rate']:>9.2%} {r['retries']:>8} {r['errors']:>5}")
+    print(f"Tổng: {summary['total_ops']} thao tác, {summary['throughput']} ops/s (độ trễ tính bằng ms)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh tải cho các thao tác thư viện")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--local', action='store_true',
+                        help='chạy ZEO server tạm (MappingStorage) trong tiến trình này')
+    parser.add_argument('--clients', type=int, default=4, help='số client (thread) mỗi tiến trình')
+    parser.add_argument('--processes', type=int, default=1, help='số tiến trình')
+    parser.add_argument('--duration', type=float, default=10, help='thời gian chạy (giây)')
+    parser.add_argument('--max-ops', type=int, help='số thao tác tối đa mỗi client')
+    parser.add_argument('--books', type=int, default=50)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"tỉ lệ thao tác (mặc định {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.json) if args.json else None
+    # Service ghi log vào logs/<user>.jsonl: chạy trong thư mục tạm để không
+    # trộn log của người dùng giả lập với log thật
+    workdir = tempfile.mkdtemp(prefix='loadgen_')
+    os.makedirs(os.path.join(workdir, 'logs'))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    stops = []
+    ports = {'accounts': 8000, 'books': 8001}
+    try:
+        if args.local:
+            import ZEO
+            for name in ports:
+                address, stop = ZEO.server()
+                ports[name] = address[1]
+                stops.append(stop)
+
+        total_clients = args.clients * args.processes
+        titles = prepare(args.host, ports, args.books, total_clients)
+
+        results = multiprocessing.Queue()
+        start = time.monotonic()
+        if args.processes == 1:
+            run_process(args.host, ports, 0, args.clients, titles, args.mix,
+                        args.duration, args.max_ops, args.seed, results)
+            parts = [results.get()]
+        else:
+            processes = [multiprocessing.Process(
+                target=run_process,
+                args=(args.host, ports, i * args.clients, args.clients, titles, args.mix,
+                      args.duration, args.max_ops, args.seed, results))
+                for i in range(args.processes)]
+            for p in processes:
+                p.start()
+            # Lấy kết quả trước khi join để tiến trình con không bị chặn khi ghi queue
+            parts = [results.get() for _ in processes]
+            for p in processes:
+                p.join()
+        elapsed = time.monotonic() - start
+    finally:
+        for stop in stops:
+            stop()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(parts, args.mix, elapsed)
+    summary['config'] = {
+        'clients': args.clients,
+        'processes': args.processes,
+        'duration': args.duration,
+        'books': args.books,
+        'mix': args.mix,
+        'local': args.local,
+    }
+    summary['elapsed'] = round(elapsed, 3)
+    print_report(summary)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
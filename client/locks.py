@@ -0,0 +1,114 @@
+"""Khóa theo lease (tùy chọn) cho các thao tác trên sách.
+
+Mặc định không dùng khóa nào: ZODB dùng optimistic concurrency, hai client
+cùng ghi một quyển sách thì một bên nhận ConflictError và được
+@retry_on_conflict thử lại với dữ liệu mới, nên chỉ một người mượn được.
+Đọc thuần túy không bao giờ ghi gì vào storage.
+
+Khi cần loại trừ thật sự giữa các client (ví dụ giữ sách trong lúc xử lý
+lâu), bật một lock service. LibraryService lấy lease trước khi bắt đầu
+transaction và chỉ trả sau commit/abort, nên lease bao trọn thay đổi:
+
+    set_lock_service(ZODBLeaseLockService(books_db))   # lease dùng chung qua ZEO
+    set_lock_service(LocalLeaseLockService())          # trong một tiến trình (test)
+"""
+import threading
+import time
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from ZODB.POSException import ConflictError
+
+DEFAULT_TTL = 30  # giây
+
+_lock_service = None
+
+def set_lock_service(service):
+    """Bật (hoặc tắt với None) lock service cho các thao tác sách của LibraryService"""
+    global _lock_service
+    _lock_service = service
+
+def get_lock_service():
+    return _lock_service
+
+
+class LocalLeaseLockService:
+    """Lease trong bộ nhớ của tiến trình, dùng cho test và client đơn lẻ"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._leases = {}  # key -> (holder, expires)
+
+    def acquire(self, key, holder, ttl=None):
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] != holder and lease[1] > now:
+                return False
+            self._leases[key] = (holder, now + (ttl or self.ttl))
+            return True
+
+    def release(self, key, holder):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] == holder:
+                del self._leases[key]
+
+
+class ZODBLeaseLockService:
+    """Lease lưu trong một OOBTree riêng của database, dùng chung giữa các client qua ZEO.
+
+    Lease được ghi bằng connection và transaction riêng nên không làm bẩn
+    record Book và không dính vào transaction của thao tác đang chạy. Hai
+    client giành cùng một key sẽ xung đột trên cùng bucket và chỉ một bên
+    commit được.
+    """
+
+    def __init__(self, db, ttl=DEFAULT_TTL, root_key='leases'):
+        self.ttl = ttl
+        self.root_key = root_key
+        self._lock = threading.Lock()  # connection không an toàn khi dùng từ nhiều thread
+        self._tm = transaction.TransactionManager()
+        self._connection = db.open(transaction_manager=self._tm)
+
+    def _leases(self):
+        root = self._connection.root()
+        if self.root_key not in root:
+            root[self.root_key] = OOBTree()
+        return root[self.root_key]
+
+    def acquire(self, key, holder, ttl=None):
+        now = time.time()
+        with self._lock:
+            try:
+                self._tm.begin()
+                leases = self._leases()
+                lease = leases.get(key)
+                if lease and lease[0] != holder and lease[1] > now:
+                    self._tm.abort()
+                    return False
+                leases[key] = (holder, now + (ttl or self.ttl))
+                self._tm.commit()
+                return True
+            except ConflictError:
+                self._tm.abort()
+                return False
+
+    def release(self, key, holder):
+        with self._lock:
+            try:
+                self._tm.begin()
+                leases = self._leases()
+                lease = leases.get(key)
+                if lease and lease[0] == holder:
+                    del leases[key]
+                    self._tm.commit()
+                else:
+                    self._tm.abort()
+            except ConflictError:
+                # Lease sẽ tự hết hạn sau ttl
+                self._tm.abort()
+
+    def close(self):
+        self._connection.close()
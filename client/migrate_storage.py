@@ -0,0 +1,202 @@
+"""Chuyển catalog PersistentMapping cũ sang OOBTree khi hệ thống vẫn đang chạy.
+
+Với books.fs, công cụ cũng ghi lại mọi Book còn ở định dạng cũ (ngày dạng
+chuỗi, thuộc tính mặc định lưu đầy đủ) sang định dạng gọn hiện tại.
+
+Công cụ kết nối qua ZEO như một client bình thường nên không cần dừng server
+hay các client khác:
+
+    python migrate_storage.py            # chuyển cả books.fs và accounts.fs
+    python migrate_storage.py --books    # chỉ chuyển books.fs
+"""
+import argparse
+import time
+
+from ZEO import ClientStorage
+import ZODB
+import transaction
+from BTrees.OOBTree import OOBTree
+from ZODB.POSException import ConflictError
+
+from models.book_index import get_book_index, get_pending_index
+from retry import retry_on_conflict
+from storage import (BOOKS_KEY, USERS_KEY, REPORT_CHUNK_SIZE, is_btree_catalog, iter_catalog,
+                     ensure_book_index, ensure_pending_index, ensure_search_index, rebuild_pending_index)
+
+MAX_SWAP_ATTEMPTS = 10
+MAX_UPGRADE_PASSES = 10
+
+def apply_delta(old, tree):
+    """Đồng bộ các thay đổi xảy ra trên mapping cũ trong lúc đang chép"""
+    changed = 0
+    for key in [k for k in tree.keys() if k not in old]:
+        del tree[key]
+        changed += 1
+    for key, value in old.items():
+        if tree.get(key) is not value:
+            tree[key] = value
+            changed += 1
+    return changed
+
+def migrate_catalog(connection, key):
+    """Chuyển root[key] sang OOBTree, trả về số phần tử đã chuyển"""
+    root = connection.root()
+    transaction.begin()
+    if key not in root:
+        print(f"⚠️ Không có '{key}' trong storage, bỏ qua.")
+        return 0
+    if is_btree_catalog(root[key]):
+        print(f"✅ '{key}' đã dùng OOBTree.")
+        return 0
+
+    # Chỉ chép tham chiếu tới các đối tượng Book/User, không tạo bản sao
+    tree = OOBTree()
+    tree.update(dict(root[key].items()))
+    copied = len(tree)
+    print(f"📦 Đã chép {copied} phần tử của '{key}'.")
+
+    for attempt in range(MAX_SWAP_ATTEMPTS):
+        try:
+            old = root[key]
+            delta = apply_delta(old, tree)
+            root[key] = tree
+            # Làm rỗng mapping cũ để client nào còn ghi vào nó sẽ bị
+            # ConflictError và đọc lại root, thay vì ghi vào catalog đã bỏ
+            old.clear()
+            transaction.get().note(f"migrate {key} to OOBTree")
+            transaction.commit()
+            print(f"✅ Đã chuyển '{key}' sang OOBTree ({delta} thay đổi trong lúc chép).")
+            return copied + delta
+        except ConflictError:
+            transaction.abort()
+            print(f"⚠️ Xung đột khi chuyển '{key}', thử lại ({attempt + 1}/{MAX_SWAP_ATTEMPTS})...")
+            time.sleep(0.1 * (attempt + 1))
+    raise RuntimeError(f"Không thể chuyển '{key}' sau {MAX_SWAP_ATTEMPTS} lần thử")
+
+def _upgrade_pass(connection, chunk_size):
+    """Đánh dấu ghi lại các sách nạp từ bản ghi cũ, commit sau mỗi đoạn.
+
+    Trả về (số sách đã ghi lại, có đoạn nào bị xung đột không).
+    """
+    root = connection.root()
+    transaction.begin()
+    written = 0
+    conflicted = False
+    pending = 0
+    for _, book in iter_catalog(root[BOOKS_KEY], connection, chunk_size, (lambda book: book.queue,)):
+        if book.needs_upgrade():
+            book._p_changed = True
+            book.queue._changed()
+            # Bỏ cờ để lượt sau không ghi lại sách đã commit còn trong cache;
+            # khi abort, sách bị mất hiệu lực và được nạp lại từ bản ghi cũ
+            book.__dict__.pop('_v_upgraded', None)
+            book.queue.__dict__.pop('_v_upgraded', None)
+            pending += 1
+        if pending >= chunk_size:
+            written, conflicted = _commit_upgrade(pending, written, conflicted)
+            pending = 0
+    if pending:
+        written, conflicted = _commit_upgrade(pending, written, conflicted)
+    return written, conflicted
+
+def _commit_upgrade(pending, written, conflicted):
+    try:
+        transaction.get().note("upgrade Book state format")
+        transaction.commit()
+        return written + pending, conflicted
+    except ConflictError:
+        # Các sách của đoạn này được đọc lại và ghi ở lượt sau
+        transaction.abort()
+        return written, True
+
+def upgrade_books(connection, chunk_size=REPORT_CHUNK_SIZE):
+    """Ghi lại các Book ở định dạng cũ theo định dạng hiện tại, trả về số sách đã ghi"""
+    total = 0
+    for attempt in range(MAX_UPGRADE_PASSES):
+        written, conflicted = _upgrade_pass(connection, chunk_size)
+        total += written
+        if not conflicted:
+            print(f"✅ Đã ghi lại {total} sách theo định dạng mới.")
+            return total
+        print(f"⚠️ Có xung đột, chạy lại lượt nâng cấp ({attempt + 1}/{MAX_UPGRADE_PASSES})...")
+    raise RuntimeError(f"Không thể nâng cấp sách sau {MAX_UPGRADE_PASSES} lượt")
+
+@retry_on_conflict(name='build_indexes')
+def build_indexes(root):
+    """Xây các chỉ mục sách còn thiếu.
+
+    Làm ở đây để client đầu tiên sau khi chuyển đổi không phải quét cả
+    catalog; thử lại (và kiểm tra lại) nếu một client vừa xây cùng lúc.
+    """
+    transaction.begin()
+    if ensure_book_index(root) | ensure_pending_index(root) | ensure_search_index(root):
+        transaction.get().note("build book indexes")
+        transaction.commit()
+        print("✅ Đã xây các chỉ mục phụ cho sách.")
+        return True
+    transaction.abort()
+    return False
+
+@retry_on_conflict(name='upgrade_book_index')
+def upgrade_book_index(root):
+    """Ghi lại các mục chỉ mục có người mượn None (BTrees không so sánh được None với chuỗi khi giải quyết xung đột)"""
+    transaction.begin()
+    index = get_book_index(root)
+    changed = index.upgrade_entries() if index is not None else 0
+    if not changed:
+        transaction.abort()
+        return 0
+    transaction.get().note("rewrite book index entries without None")
+    transaction.commit()
+    print(f"✅ Đã ghi lại {changed} mục chỉ mục sách.")
+    return changed
+
+@retry_on_conflict(name='upgrade_pending_index')
+def upgrade_pending_index(root):
+    """Xây lại chỉ mục yêu cầu mượn một lần nếu còn thời gian dạng chuỗi cũ.
+
+    Chỉ làm ở đây: client chỉ tạo chỉ mục khi chưa có, không tự chuyển đổi.
+    """
+    transaction.begin()
+    index = get_pending_index(root)
+    if index is None or not index.has_legacy_times():
+        transaction.abort()
+        return False
+    rebuild_pending_index(root)
+    transaction.get().note("rebuild pending-request index with epoch times")
+    transaction.commit()
+    print("✅ Đã xây lại chỉ mục yêu cầu mượn theo thời gian dạng số.")
+    return True
+
+def migrate(address, key):
+    storage = ClientStorage.ClientStorage(address)
+    db = ZODB.DB(storage)
+    connection = db.open()
+    try:
+        count = migrate_catalog(connection, key)
+        root = connection.root()
+        if key == BOOKS_KEY and key in root:
+            upgrade_books(connection)
+            build_indexes(root)
+            upgrade_book_index(root)
+            upgrade_pending_index(root)
+        return count
+    finally:
+        connection.close()
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển catalog sang OOBTree")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--books', action='store_true', help="chỉ chuyển books.fs")
+    parser.add_argument('--accounts', action='store_true', help="chỉ chuyển accounts.fs")
+    args = parser.parse_args()
+
+    both = not args.books and not args.accounts
+    if args.books or both:
+        migrate((args.host, 8001), BOOKS_KEY)
+    if args.accounts or both:
+        migrate((args.host, 8000), USERS_KEY)
+
+if __name__ == '__main__':
+    main()
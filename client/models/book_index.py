@@ -0,0 +1,145 @@
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree, OOTreeSet
+
+INDEX_KEY = 'book_index'
+PENDING_KEY = 'pending_requests'
+
+class BookIndex(Persistent):
+    """Secondary indexes over the book catalog, kept in the same transaction as the books"""
+
+    def __init__(self):
+        self.by_borrower = OOBTree()  # borrower -> OOTreeSet(title)
+        self.by_author = OOBTree()  # author -> OOTreeSet(title)
+        self.available = OOTreeSet()  # titles that can be borrowed now
+        # title -> (author, borrower or '', available) as indexed. Bucket
+        # conflict resolution orders the values, so they never hold None
+        self.entries = OOBTree()
+
+    def _add(self, tree, key, title):
+        titles = tree.get(key)
+        if titles is None:
+            titles = tree[key] = OOTreeSet()
+        titles.insert(title)
+
+    def _remove(self, tree, key, title, keep_empty=False):
+        titles = tree.get(key)
+        if titles is not None:
+            titles.remove(title)
+            if not titles and not keep_empty:
+                del tree[key]
+
+    def _unindex(self, title, entry):
+        author, borrower, available = entry
+        self._remove(self.by_author, author, title)
+        if borrower:
+            # A borrower's set stays when emptied: BTrees cannot merge the
+            # removal of a bucket's first key with a concurrent change to
+            # that bucket, so every last return would conflict
+            self._remove(self.by_borrower, borrower, title, keep_empty=True)
+        if available:
+            self.available.remove(title)
+
+    def index_book(self, book):
+        """Add or refresh the index entries of a book"""
+        title = book.title
+        entry = (book.author, book.borrower or '', book.available)
+        old_entry = self.entries.get(title)
+        if old_entry == entry:
+            return
+        if old_entry is not None:
+            self._unindex(title, old_entry)
+        author, borrower, available = entry
+        self._add(self.by_author, author, title)
+        if borrower:
+            self._add(self.by_borrower, borrower, title)
+        if available:
+            self.available.insert(title)
+        self.entries[title] = entry
+
+    def unindex_book(self, title):
+        """Remove a deleted book from every index"""
+        old_entry = self.entries.get(title)
+        if old_entry is not None:
+            self._unindex(title, old_entry)
+            del self.entries[title]
+
+    def upgrade_entries(self):
+        """Rewrite entries indexed with a None borrower, return how many changed"""
+        legacy = [(title, entry) for title, entry in self.entries.items() if entry[1] is None]
+        for title, (author, _, available) in legacy:
+            self.entries[title] = (author, '', available)
+        return len(legacy)
+
+    def titles_borrowed_by(self, username):
+        return list(self.by_borrower.get(username, ()))
+
+    def titles_by_author(self, author):
+        return list(self.by_author.get(author, ()))
+
+    def available_titles(self):
+        return list(self.available)
+
+class PendingRequestIndex(Persistent):
+    """All pending borrow requests of the catalog, ordered by request time"""
+
+    def __init__(self):
+        self.by_time = OOTreeSet()  # (request_time, title, username)
+        self.by_request = OOBTree()  # (title, username) -> request_time
+
+    def add(self, title, username, request_time):
+        key = (title, username)
+        if key in self.by_request:
+            return
+        self.by_request[key] = request_time
+        self.by_time.insert((request_time, title, username))
+
+    def remove(self, title, username):
+        request_time = self.by_request.get((title, username))
+        if request_time is None:
+            return
+        del self.by_request[(title, username)]
+        self.by_time.remove((request_time, title, username))
+
+    def has_legacy_times(self):
+        """Whether entries still use formatted-string request times (before epoch seconds)"""
+        return bool(self.by_time) and isinstance(self.by_time.minKey()[0], str)
+
+    def requests(self):
+        """(title, username, request_time) of every pending request, oldest first"""
+        return [(title, username, request_time)
+                for request_time, title, username in self.by_time]
+
+def get_book_index(root):
+    """Get the index stored in the books root, or None if it was never built"""
+    return root.get(INDEX_KEY)
+
+def reindex_book(book):
+    """Refresh the index entries of a book that is already stored in ZODB"""
+    jar = book._p_jar
+    if jar is None:
+        return
+    index = get_book_index(jar.root())
+    if index is not None:
+        index.index_book(book)
+
+def get_pending_index(root):
+    """Get the pending-request index stored in the books root, or None"""
+    return root.get(PENDING_KEY)
+
+def _pending_index_of(book):
+    jar = book._p_jar
+    if jar is None:
+        return None
+    return get_pending_index(jar.root())
+
+def index_request(book, username, request_time):
+    """Record a new pending request of a stored book"""
+    index = _pending_index_of(book)
+    if index is not None:
+        index.add(book.title, username, request_time)
+
+def unindex_request(book, username):
+    """Forget a pending request that was approved or rejected"""
+    index = _pending_index_of(book)
+    if index is not None:
+        index.remove(book.title, username)
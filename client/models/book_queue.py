@@ -1,45 +1,226 @@
 from persistent import Persistent
-from persistent.list import PersistentList
-from datetime import datetime
+from ZODB.POSException import ConflictError
+from BTrees.LLBTree import LLBTree
+from BTrees.LOBTree import LOBTree
+from BTrees.OLBTree import OLBTree
+import time
+from .conflict import merge_states
+from .timestamps import format_timestamp, parse_timestamp
+
+# Enqueues waiting in the inbox before they are folded into the BTrees
+INBOX_LIMIT = 32
+
+# Version 2 stores timestamps as epoch seconds instead of formatted strings
+QUEUE_VERSION = 2
 
 class BookQueue(Persistent):
+    """Waiting list of a book.
+
+    Entries are keyed by increasing sequence numbers and indexed by
+    username, so enqueue, dequeue, membership and position are BTree
+    lookups instead of scans of the whole list. A position is the distance
+    from the head minus the seqs removed from the middle in between (rare:
+    only the head borrows); those are counted by a Fenwick tree stored in
+    an LLBTree, so a removal and a position both cost O(log n) lookups and
+    no entry is ever renumbered.
+
+    New users first go to a short inbox stored in this record. Concurrent
+    enqueues from different clients only touch the inbox, which
+    _p_resolveConflict merges by timestamp, so they commit without retries.
+    The inbox is folded into the BTrees by the next dequeue.
+    """
+
+    _inbox = ()  # (username, timestamp) not yet folded, oldest first
+    _version = 1  # queues stored before the version was recorded
+    _removed = None  # Fenwick tree of seqs removed from the middle: index (seq + 1) -> count
+    _capacity = 0  # size of _removed, a power of two covering every seq handed out
+
     def __init__(self):
-        self.waiting_list = PersistentList()  # List of (username, timestamp)
-        
+        self._entries = LOBTree()  # seq -> (username, epoch seconds)
+        self._members = OLBTree()  # username -> seq
+        self._next_seq = 0
+        self._version = QUEUE_VERSION
+
+    def __setstate__(self, state):
+        """Upgrade older queue formats.
+
+        Queues stored as a PersistentList of (username, timestamp), queues
+        whose seqs have gaps recorded in _skipped and queues holding
+        formatted timestamps are rebuilt with contiguous seqs and epoch
+        seconds.
+        """
+        waiting_list = state.pop('waiting_list', None)
+        skipped = state.pop('_skipped', None)
+        legacy_times = state.get('_version', 1) < QUEUE_VERSION
+        if waiting_list is None and (skipped or legacy_times) and '_entries' in state:
+            waiting_list = list(state['_entries'].values())
+        super().__setstate__(state)
+        if legacy_times:
+            self._inbox = tuple((username, parse_timestamp(timestamp))
+                                for username, timestamp in self._inbox)
+        if waiting_list is not None:
+            self.__init__()
+            for username, timestamp in waiting_list:
+                self._append(username, parse_timestamp(timestamp))
+            self._v_upgraded = True
+        elif skipped is not None or legacy_times:
+            # Nothing to rebuild: only the attributes have to be rewritten
+            self._version = QUEUE_VERSION
+            self._v_upgraded = True
+
+    def _changed(self):
+        # The upgraded BTrees only reach the database if this record is saved
+        if getattr(self, '_v_upgraded', False):
+            self._p_changed = True
+
+    def _append(self, username, timestamp):
+        seq = self._next_seq
+        self._next_seq = seq + 1
+        if self._removed is not None:
+            self._grow()
+        self._entries[seq] = (username, timestamp)
+        self._members[username] = seq
+        return seq
+
+    def _fold(self):
+        """Move inbox entries into the BTrees"""
+        if self._inbox:
+            for username, timestamp in self._inbox:
+                self._append(username, timestamp)
+            self._inbox = ()
+
+    def _p_resolveConflict(self, old, committed, new):
+        if 'waiting_list' in old or old.get('_version', 1) < QUEUE_VERSION:
+            raise ConflictError("Queue has not been upgraded yet")
+        return merge_states(old, committed, new, timelines=('_inbox',))
+
+    def _tree_len(self):
+        if not self._entries:
+            return 0
+        return self._rank(self._entries.maxKey())
+
+    def _rank(self, seq):
+        """1-based position of seq: distance from the head minus the gaps in between"""
+        head = self._entries.minKey()
+        rank = seq - head + 1
+        if self._removed is not None:
+            rank -= self._removed_before(seq) - self._removed_before(head)
+        return rank
+
+    def _removed_before(self, seq):
+        """Number of seqs below seq removed from the middle"""
+        count = 0
+        i = seq
+        while i > 0:
+            count += self._removed.get(i, 0)
+            i -= i & -i
+        return count
+
+    def _mark_removed(self, seq):
+        """Record a gap left by removing seq from the middle"""
+        if self._removed is None:
+            self._removed = LLBTree()
+            self._capacity = 1
+            self._grow()
+        i = seq + 1
+        while i <= self._capacity:
+            self._removed[i] = self._removed.get(i, 0) + 1
+            i += i & -i
+
+    def _grow(self):
+        """Double the Fenwick tree until it covers every seq handed out.
+
+        The only new node holding a count is the last one: it covers
+        everything, i.e. the total stored at the old last node.
+        """
+        while self._capacity < self._next_seq:
+            total = self._removed.get(self._capacity, 0)
+            self._capacity *= 2
+            if total:
+                self._removed[self._capacity] = total
+
+    def _inbox_index(self, username):
+        for i, (user, _) in enumerate(self._inbox):
+            if user == username:
+                return i
+        return None
+
+    @property
+    def waiting_list(self):
+        """List of (username, timestamp) in queue order"""
+        return list(self._entries.values()) + list(self._inbox)
+
+    def __len__(self):
+        return self._tree_len() + len(self._inbox)
+
+    def __contains__(self, username):
+        return username in self._members or self._inbox_index(username) is not None
+
+    def first(self):
+        """Username at the head of the queue, or None"""
+        if self._entries:
+            return self._entries[self._entries.minKey()][0]
+        if self._inbox:
+            return self._inbox[0][0]
+        return None
+
+    def enqueue(self, username):
+        """Append a user and return their position, or None if already queued"""
+        if username in self:
+            return None
+        self._changed()
+        # Only this record is written, so concurrent enqueues can be merged
+        self._inbox += ((username, int(time.time())),)
+        if len(self._inbox) >= INBOX_LIMIT:
+            self._fold()
+        return len(self)
+
     def add_to_queue(self, username):
         """Add a user to the waiting list"""
-        if not any(user == username for user, _ in self.waiting_list):
-            self.waiting_list.append((username, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            self._p_changed = True
-            return True, f"Bạn đã được thêm vào hàng đợi. Vị trí: {len(self.waiting_list)}"
-        return False, "Bạn đã có trong hàng đợi rồi!"
-    
+        position = self.enqueue(username)
+        if position is None:
+            return False, "Bạn đã có trong hàng đợi rồi!"
+        return True, f"Bạn đã được thêm vào hàng đợi. Vị trí: {position}"
+
     def remove_from_queue(self, username):
         """Remove a user from the waiting list"""
-        for i, (user, _) in enumerate(self.waiting_list):
-            if user == username:
-                del self.waiting_list[i]
-                self._p_changed = True
-                return True
-        return False
-    
+        if username not in self:
+            return False
+        self._changed()
+        self._fold()
+        seq = self._members[username]
+        head = self._entries.minKey()
+        del self._members[username]
+        del self._entries[seq]
+        if not self._entries:
+            if self._removed is not None:
+                # Gaps only matter between queued entries
+                del self._removed, self._capacity
+        elif seq != head:
+            self._mark_removed(seq)
+        return True
+
     def is_next_in_line(self, username):
         """Check if the user is next in line to borrow the book"""
-        return len(self.waiting_list) > 0 and self.waiting_list[0][0] == username
-    
+        return self.first() == username
+
     def get_queue_position(self, username):
         """Get user's position in queue"""
-        for i, (user, timestamp) in enumerate(self.waiting_list):
-            if user == username:
-                return i + 1, timestamp
-        return None, None
-    
+        seq = self._members.get(username)
+        if seq is not None:
+            return self._rank(seq), self._entries[seq][1]
+        i = self._inbox_index(username)
+        if i is None:
+            return None, None
+        return self._tree_len() + i + 1, self._inbox[i][1]
+
     def get_queue_info(self):
         """Get formatted queue information"""
-        if not self.waiting_list:
+        waiting_list = self.waiting_list
+        if not waiting_list:
             return "Không có người đợi"
-        
+
         info = []
-        for i, (user, timestamp) in enumerate(self.waiting_list, 1):
-            info.append(f"{i}. {user} (từ {timestamp})")
-        return "\n   ".join(info) 
\ No newline at end of file
+        for i, (user, timestamp) in enumerate(waiting_list, 1):
+            info.append(f"{i}. {user} (từ {format_timestamp(timestamp)})")
+        return "\n   ".join(info)
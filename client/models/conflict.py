@@ -0,0 +1,50 @@
+from ZODB.POSException import ConflictError
+
+_MISSING = object()
+
+def merge_timeline(old, committed, new):
+    """Three-way merge of (username, timestamp) lists.
+
+    Entries removed on either side stay removed, entries added on both sides
+    are kept, and the result is ordered by (timestamp, username) so every
+    client resolving the same conflict gets the same list. A user appears at
+    most once, with their earliest entry.
+    """
+    old_set = set(old)
+    kept = [entry for entry in old if entry in committed and entry in new]
+    added = [entry for entry in list(committed) + list(new) if entry not in old_set]
+    merged = []
+    seen = set()
+    for entry in sorted(set(kept + added), key=lambda e: (e[1], e[0])):
+        if entry[0] not in seen:
+            seen.add(entry[0])
+            merged.append(entry)
+    return merged
+
+def merge_states(old, committed, new, timelines=()):
+    """Three-way merge of persistent state dicts.
+
+    An attribute changed on only one side takes that side's value; an
+    attribute listed in timelines is merged with merge_timeline. Any other
+    attribute changed differently on both sides is a real conflict. A
+    missing attribute counts as a value, so one removed on one side stays
+    removed.
+    """
+    resolved = {}
+    for name in set(old) | set(committed) | set(new):
+        old_value = old.get(name, _MISSING)
+        committed_value = committed.get(name, _MISSING)
+        new_value = new.get(name, _MISSING)
+        if committed_value == new_value or new_value == old_value:
+            value = committed_value
+        elif committed_value == old_value:
+            value = new_value
+        elif name in timelines:
+            sides = [() if side is _MISSING else side for side in (old_value, committed_value, new_value)]
+            kind = type(committed_value if committed_value is not _MISSING else new_value)
+            value = kind(merge_timeline(*sides))
+        else:
+            raise ConflictError(f"Conflicting changes to {name}")
+        if value is not _MISSING:
+            resolved[name] = value
+    return resolved
@@ -0,0 +1,150 @@
+import heapq
+import re
+import unicodedata
+from itertools import islice
+
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree
+
+SEARCH_KEY = 'search_index'
+
+# Weight of a token found in the title / in the author name
+TITLE_WEIGHT = 2
+AUTHOR_WEIGHT = 1
+# Longest run of index terms a single query prefix may expand to; a shorter
+# prefix matching more terms only considers the first ones in term order
+# and the results are flagged as truncated
+MAX_PREFIX_TERMS = 500
+
+_TOKEN = re.compile(r'\w+')
+
+def normalize(text):
+    """Lowercase and strip Vietnamese diacritics ('Đắc Nhân Tâm' -> 'dac nhan tam')"""
+    text = unicodedata.normalize('NFD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.replace('đ', 'd').replace('Đ', 'D').lower()
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+class SearchResults(list):
+    """Titles found by a search, best first.
+
+    truncated is True when a query prefix matched more than
+    MAX_PREFIX_TERMS index terms and only the first ones were considered,
+    so titles matching only the others are missing.
+    """
+
+    def __init__(self, titles=(), truncated=False):
+        super().__init__(titles)
+        self.truncated = truncated
+
+class SearchIndex(Persistent):
+    """Inverted index of normalized title/author tokens.
+
+    postings maps token -> OOBTree(title -> weight), so a query only loads
+    the postings of its own tokens, never the Book objects. Concurrent adds
+    of different titles touch different keys and resolve without conflicts.
+    """
+
+    def __init__(self):
+        self.postings = OOBTree()  # token -> OOBTree(title -> weight)
+        self.entries = OOBTree()  # title -> tokens indexed for it
+
+    def index_book(self, book):
+        """Add a book (title and author never change after creation)"""
+        title = book.title
+        if title in self.entries:
+            return
+        weights = {}
+        for token in tokenize(title):
+            weights[token] = weights.get(token, 0) | TITLE_WEIGHT
+        for token in tokenize(book.author):
+            weights[token] = weights.get(token, 0) | AUTHOR_WEIGHT
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = OOBTree()
+            posting[title] = weight
+        self.entries[title] = tuple(weights)
+
+    def unindex_book(self, title):
+        tokens = self.entries.get(title)
+        if tokens is None:
+            return
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is not None and title in posting:
+                del posting[title]
+                if not posting:
+                    del self.postings[token]
+        del self.entries[title]
+
+    def _expand(self, token, prefix):
+        """Index terms matching a query token: ([(term, exact?)], truncated?)"""
+        if not prefix:
+            return [(token, True)] if token in self.postings else [], False
+        terms = []
+        # One term past the cap tells whether the prefix matched more
+        for term in islice(self.postings.keys(min=token), MAX_PREFIX_TERMS + 1):
+            if not term.startswith(token):
+                break
+            terms.append((term, term == token))
+        if len(terms) > MAX_PREFIX_TERMS:
+            return terms[:MAX_PREFIX_TERMS], True
+        return terms, False
+
+    def search(self, query, limit=10, prefix=True):
+        """Titles matching every query token, best first, as SearchResults.
+
+        Each query token matches index terms equal to it or (with prefix)
+        starting with it, up to MAX_PREFIX_TERMS terms per token (see
+        SearchResults.truncated). A title scores its field weight per token,
+        doubled for an exact term, plus a bonus when the whole query starts
+        the title.
+        """
+        tokens = tokenize(query)
+        if not tokens or limit <= 0:
+            return SearchResults()
+        scores = None
+        expanded = [self._expand(token, prefix) for token in tokens]
+        truncated = any(cut for _, cut in expanded)
+        # Tokens with the fewest expansions first so the candidates shrink early
+        expansions = sorted((terms for terms, _ in expanded), key=len)
+        for terms in expansions:
+            matched = {}
+            for term, exact in terms:
+                posting = self.postings[term]
+                if scores is not None and len(scores) <= MAX_PREFIX_TERMS:
+                    # Few candidates left: probe them instead of walking the posting
+                    hits = ((title, posting.get(title)) for title in scores)
+                else:
+                    hits = posting.items()
+                for title, weight in hits:
+                    if weight is None or (scores is not None and title not in scores):
+                        continue
+                    score = weight * (2 if exact else 1)
+                    if score > matched.get(title, 0):
+                        matched[title] = score
+            if scores is None:
+                scores = matched
+            else:
+                scores = {title: scores[title] + score for title, score in matched.items()}
+            if not scores:
+                return SearchResults(truncated=truncated)
+        # Only titles that can still reach the top limit with the bonus are ranked
+        floor = heapq.nlargest(limit, scores.values())[-1] - TITLE_WEIGHT
+        phrase = ' '.join(tokens)
+
+        def rank(item):
+            title, score = item
+            if ' '.join(tokenize(title)).startswith(phrase):
+                score += TITLE_WEIGHT
+            return -score, len(title), title
+
+        candidates = [item for item in scores.items() if item[1] >= floor]
+        return SearchResults((title for title, _ in heapq.nsmallest(limit, candidates, key=rank)), truncated)
+
+def get_search_index(root):
+    """Get the search index stored in the books root, or None if it was never built"""
+    return root.get(SEARCH_KEY)
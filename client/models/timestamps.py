@@ -0,0 +1,18 @@
+import time
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def format_timestamp(timestamp):
+    """Epoch seconds -> 'YYYY-mm-dd HH:MM:SS' for display (None stays None)"""
+    if timestamp is None or isinstance(timestamp, str):
+        return timestamp
+    return time.strftime(TIME_FORMAT, time.localtime(timestamp))
+
+def parse_timestamp(value):
+    """Legacy formatted timestamp -> epoch seconds"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(time.mktime(time.strptime(value, TIME_FORMAT)))
+    except ValueError:
+        return value
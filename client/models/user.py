@@ -6,7 +6,6 @@ class User(Persistent):
         self.username = username
         self.password_hash = self._hash_password(password)
         self.role = role  # 'admin' or 'user'
-        self.is_logged_in = False
 
     def _hash_password(self, password):
         return hashlib.sha256(password.encode()).hexdigest()
@@ -15,10 +14,15 @@ class User(Persistent):
         return self.password_hash == self._hash_password(password)
 
     def has_permission(self, action):
-        if self.role == 'admin':
-            # Admin có tất cả quyền bao gồm thêm và xóa sách
-            return action in ['add', 'delete', 'borrow', 'return', 'list']
-        if self.role == 'user':
-            # Users chỉ có thể mượn và trả sách
-            return action in ['borrow', 'return', 'list']
-        return False 
\ No newline at end of file
+        return role_permits(self.role, action)
+
+
+def role_permits(role, action):
+    """Whether a role may perform an action (shared by User and Session)"""
+    if role == 'admin':
+        # Admin có tất cả quyền bao gồm thêm và xóa sách
+        return action in ['add', 'delete', 'borrow', 'return', 'list']
+    if role == 'user':
+        # Users chỉ có thể mượn và trả sách
+        return action in ['borrow', 'return', 'list']
+    return False
@@ -1,45 +1,43 @@
-import logging
-from models.book import Book
-from models.user import User
-import transaction
+from models.book import format_timestamp
 from functools import wraps
-import time
-from ZODB.POSException import ConflictError
-import os
-from utils import get_user_logger
-
-MAX_RETRIES = 3
-RETRY_DELAY = 0.5  # seconds
-
-# Biến global để lưu update_queue
-_update_queue = None
-
-def set_update_queue(queue):
-    """Set update queue từ client_app"""
-    global _update_queue
-    _update_queue = queue
-
-def notify_update():
-    """Thông báo có cập nhật mới"""
-    if _update_queue:
-        _update_queue.put(True)
-
-def retry_on_conflict(func):
-    """Decorator để thử lại khi có conflict"""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        for attempt in range(MAX_RETRIES):
-            try:
-                return func(*args, **kwargs)
-            except ConflictError:
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY)
-                    continue
-                raise
-    return wrapper
+import audit
+from utils import LOG_DIR, get_user_logger, flush_logs
+from storage import catalog_page
+from sessions import SessionManager
+from service import LibraryService
+
+# Biến global để lưu change feed của client_app
+_change_feed = None
+
+# Quản lý phiên đăng nhập của client_app
+_sessions = None
+
+# Số bản ghi nhật ký hiển thị mặc định
+LOG_PAGE_SIZE = 20
+
+def set_change_feed(feed):
+    """Set change feed từ client_app"""
+    global _change_feed
+    _change_feed = feed
+
+def set_session_manager(manager):
+    """Set SessionManager từ client_app"""
+    global _sessions
+    _sessions = manager
+
+def _session_manager(accounts_root):
+    global _sessions
+    if _sessions is None:
+        _sessions = SessionManager(accounts_root)
+    return _sessions
+
+def notify_update(*titles):
+    """Thông báo các sách vừa được client này cập nhật (không có title = làm mới tất cả)"""
+    if _change_feed:
+        _change_feed.publish(titles or None)
 
 def require_auth(action):
-    """Decorator to check authentication and authorization"""
+    """Decorator to check authentication and authorization (in-memory, no ZODB access)"""
     def decorator(func):
         @wraps(func)
         def wrapper(root, current_user, *args, **kwargs):
@@ -55,36 +53,82 @@ def require_auth(action):
         return wrapper
     return decorator
 
-@retry_on_conflict
+def _service(books_root=None, accounts_root=None):
+    return LibraryService(books_root=books_root, accounts_root=accounts_root)
+
+def ask_confirmation(question):
+    """Hỏi người dùng một câu có/không (ngoài transaction)"""
+    print(f"\n{question}")
+    print("1. Có")
+    print("2. Không")
+    return input("👉 Chọn: ") == "1"
+
 def login(accounts_root):
-    """Đăng nhập"""
+    """Đăng nhập, trả về Session hoặc None"""
     username = input("👤 Tên đăng nhập: ")
     password = input("🔑 Mật khẩu: ")
     
-    if username in accounts_root['users']:
-        user = accounts_root['users'][username]
-        if user.check_password(password):
-            user.is_logged_in = True
-            transaction.commit()
-            return user
-    print("⚠️ Tên đăng nhập hoặc mật khẩu không đúng!")
-    return None
-
-@retry_on_conflict
+    user = _service(accounts_root=accounts_root).login(username, password)
+    if user is None:
+        print("⚠️ Tên đăng nhập hoặc mật khẩu không đúng!")
+        return None
+    return _session_manager(accounts_root).create(user)
+
 def register(accounts_root):
-    """Đăng ký tài khoản mới"""
+    """Đăng ký tài khoản mới và đăng nhập luôn, trả về Session hoặc None"""
+    service = _service(accounts_root=accounts_root)
     username = input("👤 Tên đăng nhập: ")
-    if username in accounts_root['users']:
+    if service.user_exists(username):
         print("⚠️ Tên đăng nhập đã tồn tại!")
         return None
         
     password = input("🔑 Mật khẩu: ")
-    user = User(username, password)
-    accounts_root['users'][username] = user
-    transaction.commit()
-    return user
+    user, message = service.register(username, password)
+    if user is None:
+        print(message)
+        return None
+    return _session_manager(accounts_root).create(user)
+
+def logout(accounts_root, current_user):
+    """Đăng xuất: thu hồi phiên"""
+    _session_manager(accounts_root).revoke(current_user)
+
+def ask_title(books_root, prompt):
+    """Hỏi tên sách; không khớp chính xác thì gợi ý các sách tìm được để chọn"""
+    text = input(prompt).strip()
+    if not text or text in books_root['books']:
+        return text
+    matches = _service(books_root).search(text)
+    if not matches:
+        return text
+    print("🔎 Không có sách trùng tên chính xác, có phải bạn muốn tìm:")
+    for i, title in enumerate(matches, 1):
+        print(f"{i}. {title}")
+    choice = input("👉 Chọn số (Enter để bỏ qua): ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1]
+    return text
+
+def find_books(books_root, current_user):
+    """Tìm sách theo tên hoặc tác giả (không cần gõ dấu, gõ một phần từ cũng được)"""
+    query = input("🔎 Tìm: ").strip()
+    titles = _service(books_root).search(query)
+    if not titles:
+        if titles.truncated:
+            print("⚠️ Không tìm thấy sách nào trong các từ đã xét, hãy gõ thêm chữ!")
+        else:
+            print("⚠️ Không tìm thấy sách nào!")
+        return titles
+    print(f"\n📚 {len(titles)} kết quả phù hợp nhất:")
+    if titles.truncated:
+        print("ℹ️ Từ gõ dở khớp quá nhiều từ, chỉ xét một phần; gõ thêm chữ để tìm chính xác hơn.")
+    books = books_root['books']
+    for title in titles:
+        book = books.get(title)
+        if book is not None:
+            print_book(title, book)
+    return titles
 
-@retry_on_conflict
 def add_book(books_root, current_user):
     """Thêm sách mới (chỉ admin)"""
     if current_user.role != 'admin':
@@ -94,65 +138,42 @@ def add_book(books_root, current_user):
     title = input("📚 Tên sách: ")
     author = input("✍️ Tác giả: ")
     
-    if title in books_root['books']:
-        print("⚠️ Sách đã tồn tại!")
-        return False
-        
-    book = Book(title, author)
-    books_root['books'][title] = book
-    transaction.commit()
-    
-    logger = get_user_logger(current_user.username)
-    logger.info(f"Thêm sách: {title} - {author}")
-    print("✅ Thêm sách thành công!")
-    return True
+    success, message = _service(books_root).add_book(title, author, current_user)
+    print(message)
+    if success:
+        notify_update(title)
+    return success
 
-@retry_on_conflict
 def delete_book(books_root, current_user):
     """Xóa sách (chỉ admin)"""
     if current_user.role != 'admin':
         print("⚠️ Bạn không có quyền thực hiện thao tác này!")
         return False
         
-    title = input("📚 Tên sách cần xóa: ")
-    
-    if title not in books_root['books']:
-        print("⚠️ Sách không tồn tại!")
-        return False
-        
-    book = books_root['books'][title]
-    if not book.available:
-        print("⚠️ Không thể xóa sách đang được mượn!")
-        return False
-        
-    del books_root['books'][title]
-    transaction.commit()
+    title = ask_title(books_root, "📚 Tên sách cần xóa: ")
     
-    logger = get_user_logger(current_user.username)
-    logger.info(f"Xóa sách: {title}")
-    print("✅ Xóa sách thành công!")
-    return True
+    success, message = _service(books_root).delete_book(title, current_user)
+    print(message)
+    if success:
+        notify_update(title)
+    return success
 
-@retry_on_conflict
 def borrow_book(books_root, current_user):
     """Gửi yêu cầu mượn sách"""
-    title = input("📚 Tên sách cần mượn: ")
+    title = ask_title(books_root, "📚 Tên sách cần mượn: ")
     
-    if title not in books_root['books']:
-        print("⚠️ Sách không tồn tại!")
-        return False
-        
-    book = books_root['books'][title]
-    success, message = book.request_borrow(current_user.username)
-    
-    if success:
-        transaction.commit()
+    service = _service(books_root)
+    success, message = service.request_borrow(title, current_user.username)
+    if success is None:
+        # Hỏi xác nhận khi không có transaction nào đang mở
+        confirm = ask_confirmation(message)
+        success, message = service.request_borrow(title, current_user.username, confirm=confirm)
     
     print(message)
-    notify_update()  # Thông báo cập nhật cho tất cả client
+    if success:
+        notify_update(title)
     return success
 
-@retry_on_conflict
 def approve_borrow_request(books_root, current_user):
     """Duyệt yêu cầu mượn sách (chỉ admin)"""
     if current_user.role != 'admin':
@@ -160,27 +181,24 @@ def approve_borrow_request(books_root, current_user):
         return False
 
     # Hiển thị danh sách yêu cầu mượn sách
-    has_requests = False
+    service = _service(books_root)
+    pending = service.pending_requests()
     print("\n📋 Danh sách yêu cầu mượn sách:")
-    for title, book in books_root['books'].items():
-        pending_requests = book.get_pending_requests()
-        if pending_requests:
-            has_requests = True
-            print(f"\n📚 {title}:")
-            for username, request_time in pending_requests:
-                print(f"  - {username} (yêu cầu lúc: {request_time})")
-
-    if not has_requests:
+    for title, requests in pending.items():
+        print(f"\n📚 {title}:")
+        for username, request_time in requests:
+            print(f"  - {username} (yêu cầu lúc: {format_timestamp(request_time)})")
+
+    if not pending:
         print("⚠️ Không có yêu cầu mượn sách nào!")
         return False
 
     # Chọn sách và người dùng để duyệt
-    title = input("\n📚 Nhập tên sách cần duyệt: ")
+    title = ask_title(books_root, "\n📚 Nhập tên sách cần duyệt: ")
     if title not in books_root['books']:
         print("⚠️ Sách không tồn tại!")
         return False
 
-    book = books_root['books'][title]
     username = input("👤 Nhập tên người dùng cần duyệt: ")
 
     print("\nBạn muốn:")
@@ -189,82 +207,137 @@ def approve_borrow_request(books_root, current_user):
     choice = input("👉 Chọn: ")
 
     if choice == "1":
-        success, message = book.approve_request(username, current_user.username)
+        success, message = service.approve(title, username, current_user)
     elif choice == "2":
         reason = input("📝 Lý do từ chối (có thể để trống): ")
-        success, message = book.reject_request(username, current_user.username, reason)
+        success, message = service.reject(title, username, current_user, reason)
     else:
         print("⚠️ Lựa chọn không hợp lệ!")
         return False
 
     if success:
-        transaction.commit()
-        notify_update()
+        notify_update(title)
 
     print(message)
     return success
 
-@retry_on_conflict
 def return_book(books_root, current_user):
     """Trả sách"""
-    title = input("📚 Tên sách cần trả: ")
-    
-    if title not in books_root['books']:
-        print("⚠️ Sách không tồn tại!")
-        return False
-        
-    book = books_root['books'][title]
-    if book.available:
-        print("⚠️ Sách chưa được mượn!")
-        return False
-        
-    if book.borrower != current_user.username and current_user.role != 'admin':
-        print("⚠️ Bạn không phải người mượn sách này!")
-        return False
-        
-    success, message = book.return_book()
+    service = _service(books_root)
+    borrowed = service.books_borrowed_by(current_user.username)
+    if borrowed:
+        print(f"📖 Sách bạn đang mượn: {', '.join(borrowed)}")
+    title = ask_title(books_root, "📚 Tên sách cần trả: ")
     
+    success, message = service.return_book(title, current_user)
     if success:
-        transaction.commit()
-        logger = get_user_logger(current_user.username)
-        logger.info(f"Trả sách: {title}")
-        notify_update()  # Thông báo cập nhật cho tất cả client
+        notify_update(title)
     
     print(message)
     return success
 
-def list_books(books_root, current_user):
-    """Liệt kê danh sách sách"""
+def print_book(title, book):
+    """In trạng thái một quyển sách"""
+    status = "✅ Có sẵn" if book.available else f"❌ Đang mượn bởi {book.borrower}"
+    print(f"- {title} ({book.author}): {status}")
+
+    # Hiển thị yêu cầu mượn đang chờ duyệt
+    pending_requests = book.get_pending_requests()
+    if pending_requests:
+        print(f"  📋 Yêu cầu mượn đang chờ duyệt: {', '.join([u for u, _ in pending_requests])}")
+
+    # Hiển thị hàng đợi
+    if hasattr(book, 'queue') and book.queue.waiting_list:
+        print(f"  👥 Hàng đợi: {', '.join([u for u, _ in book.queue.waiting_list])}")
+
+def list_books(books_root, current_user, page_size=None, cursor=None):
+    """Liệt kê danh sách sách.
+
+    Có page_size thì chỉ in một trang sau cursor và trả về cursor của trang
+    tiếp theo (None nếu đã hết), nhờ vậy không phải tải toàn bộ catalog.
+    """
     if not books_root['books']:
         print("📚 Chưa có sách nào trong thư viện!")
-        return
-        
-    print("\nDanh sách sách:")
-    for title, book in books_root['books'].items():
-        status = "✅ Có sẵn" if book.available else f"❌ Đang mượn bởi {book.borrower}"
-        print(f"- {title} ({book.author}): {status}")
-        
-        # Hiển thị yêu cầu mượn đang chờ duyệt
-        pending_requests = book.get_pending_requests()
-        if pending_requests:
-            print(f"  📋 Yêu cầu mượn đang chờ duyệt: {', '.join([u for u, _ in pending_requests])}")
-        
-        # Hiển thị hàng đợi
-        if hasattr(book, 'queue') and book.queue.waiting_list:
-            print(f"  👥 Hàng đợi: {', '.join([u for u, _ in book.queue.waiting_list])}")
+        return None
+
+    if cursor is None:
+        print("\nDanh sách sách:")
+    if page_size is None:
+        for title, book in books_root['books'].items():
+            print_book(title, book)
+        return None
+
+    page, next_cursor = catalog_page(books_root['books'], cursor, page_size)
+    for title, book in page:
+        print_book(title, book)
+    return next_cursor
+
+def _ask_time_range():
+    """Hỏi khoảng thời gian, trả về (start, end) dạng epoch hoặc None nếu nhập sai"""
+    try:
+        start = audit.parse_time(input("Từ (YYYY-MM-DD [HH:MM], Enter = không giới hạn): "))
+        end = audit.parse_time(input("Đến (YYYY-MM-DD [HH:MM], Enter = không giới hạn): "))
+    except ValueError as e:
+        print(f"⚠️ {e}")
+        return None
+    return start, end
+
+def _ask_limit(default=LOG_PAGE_SIZE):
+    text = input(f"Số bản ghi ({default}): ").strip()
+    return int(text) if text.isdigit() and int(text) > 0 else default
 
 def view_logs(username):
-    """Xem lịch sử hoạt động của user"""
-    log_file = f'logs/{username}.log'
-    if not os.path.exists(log_file):
-        print("⚠️ Chưa có lịch sử hoạt động!")
-        return
-        
+    """Xem lịch sử hoạt động của user: N bản ghi mới nhất hoặc theo khoảng thời gian"""
+    # Ghi nốt các bản ghi còn trong hàng đợi log trước khi đọc file
+    flush_logs()
     try:
-        with open(log_file, 'r', encoding='utf-8') as f:
+        mode = input("1. Mới nhất  2. Theo khoảng thời gian (Enter = 1): ").strip()
+        if mode == "2":
+            time_range = _ask_time_range()
+            if time_range is None:
+                return
+            records = list(audit.time_range(LOG_DIR, username, *time_range))
+        else:
+            records = audit.tail(LOG_DIR, username, _ask_limit())
+
+        if records:
+            print("\n📝 Lịch sử hoạt động của bạn:")
+            for record in records:
+                print(audit.format_record(record))
+            return
+        # Nhật ký dạng văn bản từ trước khi có nhật ký có cấu trúc
+        lines = audit.legacy_tail(LOG_DIR, username, LOG_PAGE_SIZE) if mode != "2" else []
+        if lines:
             print("\n📝 Lịch sử hoạt động của bạn:")
-            print(f.read())
+            print("\n".join(lines))
+        else:
+            print("⚠️ Chưa có lịch sử hoạt động!")
     except Exception as e:
         print(f"⚠️ Không thể đọc lịch sử hoạt động: {str(e)}")
         system_logger = get_user_logger('system')
         system_logger.error(f"Lỗi khi đọc lịch sử hoạt động của {username}: {str(e)}")
+
+def search_logs(current_user):
+    """Tra cứu nhật ký của mọi người dùng (chỉ admin) theo người dùng, thao tác, sách và thời gian"""
+    if current_user.role != 'admin':
+        print("❌ Bạn không có quyền thực hiện thao tác này!")
+        return
+    flush_logs()
+    users = input("Người dùng (cách nhau bởi dấu phẩy, Enter = tất cả): ").strip()
+    ops = input("Thao tác (vd: approve, reject, return_book; Enter = tất cả): ").strip()
+    title = input("Tên sách (Enter = tất cả): ").strip() or None
+    time_range = _ask_time_range()
+    if time_range is None:
+        return
+    limit = _ask_limit()
+
+    records = audit.query(LOG_DIR, *time_range,
+                          users=[u.strip() for u in users.split(',') if u.strip()],
+                          ops=[o.strip() for o in ops.split(',') if o.strip()],
+                          title=title, limit=limit)
+    if not records:
+        print("⚠️ Không có bản ghi nào phù hợp!")
+        return
+    print(f"\n📝 {len(records)} bản ghi:")
+    for record in records:
+        print(audit.format_record(record, with_user=True))
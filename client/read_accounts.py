@@ -1,28 +1,65 @@
-from ZEO import ClientStorage
-import ZODB
-import transaction
-from models.user import User
+import argparse
+import sys
+from contextlib import redirect_stdout
 
-def read_accounts():
+from client_config import load_config, open_storage, open_db, print_cache_report
+from report import FORMATS, write_rows
+from sessions import SessionManager
+from storage import REPORT_CHUNK_SIZE, iter_catalog
+
+# Không xuất hash mật khẩu ra báo cáo dạng dữ liệu
+ACCOUNT_FIELDS = ('username', 'role', 'active_session')
+
+def account_rows(accounts_root, chunk_size=REPORT_CHUNK_SIZE):
+    """Duyệt tài khoản theo đoạn, nạp trước các User của mỗi đoạn"""
+    active = SessionManager(accounts_root).active_usernames()
+    for username, user in iter_catalog(accounts_root['users'], accounts_root._p_jar, chunk_size):
+        yield {
+            'username': user.username,
+            'role': user.role,
+            'active_session': username in active,
+            'password_hash': user.password_hash,
+        }
+
+def print_account(row):
+    print(f"\n👤 Tên đăng nhập: {row['username']}")
+    print(f"🔑 Mật khẩu (hash): {row['password_hash']}")
+    print(f"👑 Vai trò: {row['role']}")
+    print(f"📱 Trạng thái đăng nhập: {'Có phiên đang hoạt động' if row['active_session'] else 'Chưa đăng nhập'}")
+    print("-" * 50)
+
+def read_accounts(config):
     # Kết nối đến ZEO server cho accounts
-    accounts_storage = ClientStorage.ClientStorage(('127.0.0.1', 8000))
-    accounts_db = ZODB.DB(accounts_storage)
+    accounts_storage = open_storage('accounts', 8000, config)
+    accounts_db = open_db(accounts_storage, config)
     accounts_connection = accounts_db.open()
     accounts_root = accounts_connection.root()
+    fmt = getattr(config, 'format', 'text')
+    chunk_size = getattr(config, 'chunk_size', REPORT_CHUNK_SIZE)
 
-    print("\n=== THÔNG TIN TÀI KHOẢN ===")
+    if fmt == 'text':
+        print("\n=== THÔNG TIN TÀI KHOẢN ===")
     if 'users' in accounts_root:
-        for username, user in accounts_root['users'].items():
-            print(f"\n👤 Tên đăng nhập: {user.username}")
-            print(f"🔑 Mật khẩu (hash): {user.password_hash}")
-            print(f"👑 Vai trò: {user.role}")
-            print(f"📱 Trạng thái đăng nhập: {'Đã đăng nhập' if user.is_logged_in else 'Chưa đăng nhập'}")
-            print("-" * 50)
+        rows = account_rows(accounts_root, chunk_size)
+        if fmt == 'text':
+            for row in rows:
+                print_account(row)
+        else:
+            write_rows(rows, ACCOUNT_FIELDS, fmt, sys.stdout)
     else:
-        print("Chưa có tài khoản nào trong hệ thống!")
+        print("Chưa có tài khoản nào trong hệ thống!", file=sys.stdout if fmt == 'text' else sys.stderr)
 
     accounts_connection.close()
+    if config.cache_stats:
+        # Báo cáo cache ra stderr để không lẫn vào dữ liệu jsonl/csv
+        with redirect_stdout(sys.stdout if fmt == 'text' else sys.stderr):
+            print_cache_report({'accounts': accounts_db})
     accounts_db.close()
 
 if __name__ == '__main__':
-    read_accounts() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="In toàn bộ tài khoản")
+    parser.add_argument('--format', choices=FORMATS, default='text',
+                        help='text: dễ đọc; jsonl/csv: ghi từng dòng ra stdout')
+    parser.add_argument('--chunk-size', type=int, default=REPORT_CHUNK_SIZE,
+                        help='số tài khoản nạp trước mỗi lượt')
+    read_accounts(load_config(parser=parser))
@@ -1,29 +1,73 @@
-from ZEO import ClientStorage
-import ZODB
-import transaction
-from models.book import Book
+import argparse
+import sys
+from contextlib import redirect_stdout
 
-def read_books():
+from client_config import load_config, open_storage, open_db, print_cache_report
+from models.book import format_timestamp
+from report import FORMATS, write_rows
+from storage import REPORT_CHUNK_SIZE, iter_catalog
+
+BOOK_FIELDS = ('title', 'author', 'available', 'borrower', 'borrow_date', 'queue', 'pending')
+
+def book_row(title, book):
+    return {
+        'title': title,
+        'author': book.author,
+        'available': book.available,
+        'borrower': book.borrower,
+        'borrow_date': format_timestamp(book.borrow_date),
+        'queue': [u for u, _ in book.queue.waiting_list] if hasattr(book, 'queue') else [],
+        'pending': [u for u, _ in book.get_pending_requests()],
+    }
+
+def print_book(row):
+    print(f"\n📚 Tên sách: {row['title']}")
+    print(f"✍️ Tác giả: {row['author']}")
+    status = '✅ Có sẵn' if row['available'] else f"❌ Đang mượn bởi {row['borrower']}"
+    print(f"📌 Trạng thái: {status}")
+    if row['queue']:
+        print(f"👥 Hàng đợi: {', '.join(row['queue'])}")
+    print("-" * 50)
+
+def book_rows(books_root, chunk_size=REPORT_CHUNK_SIZE):
+    """Duyệt catalog theo đoạn, nạp trước sách rồi hàng đợi và danh sách chờ của chúng"""
+    prefetch = (lambda book: getattr(book, 'queue', None),
+                lambda queue: queue._entries)
+    for title, book in iter_catalog(books_root['books'], books_root._p_jar, chunk_size, prefetch):
+        yield book_row(title, book)
+
+def read_books(config):
     # Kết nối đến ZEO server cho books
-    books_storage = ClientStorage.ClientStorage(('127.0.0.1', 8001))
-    books_db = ZODB.DB(books_storage)
+    books_storage = open_storage('books', 8001, config)
+    books_db = open_db(books_storage, config)
     books_connection = books_db.open()
     books_root = books_connection.root()
+    fmt = getattr(config, 'format', 'text')
+    chunk_size = getattr(config, 'chunk_size', REPORT_CHUNK_SIZE)
 
-    print("\n=== THÔNG TIN SÁCH ===")
+    if fmt == 'text':
+        print("\n=== THÔNG TIN SÁCH ===")
     if 'books' in books_root:
-        for title, book in books_root['books'].items():
-            print(f"\n📚 Tên sách: {book.title}")
-            print(f"✍️ Tác giả: {book.author}")
-            print(f"📌 Trạng thái: {'✅ Có sẵn' if book.available else f'❌ Đang mượn bởi {book.borrower}'}")
-            if hasattr(book, 'queue') and book.queue.waiting_list:
-                print(f"👥 Hàng đợi: {', '.join([u for u, _ in book.queue.waiting_list])}")
-            print("-" * 50)
+        rows = book_rows(books_root, chunk_size)
+        if fmt == 'text':
+            for row in rows:
+                print_book(row)
+        else:
+            write_rows(rows, BOOK_FIELDS, fmt, sys.stdout)
     else:
-        print("Chưa có sách nào trong thư viện!")
+        print("Chưa có sách nào trong thư viện!", file=sys.stdout if fmt == 'text' else sys.stderr)
 
     books_connection.close()
+    if config.cache_stats:
+        # Báo cáo cache ra stderr để không lẫn vào dữ liệu jsonl/csv
+        with redirect_stdout(sys.stdout if fmt == 'text' else sys.stderr):
+            print_cache_report({'books': books_db})
     books_db.close()
 
 if __name__ == '__main__':
-    read_books() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="In toàn bộ sách")
+    parser.add_argument('--format', choices=FORMATS, default='text',
+                        help='text: dễ đọc; jsonl/csv: ghi từng dòng ra stdout')
+    parser.add_argument('--chunk-size', type=int, default=REPORT_CHUNK_SIZE,
+                        help='số sách nạp trước mỗi lượt')
+    read_books(load_config(parser=parser))
@@ -0,0 +1,29 @@
+"""Ghi báo cáo dạng JSONL hoặc CSV ra một luồng, từng dòng một.
+
+Dùng chung cho read_books.py, read_accounts.py và catalog_io.py: các dòng
+được ghi ngay khi đọc xong nên báo cáo lớn không phải giữ cả bảng trong
+bộ nhớ và có thể chuyển thẳng qua pipe.
+"""
+import csv
+import json
+
+FORMATS = ('text', 'jsonl', 'csv')
+# Phân cách các phần tử của cột dạng danh sách trong CSV
+LIST_SEPARATOR = ';'
+
+
+def write_rows(rows, fields, fmt, out):
+    """Ghi các dict theo fields ra out, trả về số dòng đã ghi"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([LIST_SEPARATOR.join(value) if isinstance(value, (list, tuple)) else value
+                             for value in (row.get(field) for field in fields)])
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps({field: row.get(field) for field in fields}, ensure_ascii=False) + '\n')
+            count += 1
+    return count
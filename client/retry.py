@@ -0,0 +1,161 @@
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+import transaction
+from ZODB.POSException import ConflictError
+
+# Giới hạn trên (giây) của các bucket trong histogram độ trễ
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RetryPolicy:
+    """Chính sách thử lại khi gặp ConflictError.
+
+    Mỗi lần thử lại đều abort transaction (để đọc lại trạng thái mới từ
+    server) rồi chờ một khoảng ngẫu nhiên trong [0, base_delay * 2^attempt]
+    (exponential backoff với full jitter), để các client tranh chấp không
+    cùng thức dậy một lúc. Dừng khi hết max_attempts hoặc vượt deadline.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.05, max_delay=2.0, deadline=10.0,
+                 transaction_manager=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.transaction_manager = transaction_manager
+
+    def backoff(self, attempt):
+        """Thời gian chờ trước lần thử thứ attempt + 1"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def resync(self, manager=None):
+        """Bỏ transaction bị xung đột và bắt đầu lại với dữ liệu mới nhất"""
+        manager = manager or self.transaction_manager or transaction.manager
+        manager.abort()
+        manager.begin()
+
+
+class OperationMetrics:
+    """Số liệu của một thao tác: số lần gọi, số lần thử, số xung đột, độ trễ"""
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.conflicts = 0
+        self.failures = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, attempts, conflicts, latency, failed):
+        self.calls += 1
+        self.attempts += attempts
+        self.conflicts += conflicts
+        if failed:
+            self.failures += 1
+        self.latency_sum += latency
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def to_dict(self):
+        buckets = {str(limit): count for limit, count in zip(LATENCY_BUCKETS, self.latency_buckets)}
+        buckets['+Inf'] = self.latency_buckets[-1]
+        return {
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'conflicts': self.conflicts,
+            'failures': self.failures,
+            'latency_sum': self.latency_sum,
+            'latency_buckets': buckets,
+        }
+
+
+class RetryMetrics:
+    """Bộ đếm theo từng thao tác, an toàn khi nhiều thread cùng ghi"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, name, attempts, conflicts, latency, failed=False):
+        with self._lock:
+            metrics = self._operations.get(name)
+            if metrics is None:
+                metrics = self._operations[name] = OperationMetrics()
+            metrics.record(attempts, conflicts, latency, failed)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: m.to_dict() for name, m in self._operations.items()}
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def export(self, path):
+        """Ghi snapshot ra file JSON để hệ thống giám sát đọc"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+metrics = RetryMetrics()
+default_policy = RetryPolicy()
+
+
+def configure(**settings):
+    """Thay đổi chính sách mặc định, ví dụ configure(max_attempts=8, deadline=5)"""
+    for name, value in settings.items():
+        if not hasattr(default_policy, name):
+            raise AttributeError(f"RetryPolicy không có thuộc tính {name}")
+        setattr(default_policy, name, value)
+
+
+def own_manager(obj, *args, **kwargs):
+    """manager= cho phương thức của đối tượng tự giữ transaction manager (LibraryService, SessionManager)"""
+    return obj.transaction_manager
+
+
+def retry_on_conflict(func=None, *, policy=None, name=None, manager=None):
+    """Decorator để thử lại khi có conflict.
+
+    Dùng trực tiếp (@retry_on_conflict) với chính sách mặc định, hoặc
+    @retry_on_conflict(policy=RetryPolicy(...), name='borrow').
+
+    manager là transaction manager được resync khi xung đột, hoặc một hàm
+    nhận đúng các đối số của lần gọi và trả về nó (own_manager cho phương
+    thức); không có thì dùng policy.transaction_manager rồi đến
+    transaction.manager.
+    """
+    def decorator(func):
+        operation = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            active = policy or default_policy
+            start = time.monotonic()
+            conflicts = 0
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    result = func(*args, **kwargs)
+                except ConflictError:
+                    conflicts += 1
+                    active.resync(manager(*args, **kwargs) if callable(manager) else manager)
+                    delay = active.backoff(attempt - 1)
+                    elapsed = time.monotonic() - start
+                    if attempt >= active.max_attempts or elapsed + delay > active.deadline:
+                        metrics.record(operation, attempt, conflicts, elapsed, failed=True)
+                        raise
+                    time.sleep(delay)
+                    continue
+                metrics.record(operation, attempt, conflicts, time.monotonic() - start)
+                return result
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+import transaction
+
+DEFAULT_POOL_SIZE = 4
+
+
+class ClientRuntime:
+    """Cấp connection ZODB riêng cho từng thread.
+
+    Mỗi thread có một TransactionManager riêng và một connection tới mỗi
+    database (lấy từ pool của ZODB.DB), nên thread auto refresh và thread
+    menu chính không dùng chung cache hay transaction của nhau. Các
+    connection của cùng một thread dùng chung TransactionManager nên một
+    transaction có thể chạm cả books lẫn accounts.
+
+    Với multi_database=True các database thuộc cùng một nhóm
+    ZODB.DB(databases=...): connection đầu tiên của thread là connection
+    chính, các database khác được mở qua get_connection() và trả về pool
+    cùng với nó.
+    """
+
+    def __init__(self, databases=None, pool_size=DEFAULT_POOL_SIZE, multi_database=False):
+        self.databases = {}  # tên -> ZODB.DB
+        self.pool_size = pool_size
+        self.multi_database = multi_database
+        self._local = threading.local()
+        for name, db in (databases or {}).items():
+            self.add_database(name, db)
+
+    def add_database(self, name, db):
+        db.setPoolSize(self.pool_size)
+        self.databases[name] = db
+
+    def database(self, name):
+        return self.databases[name]
+
+    def transaction_manager(self):
+        """TransactionManager của thread hiện tại"""
+        tm = getattr(self._local, 'transaction_manager', None)
+        if tm is None:
+            tm = self._local.transaction_manager = transaction.TransactionManager()
+            self._local.connections = {}
+        return tm
+
+    def connection(self, name):
+        """Connection tới database name của thread hiện tại (mở khi cần)"""
+        tm = self.transaction_manager()
+        connections = self._local.connections
+        connection = connections.get(name)
+        if connection is None:
+            db = self.database(name)
+            if self.multi_database and connections:
+                primary = next(iter(connections.values()))
+                connection = primary.get_connection(name)
+            else:
+                connection = db.open(transaction_manager=tm)
+            connections[name] = connection
+        return connection
+
+    def root(self, name):
+        return self.connection(name).root()
+
+    @contextmanager
+    def unit_of_work(self, name):
+        """Connection dùng một lần: commit khi thành công, abort khi lỗi, rồi trả về pool"""
+        tm = transaction.TransactionManager()
+        connection = self.database(name).open(transaction_manager=tm)
+        try:
+            with tm:
+                yield connection.root()
+        finally:
+            connection.close()
+
+    def close_thread(self):
+        """Trả các connection của thread hiện tại về pool"""
+        tm = getattr(self._local, 'transaction_manager', None)
+        if tm is None:
+            return
+        tm.abort()
+        connections = list(self._local.connections.values())
+        if self.multi_database:
+            # Đóng connection chính sẽ đóng luôn các connection phụ
+            connections = connections[:1]
+        for connection in connections:
+            connection.close()
+        del self._local.transaction_manager
+        del self._local.connections
+
+    def close(self):
+        self.close_thread()
+        for db in self.databases.values():
+            db.close()
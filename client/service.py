@@ -0,0 +1,375 @@
+import transaction
+from models.book import Book
+from models.user import User
+from models.book_index import BookIndex, get_book_index, get_pending_index
+from models.search_index import SearchIndex, get_search_index
+from locks import get_lock_service
+from retry import own_manager, retry_on_conflict
+from storage import (ensure_books_catalog, ensure_book_index, ensure_pending_index, ensure_search_index,
+                     ensure_accounts_catalog, ensure_session_store)
+from utils import log_event
+
+# Số sách mỗi transaction khi nhập hàng loạt
+IMPORT_BATCH_SIZE = 1000
+# Số sách giữa hai savepoint trong một lô
+IMPORT_SAVEPOINT_EVERY = 200
+# Số kết quả tìm kiếm mặc định
+SEARCH_LIMIT = 10
+# Thông báo khi lease của sách đang do người khác giữ (xem locks.py)
+BUSY_MESSAGE = "Sách đang được người khác thao tác"
+
+
+class LibraryService:
+    """Các thao tác thư viện không tương tác (không gọi input()).
+
+    CLI thu thập dữ liệu từ người dùng trước rồi mới gọi service, nên mỗi
+    transaction chỉ kéo dài vài mili giây và có thể được script/benchmark
+    gọi hàng loạt. Mỗi phương thức ghi tự bắt đầu transaction, commit khi
+    thành công, abort khi thất bại và được thử lại khi gặp ConflictError.
+    Phương thức trả về (success, message) giống các phương thức của Book;
+    success là None khi người dùng cần xác nhận (gọi lại với confirm).
+
+    Khi có lock service, lease của sách được giữ suốt transaction: lấy trước
+    begin và chỉ trả sau commit/abort, nên client khác không đọc được trạng
+    thái trước khi thay đổi được commit.
+    """
+
+    def __init__(self, books_root=None, accounts_root=None, transaction_manager=None):
+        self.books_root = books_root
+        self.accounts_root = accounts_root
+        if transaction_manager is None:
+            # Dùng transaction manager của connection đã mở root (mỗi thread một cái)
+            root = books_root if books_root is not None else accounts_root
+            jar = getattr(root, '_p_jar', None)
+            transaction_manager = jar.transaction_manager if jar is not None else transaction.manager
+        self.transaction_manager = transaction_manager
+
+    # --- Transaction ---
+
+    def _begin(self):
+        # Bắt đầu transaction mới để đọc trạng thái mới nhất từ server
+        self.transaction_manager.begin()
+
+    def _finish(self, success):
+        if success:
+            self.transaction_manager.commit()
+        else:
+            self.transaction_manager.abort()
+
+    def _book(self, title):
+        return self.books_root['books'].get(title)
+
+    def _acquire(self, title, holder):
+        service = get_lock_service()
+        return service is None or service.acquire(title, holder)
+
+    def _release(self, title, holder):
+        service = get_lock_service()
+        if service is not None:
+            service.release(title, holder)
+
+    # --- Khởi tạo ---
+
+    @retry_on_conflict(name='prepare_books', manager=own_manager)
+    def prepare_books(self):
+        """Tạo catalog sách và các chỉ mục còn thiếu, trả về True nếu có thay đổi.
+
+        Hai client khởi động cùng lúc cùng tạo thì một client gặp
+        ConflictError; lần thử lại đọc trạng thái mới và thấy đã có nên
+        không tạo lại. Catalog cũ nên được xây chỉ mục trước bằng
+        migrate_storage.py để client không phải quét cả catalog.
+        """
+        self._begin()
+        root = self.books_root
+        changed = (ensure_books_catalog(root) | ensure_book_index(root)
+                   | ensure_pending_index(root) | ensure_search_index(root))
+        self._finish(changed)
+        return changed
+
+    @retry_on_conflict(name='prepare_accounts', manager=own_manager)
+    def prepare_accounts(self):
+        """Tạo catalog tài khoản (kèm admin mặc định) và kho phiên nếu chưa có"""
+        self._begin()
+        changed = ensure_accounts_catalog(self.accounts_root) | ensure_session_store(self.accounts_root)
+        self._finish(changed)
+        return changed
+
+    # --- Tài khoản ---
+
+    @retry_on_conflict(name='login', manager=own_manager)
+    def login(self, username, password):
+        """Trả về User nếu đúng tên đăng nhập và mật khẩu, ngược lại None.
+
+        Chỉ đọc: trạng thái đăng nhập nằm trong phiên (sessions.py), không
+        ghi vào User.
+        """
+        self._begin()
+        user = self.accounts_root['users'].get(username)
+        self._finish(False)
+        if user is None or not user.check_password(password):
+            return None
+        return user
+
+    def user_exists(self, username):
+        return username in self.accounts_root['users']
+
+    @retry_on_conflict(name='register', manager=own_manager)
+    def register(self, username, password):
+        """Tạo tài khoản người dùng thường, trả về (User hoặc None, message)"""
+        self._begin()
+        users = self.accounts_root['users']
+        if username in users:
+            self._finish(False)
+            return None, "⚠️ Tên đăng nhập đã tồn tại!"
+        user = users[username] = User(username, password)
+        self._finish(True)
+        return user, "✅ Đăng ký thành công!"
+
+    # --- Sách (admin) ---
+
+    @retry_on_conflict(name='add_book', manager=own_manager)
+    def add_book(self, title, author, actor):
+        """Thêm sách mới (chỉ admin)"""
+        if actor.role != 'admin':
+            return False, "⚠️ Bạn không có quyền thực hiện thao tác này!"
+        self._begin()
+        books = self.books_root['books']
+        if title in books:
+            self._finish(False)
+            return False, "⚠️ Sách đã tồn tại!"
+
+        book = books[title] = Book(title, author)
+        index = get_book_index(self.books_root)
+        if index is not None:
+            index.index_book(book)
+        search_index = get_search_index(self.books_root)
+        if search_index is not None:
+            search_index.index_book(book)
+        self._finish(True)
+
+        log_event(actor.username, 'add_book', f"Thêm sách: {title} - {author}", title=title)
+        return True, "✅ Thêm sách thành công!"
+
+    @retry_on_conflict(name='delete_book', manager=own_manager)
+    def delete_book(self, title, actor):
+        """Xóa sách (chỉ admin)"""
+        if actor.role != 'admin':
+            return False, "⚠️ Bạn không có quyền thực hiện thao tác này!"
+        self._begin()
+        book = self._book(title)
+        if book is None:
+            self._finish(False)
+            return False, "⚠️ Sách không tồn tại!"
+        if not book.available:
+            self._finish(False)
+            return False, "⚠️ Không thể xóa sách đang được mượn!"
+
+        del self.books_root['books'][title]
+        index = get_book_index(self.books_root)
+        if index is not None:
+            index.unindex_book(title)
+        search_index = get_search_index(self.books_root)
+        if search_index is not None:
+            search_index.unindex_book(title)
+        pending_index = get_pending_index(self.books_root)
+        if pending_index is not None:
+            for username, _ in book.get_pending_requests():
+                pending_index.remove(title, username)
+        self._finish(True)
+
+        log_event(actor.username, 'delete_book', f"Xóa sách: {title}", title=title)
+        return True, "✅ Xóa sách thành công!"
+
+    @retry_on_conflict(name='approve', manager=own_manager)
+    def approve(self, title, username, actor):
+        """Duyệt yêu cầu mượn sách của username (chỉ admin)"""
+        return self._review(title, actor, lambda book: book.approve_request(username, actor.username))
+
+    @retry_on_conflict(name='reject', manager=own_manager)
+    def reject(self, title, username, actor, reason=""):
+        """Từ chối yêu cầu mượn sách của username (chỉ admin)"""
+        return self._review(title, actor, lambda book: book.reject_request(username, actor.username, reason))
+
+    def _review(self, title, actor, action):
+        if actor.role != 'admin':
+            return False, "⚠️ Bạn không có quyền thực hiện thao tác này!"
+        return self._book_action(title, actor.username, action)
+
+    # --- Mượn / trả ---
+
+    def _book_action(self, title, holder, action, keep=None):
+        """Chạy action trên sách trong lease của holder; keep(book) quyết định commit khi action trả về False"""
+        if not self._acquire(title, holder):
+            return False, BUSY_MESSAGE
+        try:
+            self._begin()
+            book = self._book(title)
+            if book is None:
+                self._finish(False)
+                return False, "⚠️ Sách không tồn tại!"
+            success, message = action(book)
+            self._finish(success or (success is False and keep is not None and keep(book)))
+            return success, message
+        finally:
+            self._release(title, holder)
+
+    @retry_on_conflict(name='request_borrow', manager=own_manager)
+    def request_borrow(self, title, username, confirm=None):
+        """Gửi yêu cầu mượn sách (cần admin duyệt)"""
+        return self._book_action(title, username, lambda book: book.request_borrow(username, confirm))
+
+    @retry_on_conflict(name='borrow', manager=own_manager)
+    def borrow(self, title, username, confirm=None):
+        """Mượn sách ngay nếu sách có sẵn, ngược lại vào hàng đợi"""
+        # Không mượn được nhưng đã được xếp vào hàng đợi thì vẫn phải commit
+        return self._book_action(title, username, lambda book: book.borrow(username, confirm),
+                                 keep=lambda book: username in book.queue)
+
+    @retry_on_conflict(name='join_queue', manager=own_manager)
+    def join_queue(self, title, username):
+        """Vào hàng đợi của một quyển sách đang được mượn"""
+        return self._book_action(title, username, lambda book: book.join_queue(username, confirm=True))
+
+    @retry_on_conflict(name='return_book', manager=own_manager)
+    def return_book(self, title, actor):
+        """Trả sách (người mượn hoặc admin)"""
+        def action(book):
+            if book.available:
+                return False, "⚠️ Sách chưa được mượn!"
+            if book.borrower != actor.username and actor.role != 'admin':
+                return False, "⚠️ Bạn không phải người mượn sách này!"
+            return book.return_book()
+
+        success, message = self._book_action(title, actor.username, action)
+        if success:
+            log_event(actor.username, 'return_book', f"Trả sách: {title}", title=title)
+        return success, message
+
+    # --- Nhập hàng loạt (admin) ---
+
+    def import_books(self, records, actor, batch_size=IMPORT_BATCH_SIZE,
+                     savepoint_every=IMPORT_SAVEPOINT_EVERY, progress=None):
+        """Nhập sách từ một dãy (title, author), trả về (thống kê hoặc None, message).
+
+        records được đọc dần theo từng lô batch_size quyển, mỗi lô một
+        transaction; trong lô cứ savepoint_every quyển thì đặt savepoint để
+        cache của connection bỏ được các sách đã ghi. Sách đã tồn tại (kể cả
+        trùng trong cùng file) được bỏ qua. progress(stats) được gọi sau mỗi lô.
+        """
+        if actor.role != 'admin':
+            return None, "⚠️ Bạn không có quyền thực hiện thao tác này!"
+        stats = {'added': 0, 'skipped': 0, 'invalid': 0, 'batches': 0}
+        batch = []
+        for title, author in records:
+            title = (title or '').strip()
+            if not title:
+                stats['invalid'] += 1
+                continue
+            batch.append((title, (author or '').strip()))
+            if len(batch) >= batch_size:
+                self._import_step(batch, savepoint_every, stats, progress)
+                batch = []
+        if batch:
+            self._import_step(batch, savepoint_every, stats, progress)
+
+        log_event(actor.username, 'import_books',
+                  f"Nhập hàng loạt: {stats['added']} sách mới, {stats['skipped']} sách đã có")
+        return stats, f"✅ Đã nhập {stats['added']} sách, bỏ qua {stats['skipped']} sách đã có"
+
+    def _import_step(self, batch, savepoint_every, stats, progress):
+        added, skipped = self._import_batch(batch, savepoint_every)
+        stats['added'] += added
+        stats['skipped'] += skipped
+        stats['batches'] += 1
+        # Lô đã commit: bỏ các sách vừa ghi khỏi cache để bộ nhớ không tăng theo file
+        self.books_root._p_jar.cacheMinimize()
+        if progress is not None:
+            progress(stats)
+
+    @retry_on_conflict(name='import_books', manager=own_manager)
+    def _import_batch(self, batch, savepoint_every):
+        """Ghi một lô trong một transaction (chạy lại cả lô nếu xung đột)"""
+        self._begin()
+        books = self.books_root['books']
+        index = get_book_index(self.books_root)
+        search_index = get_search_index(self.books_root)
+        added = skipped = 0
+        for title, author in batch:
+            if title in books:
+                skipped += 1
+                continue
+            book = books[title] = Book(title, author)
+            if index is not None:
+                index.index_book(book)
+            if search_index is not None:
+                search_index.index_book(book)
+            added += 1
+            if added % savepoint_every == 0:
+                self.transaction_manager.savepoint(optimistic=True)
+                self.books_root._p_jar.cacheGC()
+        self._finish(added > 0)
+        return added, skipped
+
+    # --- Tra cứu (chỉ đọc) ---
+
+    def books_borrowed_by(self, username):
+        return books_borrowed_by(self.books_root, username)
+
+    def books_by_author(self, author):
+        return books_by_author(self.books_root, author)
+
+    def available_books(self):
+        return available_books(self.books_root)
+
+    def pending_requests(self):
+        return pending_requests_by_title(self.books_root)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        return search_books(self.books_root, query, limit)
+
+
+def _query_index(books_root, query, *args):
+    """Tra cứu chỉ mục phụ, quét toàn bộ catalog nếu chỉ mục chưa được xây"""
+    index = get_book_index(books_root)
+    if index is None:
+        index = BookIndex()
+        for book in books_root['books'].values():
+            index.index_book(book)
+    return getattr(index, query)(*args)
+
+def books_borrowed_by(books_root, username):
+    """Danh sách sách mà một người dùng đang mượn"""
+    return _query_index(books_root, 'titles_borrowed_by', username)
+
+def books_by_author(books_root, author):
+    """Danh sách sách của một tác giả"""
+    return _query_index(books_root, 'titles_by_author', author)
+
+def available_books(books_root):
+    """Danh sách sách đang có sẵn để mượn"""
+    return _query_index(books_root, 'available_titles')
+
+def search_books(books_root, query, limit=SEARCH_LIMIT):
+    """Tên các sách khớp query (không dấu, theo tiền tố), phù hợp nhất trước (SearchResults)"""
+    index = get_search_index(books_root)
+    if index is None:
+        # Chưa có chỉ mục: quét toàn bộ catalog
+        index = SearchIndex()
+        for book in books_root['books'].values():
+            index.index_book(book)
+    return index.search(query, limit)
+
+def pending_requests_by_title(books_root):
+    """Các yêu cầu mượn đang chờ duyệt, gom theo sách theo thứ tự yêu cầu"""
+    grouped = {}
+    index = get_pending_index(books_root)
+    if index is not None:
+        for title, username, request_time in index.requests():
+            grouped.setdefault(title, []).append((username, request_time))
+        return grouped
+    # Chưa có chỉ mục: quét toàn bộ catalog
+    for title, book in books_root['books'].items():
+        requests = book.get_pending_requests()
+        if requests:
+            grouped[title] = list(requests)
+    return grouped
@@ -0,0 +1,165 @@
+"""Phiên đăng nhập bằng token thay cho cờ User.is_logged_in lưu trong ZODB.
+
+Đăng nhập chỉ đọc accounts_root['users'] (kiểm tra mật khẩu) rồi tạo một
+Session trong bộ nhớ. Kiểm tra quyền (require_auth) chỉ đọc Session nên
+không chạm tới ZODB.
+
+Phiên được lưu thêm vào accounts_root['sessions'], một OOBTree với khóa
+(hết hạn, sha256(token)) -> (username, role):
+
+- token ngẫu nhiên (secrets) có dạng "<hết hạn dạng hex>.<phần ngẫu nhiên>",
+  nên từ token tính được khóa mà không cần chỉ mục phụ; chỉ lưu hash của
+  token nên người đọc được accounts.fs không dùng lại được phiên
+- các client đăng nhập cùng lúc chỉ thêm các khóa khác nhau vào BTree,
+  ZODB tự giải quyết xung đột mà không đụng tới đối tượng User nào
+- khóa bắt đầu bằng thời điểm hết hạn nên xóa phiên hết hạn là xóa một
+  khoảng khóa đầu cây
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import transaction
+
+from models.user import role_permits
+from retry import own_manager, retry_on_conflict
+
+SESSIONS_KEY = 'sessions'
+DEFAULT_TTL = 8 * 3600
+# Số phiên giữ trong bộ nhớ, phiên ít dùng nhất bị loại trước
+DEFAULT_CACHED_SESSIONS = 1024
+
+
+class Session:
+    """Phiên của một người dùng, dùng thay cho User làm current_user"""
+
+    __slots__ = ('token', 'username', 'role', 'expires', 'revoked')
+
+    def __init__(self, token, username, role, expires):
+        self.token = token
+        self.username = username
+        self.role = role
+        self.expires = expires
+        self.revoked = False
+
+    @property
+    def is_logged_in(self):
+        return not self.revoked and time.time() < self.expires
+
+    def has_permission(self, action):
+        return role_permits(self.role, action)
+
+
+def _expires_of(token):
+    try:
+        return int(token.split('.', 1)[0], 16)
+    except ValueError:
+        return None
+
+def _key(token, expires):
+    return (expires, hashlib.sha256(token.encode()).hexdigest())
+
+
+class SessionManager:
+    """Tạo, tra cứu và thu hồi phiên; cache các phiên đang dùng trong bộ nhớ (LRU)"""
+
+    def __init__(self, accounts_root=None, transaction_manager=None, ttl=DEFAULT_TTL,
+                 max_cached=DEFAULT_CACHED_SESSIONS):
+        self.accounts_root = accounts_root
+        if transaction_manager is None:
+            jar = getattr(accounts_root, '_p_jar', None)
+            transaction_manager = jar.transaction_manager if jar is not None else transaction.manager
+        self.transaction_manager = transaction_manager
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # token -> Session
+        self._lock = threading.Lock()
+
+    def _store(self):
+        if self.accounts_root is None:
+            return None
+        return self.accounts_root.get(SESSIONS_KEY)
+
+    def _remember(self, session):
+        with self._lock:
+            self._cache[session.token] = session
+            self._cache.move_to_end(session.token)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    @retry_on_conflict(name='create_session', manager=own_manager)
+    def create(self, user):
+        """Mở phiên mới cho user (đã kiểm tra mật khẩu), trả về Session"""
+        expires = int(time.time() + self.ttl)
+        token = f"{expires:x}.{secrets.token_urlsafe(24)}"
+        store = self._store()
+        if store is not None:
+            self.transaction_manager.begin()
+            store[_key(token, expires)] = (user.username, user.role)
+            self.transaction_manager.commit()
+        session = Session(token, user.username, user.role, expires)
+        self._remember(session)
+        return session
+
+    def get(self, token):
+        """Session còn hiệu lực của token hoặc None; chỉ đọc ZODB khi không có trong cache"""
+        with self._lock:
+            session = self._cache.get(token)
+            if session is not None:
+                self._cache.move_to_end(token)
+        if session is None:
+            expires = _expires_of(token)
+            store = self._store()
+            if expires is None or store is None:
+                return None
+            record = store.get(_key(token, expires))
+            if record is None:
+                return None
+            session = Session(token, record[0], record[1], expires)
+            self._remember(session)
+        return session if session.is_logged_in else None
+
+    @retry_on_conflict(name='revoke_session', manager=own_manager)
+    def revoke(self, session):
+        """Đăng xuất: thu hồi phiên trong bộ nhớ và xóa bản lưu"""
+        session.revoked = True
+        with self._lock:
+            self._cache.pop(session.token, None)
+        store = self._store()
+        if store is None:
+            return
+        self.transaction_manager.begin()
+        key = _key(session.token, session.expires)
+        if key in store:
+            del store[key]
+            self.transaction_manager.commit()
+        else:
+            self.transaction_manager.abort()
+
+    @retry_on_conflict(name='purge_sessions', manager=own_manager)
+    def purge_expired(self, now=None):
+        """Xóa các phiên đã hết hạn khỏi BTree, trả về số phiên đã xóa"""
+        store = self._store()
+        if store is None:
+            return 0
+        now = int(time.time() if now is None else now)
+        self.transaction_manager.begin()
+        # (now,) nhỏ hơn mọi khóa (now, hash): chỉ lấy các phiên hết hạn trước now
+        expired = list(store.keys(max=(now,)))
+        for key in expired:
+            del store[key]
+        if expired:
+            self.transaction_manager.commit()
+        else:
+            self.transaction_manager.abort()
+        return len(expired)
+
+    def active_usernames(self, now=None):
+        """Tên người dùng đang có phiên còn hạn (cho báo cáo)"""
+        store = self._store()
+        if store is None:
+            return set()
+        now = int(time.time() if now is None else now)
+        return {username for username, _ in store.values(min=(now,))}
@@ -0,0 +1,147 @@
+from bisect import bisect_right
+from itertools import islice
+from BTrees.OOBTree import OOBTree
+from models.user import User
+from models.book_index import BookIndex, PendingRequestIndex, INDEX_KEY, PENDING_KEY
+from models.search_index import SearchIndex, SEARCH_KEY
+from sessions import SESSIONS_KEY
+
+BOOKS_KEY = 'books'
+USERS_KEY = 'users'
+PAGE_SIZE = 20
+# Số phần tử mỗi đoạn khi duyệt cả catalog (báo cáo, xuất dữ liệu)
+REPORT_CHUNK_SIZE = 500
+
+def is_btree_catalog(catalog):
+    """Kiểm tra catalog đã dùng OOBTree chưa"""
+    return isinstance(catalog, OOBTree)
+
+def ensure_books_catalog(books_root):
+    """Tạo catalog sách (OOBTree) nếu chưa có, trả về True nếu có thay đổi"""
+    if BOOKS_KEY in books_root:
+        return False
+    # OOBTree lưu sách theo từng bucket nên thêm/xóa một đầu sách chỉ ghi lại
+    # bucket chứa nó, và ZODB tự giải quyết xung đột khi hai admin thêm hai
+    # đầu sách khác nhau cùng lúc
+    books_root[BOOKS_KEY] = OOBTree()
+    return True
+
+def ensure_book_index(books_root):
+    """Xây chỉ mục phụ từ catalog hiện có nếu chưa có, trả về True nếu có thay đổi"""
+    if INDEX_KEY in books_root:
+        return False
+    index = books_root[INDEX_KEY] = BookIndex()
+    # Chỉ chạy một lần: từ đó chỉ mục được cập nhật cùng transaction với sách
+    for book in books_root[BOOKS_KEY].values():
+        index.index_book(book)
+    return True
+
+def ensure_pending_index(books_root):
+    """Xây chỉ mục yêu cầu mượn đang chờ duyệt nếu chưa có"""
+    if PENDING_KEY in books_root:
+        return False
+    return rebuild_pending_index(books_root)
+
+def rebuild_pending_index(books_root):
+    """Xây lại chỉ mục yêu cầu mượn từ catalog (migrate_storage.py dùng khi chỉ mục còn thời gian dạng chuỗi cũ)"""
+    index = books_root[PENDING_KEY] = PendingRequestIndex()
+    for title, book in books_root[BOOKS_KEY].items():
+        for username, request_time in book.get_pending_requests():
+            index.add(title, username, request_time)
+    return True
+
+def ensure_search_index(books_root):
+    """Xây chỉ mục tìm kiếm tên sách/tác giả nếu chưa có"""
+    if SEARCH_KEY in books_root:
+        return False
+    index = books_root[SEARCH_KEY] = SearchIndex()
+    for book in books_root[BOOKS_KEY].values():
+        index.index_book(book)
+    return True
+
+def ensure_accounts_catalog(accounts_root):
+    """Tạo catalog tài khoản (OOBTree) và admin mặc định nếu chưa có"""
+    if USERS_KEY in accounts_root:
+        return False
+    users = accounts_root[USERS_KEY] = OOBTree()
+    # Tạo tài khoản admin mặc định
+    users['admin'] = User('admin', 'admin123', role='admin')
+    return True
+
+def ensure_session_store(accounts_root):
+    """Tạo BTree lưu phiên đăng nhập (xem sessions.py) nếu chưa có"""
+    if SESSIONS_KEY in accounts_root:
+        return False
+    accounts_root[SESSIONS_KEY] = OOBTree()
+    return True
+
+def _sorted_keys(catalog):
+    """Khóa đã sắp xếp của catalog PersistentMapping cũ (chưa chạy migrate_storage.py).
+
+    Chỉ sắp xếp một lần rồi giữ trong thuộc tính _v_: ZODB tự bỏ thuộc tính
+    này khi catalog bị invalidation do client khác ghi. Khi chính client này
+    đang sửa catalog (chưa commit) thì sắp xếp lại, không lưu.
+    """
+    keys = getattr(catalog, '_v_sorted_keys', None)
+    if keys is None or getattr(catalog, '_p_changed', True):
+        keys = sorted(catalog.keys())
+        if getattr(catalog, '_p_changed', True) is False:
+            catalog._v_sorted_keys = keys
+        elif hasattr(catalog, '_v_sorted_keys'):
+            # Thay đổi cục bộ không gây invalidation khi commit: bỏ bản cũ
+            del catalog._v_sorted_keys
+    return keys
+
+def catalog_page(catalog, cursor=None, page_size=PAGE_SIZE):
+    """Lấy một trang (key, value) đứng sau cursor, trả về (items, next_cursor)"""
+    if is_btree_catalog(catalog):
+        # Chỉ duyệt các bucket chứa trang cần lấy, không tải các sách khác
+        if cursor is None:
+            items = catalog.items()
+        else:
+            items = catalog.items(min=cursor, excludemin=True)
+    else:
+        keys = _sorted_keys(catalog)
+        start = 0 if cursor is None else bisect_right(keys, cursor)
+        items = ((key, catalog[key]) for key in keys[start:start + page_size + 1])
+    page = list(islice(items, page_size + 1))
+    if len(page) > page_size:
+        return page[:page_size], page[page_size - 1][0]
+    return page, None
+
+def catalog_keys(catalog, after=None, last=None):
+    """Các khóa lớn hơn after và không lớn hơn last (None = không giới hạn)"""
+    if is_btree_catalog(catalog):
+        # Chỉ duyệt các bucket của khoảng cần lấy
+        bounds = {}
+        if after is not None:
+            bounds.update(min=after, excludemin=True)
+        if last is not None:
+            bounds['max'] = last
+        return list(catalog.keys(**bounds))
+    keys = _sorted_keys(catalog)
+    start = 0 if after is None else bisect_right(keys, after)
+    end = len(keys) if last is None else bisect_right(keys, last)
+    return keys[start:end]
+
+def iter_catalog(catalog, jar, chunk_size=REPORT_CHUNK_SIZE, prefetch=()):
+    """Duyệt cả catalog theo từng đoạn chunk_size phần tử, trả về (key, value).
+
+    Đối tượng của mỗi đoạn được nạp trước bằng một lượt Connection.prefetch
+    thay vì mỗi đối tượng một lần hỏi server; prefetch là các hàm value ->
+    đối tượng con cần nạp tiếp (ví dụ lambda book: book.queue), nạp theo
+    thứ tự. Cache của connection được dọn sau mỗi đoạn nên bộ nhớ không
+    tăng theo kích thước catalog.
+    """
+    cursor = None
+    while True:
+        items, cursor = catalog_page(catalog, cursor, chunk_size)
+        objects = [value for _, value in items]
+        jar.prefetch(objects)
+        for child in prefetch:
+            objects = [obj for obj in map(child, objects) if getattr(obj, '_p_oid', None) is not None]
+            jar.prefetch(objects)
+        yield from items
+        if cursor is None:
+            return
+        jar.cacheMinimize()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit  # noqa: E402
+from audit import IndexedLog, RotationPolicy  # noqa: E402
+
+
+def record(name, ts, op='borrow'):
+    return ts, audit.encode({'ts': ts, 'time': '', 'level': 'INFO', 'user': name,
+                             'op': op, 'title': None, 'actor': name, 'message': f"{op} {ts}"})
+
+
+def write(log_dir, name, timestamps, policy=None, batch=1):
+    log = IndexedLog(str(log_dir), name, policy)
+    try:
+        for i in range(0, len(timestamps), batch):
+            log.append([record(name, ts) for ts in timestamps[i:i + batch]])
+    finally:
+        log.close()
+
+
+def ts_of(records):
+    return [r['ts'] for r in records]
+
+
+def test_tail_and_time_range_use_the_index(tmp_path):
+    write(tmp_path, 'an', [float(t) for t in range(100, 200)], batch=7)
+    assert ts_of(audit.tail(str(tmp_path), 'an', 3)) == [197.0, 198.0, 199.0]
+    assert ts_of(audit.time_range(str(tmp_path), 'an', 150, 153)) == [150.0, 151.0, 152.0, 153.0]
+    assert len(list(audit.time_range(str(tmp_path), 'an'))) == 100
+    assert audit.tail(str(tmp_path), 'nobody', 5) == []
+
+
+def test_reads_span_rotated_segments(tmp_path):
+    policy = RotationPolicy(max_bytes=1000, max_age=0, retention=0, keep=0)
+    write(tmp_path, 'an', [float(t) for t in range(100, 160)], policy)
+    segments = audit.segments(str(tmp_path), 'an')
+    assert len(segments) > 2
+    assert all(path.endswith('.jsonl.gz') for _, path in segments)
+
+    everything = list(audit.time_range(str(tmp_path), 'an'))
+    assert ts_of(everything) == [float(t) for t in range(100, 160)]
+    # A range starting inside a middle segment skips the older ones
+    middle = segments[1][0]
+    assert ts_of(audit.time_range(str(tmp_path), 'an', middle + 1, middle + 3)) == [middle + 1, middle + 2, middle + 3]
+    assert ts_of(audit.tail(str(tmp_path), 'an', 40)) == [float(t) for t in range(120, 160)]
+
+
+def test_prune_keeps_the_newest_segments(tmp_path):
+    policy = RotationPolicy(max_bytes=1000, max_age=0, retention=0, keep=2)
+    write(tmp_path, 'an', [float(t) for t in range(100, 200)], policy)
+    assert len(audit.segments(str(tmp_path), 'an')) == 2
+    # Retention drops segments by age, for every name in the directory
+    for _, path in audit.segments(str(tmp_path), 'an'):
+        os.utime(path, (0, 0))
+    audit.prune_all(str(tmp_path), RotationPolicy(retention=3600, keep=0))
+    assert audit.segments(str(tmp_path), 'an') == []
+    assert audit.tail(str(tmp_path), 'an', 1)[0]['ts'] == 199.0
+
+
+def test_query_merges_per_user_logs(tmp_path):
+    write(tmp_path, 'an', [1.0, 3.0, 5.0])
+    write(tmp_path, 'binh', [2.0, 4.0, 6.0])
+    log_dir = str(tmp_path)
+    assert ts_of(audit.query(log_dir, users=['an', 'binh'])) == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert ts_of(audit.query(log_dir, users=['an', 'binh'], limit=3)) == [4.0, 5.0, 6.0]
+    assert ts_of(audit.query(log_dir, start=2.5, end=5.0, users=['binh', 'an'])) == [3.0, 4.0, 5.0]
+    # Names that could leave the log directory are ignored
+    assert audit.query(log_dir, users=['../an', audit.AUDIT_NAME]) == []
+
+
+def test_max_age_rotates_old_files(tmp_path):
+    old = time.time() - 7200
+    write(tmp_path, 'an', [old, old + 1])
+    write(tmp_path, 'an', [time.time()], RotationPolicy(max_bytes=0, max_age=3600, retention=0, keep=0))
+    assert len(audit.segments(str(tmp_path), 'an')) == 1
+    assert len(list(audit.time_range(str(tmp_path), 'an'))) == 3
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.book import STATE_VERSION, Book  # noqa: E402
+from models.timestamps import format_timestamp, parse_timestamp  # noqa: E402
+
+LEGACY_DATE = '2024-03-04 05:06:07'
+
+
+def legacy_state(**changes):
+    """State as stored before the compact format: every attribute, string dates"""
+    state = {'title': 'Sách', 'author': 'Tác giả', 'available': True, 'borrower': None,
+             'borrow_date': None, 'pending_requests': [], '_is_locked': False, '_lock_holder': None}
+    state.update(changes)
+    return state
+
+
+def test_compact_state_leaves_out_defaults():
+    book = Book('Sách', 'Tác giả')
+    state = book.__getstate__()
+    assert state['_version'] == STATE_VERSION
+    assert not {'borrower', 'borrow_date', 'pending_requests'} & set(state)
+    copy = Book.__new__(Book)
+    copy.__setstate__(dict(state))
+    assert copy.borrower is None and copy.pending_requests == ()
+    assert not copy.needs_upgrade()
+
+
+def test_legacy_state_is_upgraded_on_load():
+    book = Book.__new__(Book)
+    book.__setstate__(legacy_state(available=False, borrower='an', borrow_date=LEGACY_DATE,
+                                   pending_requests=[('binh', LEGACY_DATE)]))
+    assert book.borrow_date == parse_timestamp(LEGACY_DATE)
+    assert format_timestamp(book.borrow_date) == LEGACY_DATE
+    assert book.pending_requests == (('binh', parse_timestamp(LEGACY_DATE)),)
+    assert '_is_locked' not in book.__dict__
+    assert book.needs_upgrade()
+
+
+def test_conflict_between_legacy_and_compact_states_is_resolved():
+    committed = Book('Sách', 'Tác giả')
+    committed.pending_requests = (('an', 100),)
+    new = Book('Sách', 'Tác giả')
+    new.pending_requests = (('binh', 50),)
+    # Stored states refer to the same queue record
+    new.queue = committed.queue
+    old = legacy_state(queue=committed.queue)
+    resolved = Book('Sách', 'Tác giả')._p_resolveConflict(old, committed.__getstate__(), new.__getstate__())
+    assert resolved['pending_requests'] == (('binh', 50), ('an', 100))
+    assert resolved['_version'] == STATE_VERSION
+    assert '_is_locked' not in resolved and 'borrower' not in resolved
@@ -0,0 +1,139 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import transaction  # noqa: E402
+import ZEO  # noqa: E402
+from BTrees.OOBTree import OOBTree  # noqa: E402
+
+import utils  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.book_index import BookIndex, PendingRequestIndex, get_book_index  # noqa: E402
+from storage import BOOKS_KEY, ensure_book_index, ensure_pending_index  # noqa: E402
+
+N_BOOKS = 20
+
+
+@pytest.fixture
+def zeo_db(tmp_path, monkeypatch):
+    """DB factory connected to a FileStorage-backed ZEO server"""
+    # Activity logs go to tmp_path/logs instead of the working tree
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    address, stop = ZEO.server(path=str(tmp_path / 'books.fs'))
+    dbs = []
+
+    def open_db():
+        db = ZEO.DB(address)
+        dbs.append(db)
+        return db
+
+    db = open_db()
+    with db.transaction() as connection:
+        root = connection.root()
+        books = root[BOOKS_KEY] = OOBTree()
+        for i in range(N_BOOKS):
+            title = f"Sách {i:02d}"
+            books[title] = Book(title, "Tác giả")
+        ensure_book_index(root)
+        ensure_pending_index(root)
+    yield open_db
+    utils.flush_logs()
+    for db in dbs:
+        db.close()
+    stop()
+
+
+def open_client(db):
+    tm = transaction.TransactionManager()
+    return tm, db.open(transaction_manager=tm).root()
+
+
+def test_borrows_of_different_books_in_one_bucket_do_not_conflict(zeo_db):
+    tm1, root1 = open_client(zeo_db())
+    tm2, root2 = open_client(zeo_db())
+    assert root1[BOOKS_KEY]["Sách 03"].borrow("an")[0]
+    assert root2[BOOKS_KEY]["Sách 07"].borrow("binh")[0]
+    tm1.commit()
+    # Both books share the index buckets: this commit needs conflict resolution
+    tm2.commit()
+
+    index = get_book_index(open_client(zeo_db())[1])
+    assert index.titles_borrowed_by("an") == ["Sách 03"]
+    assert index.titles_borrowed_by("binh") == ["Sách 07"]
+    assert len(index.available_titles()) == N_BOOKS - 2
+
+    # Returning one book while another is borrowed resolves the same way
+    tm1.begin()
+    tm2.begin()
+    assert root1[BOOKS_KEY]["Sách 03"].return_book()[0]
+    assert root2[BOOKS_KEY]["Sách 11"].borrow("chi")[0]
+    tm1.commit()
+    tm2.commit()
+    # A new client: invalidations reach existing ones asynchronously
+    index = get_book_index(open_client(zeo_db())[1])
+    assert index.titles_borrowed_by("an") == []
+    assert index.titles_borrowed_by("chi") == ["Sách 11"]
+    assert index.entries["Sách 03"] == ("Tác giả", '', True)
+
+
+def test_legacy_none_borrowers_are_rewritten():
+    index = BookIndex()
+    book = Book("Sách", "Tác giả")
+    index.index_book(book)
+    index.entries["Sách"] = ("Tác giả", None, True)
+    assert index.upgrade_entries() == 1
+    assert index.entries["Sách"] == ("Tác giả", '', True)
+    assert index.upgrade_entries() == 0
+    book.available = False
+    book.borrower = "an"
+    index.index_book(book)
+    assert index.titles_borrowed_by("an") == ["Sách"]
+    assert index.available_titles() == []
+
+
+def test_index_follows_a_book_through_borrow_and_return():
+    index = BookIndex()
+    book = Book("Sách", "Tác giả")
+    index.index_book(book)
+    assert index.available_titles() == ["Sách"]
+    assert index.titles_by_author("Tác giả") == ["Sách"]
+
+    book.available, book.borrower = False, "an"
+    index.index_book(book)
+    assert index.available_titles() == []
+    assert index.titles_borrowed_by("an") == ["Sách"]
+
+    book.borrower = "binh"
+    index.index_book(book)
+    assert index.titles_borrowed_by("an") == []
+    assert index.titles_borrowed_by("binh") == ["Sách"]
+
+    book.available, book.borrower = True, None
+    index.index_book(book)
+    assert index.titles_borrowed_by("binh") == []
+    assert index.available_titles() == ["Sách"]
+
+    index.unindex_book("Sách")
+    assert index.titles_by_author("Tác giả") == []
+    assert index.available_titles() == []
+    assert "Sách" not in index.entries
+
+
+def test_pending_requests_are_ordered_by_time():
+    index = PendingRequestIndex()
+    index.add("B", "an", 30)
+    index.add("A", "binh", 10)
+    index.add("A", "chi", 20)
+    index.add("A", "binh", 99)  # already pending: the first request time stays
+    assert index.requests() == [("A", "binh", 10), ("A", "chi", 20), ("B", "an", 30)]
+    index.remove("A", "binh")
+    index.remove("A", "nobody")
+    assert index.requests() == [("A", "chi", 20), ("B", "an", 30)]
+    assert not index.has_legacy_times()
+    legacy = PendingRequestIndex()
+    assert not legacy.has_legacy_times()
+    legacy.add("C", "dung", "2024-01-01 00:00:00")
+    assert legacy.has_legacy_times()
@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BTrees.LLBTree import LLTreeSet  # noqa: E402
+from BTrees.LOBTree import LOBTree  # noqa: E402
+from BTrees.OLBTree import OLBTree  # noqa: E402
+
+from models.book_queue import BookQueue, INBOX_LIMIT, QUEUE_VERSION  # noqa: E402
+
+
+def assert_matches(queue, expected):
+    assert [user for user, _ in queue.waiting_list] == expected
+    assert len(queue) == len(expected)
+    for position, user in enumerate(expected, 1):
+        assert queue.get_queue_position(user)[0] == position
+    assert queue.first() == (expected[0] if expected else None)
+
+
+def test_positions_after_many_middle_removals():
+    rng = random.Random(7)
+    queue = BookQueue()
+    expected = []
+    for i in range(300):
+        queue.enqueue(f"u{i}")
+        expected.append(f"u{i}")
+    for _ in range(200):
+        user = rng.choice(expected[1:])
+        assert queue.remove_from_queue(user)
+        expected.remove(user)
+        if rng.random() < 0.3:
+            assert queue.remove_from_queue(expected[0])
+            del expected[0]
+        if rng.random() < 0.5:
+            user = f"late{rng.randrange(10 ** 6)}"
+            if queue.enqueue(user) is not None:
+                expected.append(user)
+    assert_matches(queue, expected)
+
+
+def test_middle_removal_does_not_renumber():
+    queue = BookQueue()
+    for i in range(1000):
+        queue.enqueue(f"u{i}")
+    queue._fold()
+    before = dict(queue._members.items())
+    assert queue.remove_from_queue("u500")
+    del before["u500"]
+    # Entries behind the removed one keep their seqs
+    assert dict(queue._members.items()) == before
+    # The gap is recorded in O(log n) Fenwick nodes
+    assert len(queue._removed) <= queue._capacity.bit_length()
+    assert queue.get_queue_position("u501")[0] == 501
+    assert queue.get_queue_position("u999")[0] == 999
+    # Emptying the queue drops the gap tree
+    for i in range(1000):
+        queue.remove_from_queue(f"u{i}")
+    assert len(queue) == 0
+    assert queue._removed is None
+
+
+def test_middle_removal_with_unfolded_inbox():
+    queue = BookQueue()
+    users = [f"u{i}" for i in range(INBOX_LIMIT + 5)]
+    for user in users:
+        queue.enqueue(user)
+    queue.remove_from_queue(users[3])
+    users.remove(users[3])
+    queue.enqueue("last")
+    users.append("last")
+    assert_matches(queue, users)
+
+
+def test_legacy_gaps_are_renumbered_on_load():
+    entries = LOBTree({0: ('a', 1), 2: ('b', 2), 5: ('c', 3)})
+    members = OLBTree({'a': 0, 'b': 2, 'c': 5})
+    queue = BookQueue.__new__(BookQueue)
+    queue.__setstate__({'_entries': entries, '_members': members,
+                        '_skipped': LLTreeSet([1, 3, 4]), '_next_seq': 6})
+    assert_matches(queue, ['a', 'b', 'c'])
+    assert queue._v_upgraded
+    assert '_skipped' not in queue.__dict__
+
+
+def test_formatted_timestamps_become_epoch_seconds_on_load():
+    entries = LOBTree({0: ('a', '2024-01-02 03:04:05'), 1: ('b', '2024-01-02 03:05:00')})
+    members = OLBTree({'a': 0, 'b': 1})
+    queue = BookQueue.__new__(BookQueue)
+    queue.__setstate__({'_entries': entries, '_members': members, '_next_seq': 2,
+                        '_inbox': (('c', '2024-01-02 04:00:00'),)})
+    assert_matches(queue, ['a', 'b', 'c'])
+    assert all(isinstance(timestamp, int) for _, timestamp in queue.waiting_list)
+    assert queue._version == QUEUE_VERSION
+    assert queue._v_upgraded
+    assert '2024-01-02 03:04:05' in queue.get_queue_info()
@@ -0,0 +1,134 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import transaction  # noqa: E402
+from ZODB import DB  # noqa: E402
+from ZODB.FileStorage import FileStorage  # noqa: E402
+from ZODB.POSException import ConflictError  # noqa: E402
+
+import utils  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.book_queue import BookQueue  # noqa: E402
+from models.conflict import merge_states, merge_timeline  # noqa: E402
+
+
+def test_timeline_keeps_both_additions_in_time_order():
+    old = [('an', 1)]
+    committed = [('an', 1), ('chi', 5)]
+    new = [('an', 1), ('binh', 3)]
+    assert merge_timeline(old, committed, new) == [('an', 1), ('binh', 3), ('chi', 5)]
+    # Resolving from either side gives the same list
+    assert merge_timeline(old, new, committed) == merge_timeline(old, committed, new)
+
+
+def test_timeline_removal_on_one_side_wins():
+    old = [('an', 1), ('binh', 2)]
+    committed = [('binh', 2)]
+    new = [('an', 1), ('binh', 2), ('chi', 3)]
+    assert merge_timeline(old, committed, new) == [('binh', 2), ('chi', 3)]
+
+
+def test_timeline_keeps_a_user_once_with_the_earliest_entry():
+    assert merge_timeline([], [('an', 4)], [('an', 2), ('binh', 3)]) == [('an', 2), ('binh', 3)]
+
+
+def test_states_take_the_side_that_changed():
+    old = {'a': 1, 'b': 1}
+    resolved = merge_states(old, {'a': 2, 'b': 1}, {'a': 1, 'b': 3, 'c': 4})
+    assert resolved == {'a': 2, 'b': 3, 'c': 4}
+    # The same change on both sides is not a conflict
+    assert merge_states(old, {'a': 2, 'b': 1}, {'a': 2, 'b': 1}) == {'a': 2, 'b': 1}
+    # An attribute removed on one side stays removed
+    assert merge_states(old, {'a': 1}, {'a': 1, 'b': 1}) == {'a': 1}
+
+
+def test_states_merge_timelines_and_keep_their_type():
+    old = {'requests': (('an', 1),)}
+    committed = {'requests': (('an', 1), ('binh', 2))}
+    new = {'requests': (('an', 1), ('chi', 3))}
+    resolved = merge_states(old, committed, new, timelines=('requests',))
+    assert resolved == {'requests': (('an', 1), ('binh', 2), ('chi', 3))}
+
+
+def test_different_changes_to_one_attribute_conflict():
+    with pytest.raises(ConflictError):
+        merge_states({'borrower': None}, {'borrower': 'an'}, {'borrower': 'binh'})
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Book operations log to ./logs
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    db = DB(FileStorage(str(tmp_path / 'books.fs')))
+    with db.transaction() as connection:
+        book = connection.root()['book'] = Book('Sách', 'Tác giả')
+        book.queue.enqueue('an')
+    yield db
+    utils.flush_logs()
+    db.close()
+
+
+def two_clients(db):
+    clients = []
+    for _ in range(2):
+        tm = transaction.TransactionManager()
+        clients.append((tm, db.open(transaction_manager=tm).root()['book']))
+    return clients
+
+
+def test_concurrent_borrow_requests_are_merged_by_the_storage(db):
+    (tm1, book1), (tm2, book2) = two_clients(db)
+    assert book1.request_borrow('binh')[0]
+    assert book2.request_borrow('chi')[0]
+    tm1.commit()
+    tm2.commit()
+    with db.transaction() as connection:
+        users = [user for user, _ in connection.root()['book'].get_pending_requests()]
+    assert sorted(users) == ['binh', 'chi']
+
+
+def test_concurrent_enqueues_are_merged_by_the_storage(db):
+    (tm1, book1), (tm2, book2) = two_clients(db)
+    assert book1.queue.enqueue('binh') == 2
+    assert book2.queue.enqueue('chi') == 2
+    tm1.commit()
+    tm2.commit()
+    with db.transaction() as connection:
+        queue = connection.root()['book'].queue
+        assert isinstance(queue, BookQueue)
+        assert queue.first() == 'an'
+        assert sorted(user for user, _ in queue.waiting_list[1:]) == ['binh', 'chi']
+
+
+def test_concurrent_borrows_of_one_book_conflict(db):
+    with db.transaction() as connection:
+        connection.root()['book'].queue.remove_from_queue('an')
+    (tm1, book1), (tm2, book2) = two_clients(db)
+    assert book1.borrow('binh')[0]
+    assert book2.borrow('chi')[0]
+    tm1.commit()
+    with pytest.raises(ConflictError):
+        tm2.commit()
+    tm2.abort()
+
+
+def test_queue_that_drops_its_gap_tree_merges_with_an_enqueue():
+    queue = BookQueue()
+    for user in ('an', 'binh', 'chi'):
+        queue.enqueue(user)
+    queue.remove_from_queue('binh')
+    old = queue.__getstate__()
+    emptied = BookQueue()
+    emptied.__setstate__(dict(old))
+    emptied.remove_from_queue('an')
+    emptied.remove_from_queue('chi')
+    joined = BookQueue()
+    joined.__setstate__(dict(old))
+    joined.enqueue('dung')
+    resolved = queue._p_resolveConflict(old, emptied.__getstate__(), joined.__getstate__())
+    assert '_removed' not in resolved and '_capacity' not in resolved
+    assert [user for user, _ in resolved['_inbox']] == ['dung']
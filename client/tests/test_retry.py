@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transaction  # noqa: E402
+from ZODB.POSException import ConflictError  # noqa: E402
+
+from retry import RetryPolicy, own_manager, retry_on_conflict  # noqa: E402
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0)
+
+
+class RecordingManager(transaction.TransactionManager):
+    def __init__(self):
+        super().__init__()
+        self.aborts = 0
+
+    def abort(self):
+        self.aborts += 1
+        super().abort()
+
+
+def flaky(conflicts):
+    """Function raising ConflictError on its first `conflicts` calls"""
+    calls = []
+
+    def func(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= conflicts:
+            raise ConflictError()
+        return len(calls)
+    return func
+
+
+def test_explicit_manager_is_resynced():
+    manager = RecordingManager()
+    wrapped = retry_on_conflict(flaky(2), policy=FAST, manager=manager)
+    assert wrapped() == 3
+    assert manager.aborts == 2
+
+
+def test_manager_of_the_called_object():
+    class Service:
+        def __init__(self):
+            self.transaction_manager = RecordingManager()
+            self.call = flaky(1)
+
+        @retry_on_conflict(policy=FAST, manager=own_manager)
+        def run(self, value):
+            return self.call(value)
+
+    service = Service()
+    assert service.run('x') == 2
+    assert service.transaction_manager.aborts == 1
+
+
+def test_plain_function_is_not_mistaken_for_a_method():
+    policy_manager = RecordingManager()
+    other = RecordingManager()
+
+    class Holder:
+        transaction_manager = other
+
+    wrapped = retry_on_conflict(flaky(1), policy=RetryPolicy(base_delay=0, transaction_manager=policy_manager))
+    assert wrapped(Holder()) == 2
+    assert policy_manager.aborts == 1
+    assert other.aborts == 0
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import search_index  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.search_index import SearchIndex, normalize, tokenize  # noqa: E402
+
+
+def build(*books):
+    index = SearchIndex()
+    for title, author in books:
+        index.index_book(Book(title, author))
+    return index
+
+
+def test_normalize_strips_diacritics_and_d_stroke():
+    assert normalize("Đắc Nhân Tâm") == "dac nhan tam"
+    assert normalize("ĐƯỜNG XƯA MÂY TRẮNG") == "duong xua may trang"
+    assert tokenize("Dế Mèn phiêu lưu ký!") == ["de", "men", "phieu", "luu", "ky"]
+
+
+def test_search_ignores_diacritics_and_matches_prefixes():
+    index = build(("Đắc Nhân Tâm", "Dale Carnegie"), ("Dế Mèn phiêu lưu ký", "Tô Hoài"),
+                  ("Nhà giả kim", "Paulo Coelho"))
+    assert index.search("dac nhan") == ["Đắc Nhân Tâm"]
+    assert index.search("de men") == ["Dế Mèn phiêu lưu ký"]
+    assert index.search("to hoa") == ["Dế Mèn phiêu lưu ký"]
+    assert index.search("nha", prefix=False) == ["Nhà giả kim"]
+    assert index.search("nhan", prefix=False) == ["Đắc Nhân Tâm"]
+    assert index.search("khong co") == []
+
+
+def test_title_matches_rank_before_author_matches():
+    index = build(("Hoài niệm", "Nguyễn Văn A"), ("Sống", "Tô Hoài"))
+    assert index.search("hoai") == ["Hoài niệm", "Sống"]
+
+
+def test_limit_zero_or_negative_returns_nothing():
+    index = build(("Sách", "Tác giả"))
+    for limit in (0, -1):
+        results = index.search("sach", limit=limit)
+        assert results == [] and not results.truncated
+
+
+def test_prefix_expansion_is_capped_and_reported(monkeypatch):
+    monkeypatch.setattr(search_index, 'MAX_PREFIX_TERMS', 3)
+    index = build(*[(f"Sách a{i}", "Tác giả") for i in range(5)])
+    results = index.search("a", limit=10)
+    assert results.truncated
+    assert sorted(results) == ["Sách a0", "Sách a1", "Sách a2"]
+    assert not index.search("a4").truncated
+
+
+def test_unindex_removes_empty_postings():
+    index = build(("Sách riêng", "Tác giả"), ("Sách chung", "Tác giả"))
+    index.unindex_book("Sách riêng")
+    assert "rieng" not in index.postings
+    assert index.search("sach") == ["Sách chung"]
+    index.unindex_book("Không có")
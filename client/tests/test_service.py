@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import transaction  # noqa: E402
+from ZODB import DB  # noqa: E402
+from ZODB.MappingStorage import MappingStorage  # noqa: E402
+
+from locks import LocalLeaseLockService, set_lock_service  # noqa: E402
+from models.book import Book  # noqa: E402
+from service import BUSY_MESSAGE, LibraryService  # noqa: E402
+
+
+class RecordingLeases(LocalLeaseLockService):
+    """Reads the committed book from another connection when a lease is released"""
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.seen_at_release = []
+
+    def release(self, key, holder):
+        with self.db.transaction() as connection:
+            self.seen_at_release.append(connection.root()['books'][key].borrower)
+        super().release(key, holder)
+
+
+@pytest.fixture
+def db():
+    db = DB(MappingStorage())
+    tm = transaction.TransactionManager()
+    root = db.open(transaction_manager=tm).root()
+    service = LibraryService(books_root=root)
+    service.prepare_books()
+    with db.transaction() as connection:
+        connection.root()['books']['Sách'] = Book('Sách', 'Tác giả')
+    yield db
+    set_lock_service(None)
+    db.close()
+
+
+def open_service(db):
+    tm = transaction.TransactionManager()
+    return LibraryService(books_root=db.open(transaction_manager=tm).root())
+
+
+def test_lease_is_released_after_commit(db):
+    leases = RecordingLeases(db)
+    set_lock_service(leases)
+    assert open_service(db).borrow('Sách', 'an') == (True, "Mượn sách thành công")
+    # Another client taking the lease next already sees the borrow
+    assert leases.seen_at_release == ['an']
+
+
+def test_book_held_by_another_lease_is_busy(db):
+    leases = LocalLeaseLockService()
+    set_lock_service(leases)
+    assert leases.acquire('Sách', 'binh')
+    assert open_service(db).borrow('Sách', 'an') == (False, BUSY_MESSAGE)
+    leases.release('Sách', 'binh')
+    assert open_service(db).borrow('Sách', 'an')[0]
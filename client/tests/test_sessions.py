@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import transaction  # noqa: E402
+from ZODB import DB  # noqa: E402
+from ZODB.MappingStorage import MappingStorage  # noqa: E402
+
+from models.user import User  # noqa: E402
+from sessions import SessionManager  # noqa: E402
+from storage import ensure_accounts_catalog, ensure_session_store  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    db = DB(MappingStorage())
+    with db.transaction() as connection:
+        ensure_accounts_catalog(connection.root())
+        ensure_session_store(connection.root())
+    yield db
+    db.close()
+
+
+def manager(db, **options):
+    tm = transaction.TransactionManager()
+    return SessionManager(db.open(transaction_manager=tm).root(), **options)
+
+
+def test_session_is_found_by_another_client(db):
+    user = User('an', 'secret')
+    session = manager(db).create(user)
+    assert session.is_logged_in and session.has_permission('borrow')
+    assert not session.has_permission('add')
+    other = manager(db)
+    found = other.get(session.token)
+    assert (found.username, found.role) == ('an', user.role)
+    assert other.get('0.forged') is None
+    assert other.get('not a token') is None
+
+
+def test_revoked_session_is_gone_everywhere(db):
+    sessions = manager(db)
+    session = sessions.create(User('an', 'secret'))
+    sessions.revoke(session)
+    assert not session.is_logged_in
+    assert sessions.get(session.token) is None
+    assert manager(db).get(session.token) is None
+
+
+def test_expired_sessions_are_rejected_and_purged(db):
+    sessions = manager(db, ttl=60)
+    session = sessions.create(User('an', 'secret'))
+    keep = sessions.create(User('binh', 'secret'))
+    assert sessions.active_usernames() == {'an', 'binh'}
+    session.expires = time.time() - 1
+    assert sessions.get(session.token) is None
+    # Both stored sessions expire within the ttl
+    assert sessions.purge_expired(now=time.time() + 61) == 2
+    assert sessions.active_usernames() == set()
+    assert manager(db).get(keep.token) is None
+    assert sessions.purge_expired() == 0
+
+
+def test_cache_is_bounded(db):
+    sessions = manager(db, max_cached=2)
+    tokens = [sessions.create(User(f"u{i}", 'secret')).token for i in range(3)]
+    assert len(sessions._cache) == 2
+    # The evicted session is read back from the store
+    assert sessions.get(tokens[0]).username == 'u0'
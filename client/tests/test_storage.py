@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transaction  # noqa: E402
+from BTrees.OOBTree import OOBTree  # noqa: E402
+from persistent.mapping import PersistentMapping  # noqa: E402
+from ZODB import DB  # noqa: E402
+from ZODB.MappingStorage import MappingStorage  # noqa: E402
+
+from storage import catalog_keys, catalog_page  # noqa: E402
+
+
+def all_pages(catalog, page_size):
+    pages, cursor = [], None
+    while True:
+        page, cursor = catalog_page(catalog, cursor, page_size)
+        pages.append([key for key, _ in page])
+        if cursor is None:
+            return pages
+
+
+def test_legacy_catalog_pages_like_a_btree():
+    titles = [f"Sách {i:03d}" for i in range(95)]
+    legacy = PersistentMapping({title: i for i, title in enumerate(reversed(titles))})
+    tree = OOBTree(legacy)
+    assert all_pages(legacy, 20) == all_pages(tree, 20)
+    assert catalog_keys(legacy, "Sách 010", "Sách 020") == catalog_keys(tree, "Sách 010", "Sách 020")
+    assert catalog_keys(legacy, after="Sách 090") == catalog_keys(tree, after="Sách 090")
+
+
+def test_legacy_keys_are_sorted_once_until_the_catalog_changes():
+    db = DB(MappingStorage())
+    with db.transaction() as connection:
+        connection.root()['books'] = PersistentMapping({f"b{i:02d}": i for i in range(50)})
+    tm = transaction.TransactionManager()
+    catalog = db.open(transaction_manager=tm).root()['books']
+    catalog_page(catalog, None, 10)
+    keys = catalog._v_sorted_keys
+    catalog_page(catalog, "b09", 10)
+    assert catalog._v_sorted_keys is keys
+
+    # A change committed by another client invalidates the cached keys
+    with db.transaction() as connection:
+        connection.root()['books']['a'] = -1
+    tm.begin()
+    assert catalog_page(catalog, None, 1)[0] == [('a', -1)]
+
+    # Local changes are seen but not cached
+    catalog['0'] = 0
+    assert catalog_page(catalog, None, 1)[0] == [('0', 0)]
+    assert catalog_keys(catalog, last='a') == ['0', 'a']
+    tm.commit()
+    # Committing does not invalidate this connection's own copy
+    assert catalog_page(catalog, None, 1)[0] == [('0', 0)]
+    db.close()
@@ -0,0 +1,26 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+
+
+def test_first_log_call_prunes_on_the_listener_thread(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    utils.stop_logging()
+    threads = []
+    monkeypatch.setattr(utils, 'prune_all', lambda log_dir, policy: threads.append(threading.current_thread()))
+    try:
+        utils.log_event('an', 'borrow', "Mượn sách", title='Sách')
+        assert threads in ([], [utils._listener._thread])
+        utils.flush_logs()
+        assert threads == [utils._listener._thread]
+        utils.log_event('an', 'return_book', "Trả sách", title='Sách')
+        utils.flush_logs()
+        assert len(threads) == 1
+    finally:
+        utils.stop_logging()
+    assert (tmp_path / 'logs' / 'an.jsonl').exists()
@@ -1,13 +1,163 @@
+import atexit
 import logging
-import os
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from audit import AUDIT_NAME, IndexedLog, RotationPolicy, encode, prune_all
+
+LOG_DIR = 'logs'
+# Số file nhật ký người dùng được mở cùng lúc, file ít dùng nhất bị đóng trước
+MAX_OPEN_LOG_FILES = 64
+# Số bản ghi tối đa gom lại trước khi ghi
+BATCH_LIMIT = 256
+
+_log_queue = queue.Queue()
+# Dùng chung cho mọi file log; configure_logging thay đổi tại chỗ
+_policy = RotationPolicy()
+_listener = None
+_router = None
+_setup_lock = threading.Lock()
+
+
+class UserFileRouter(logging.Handler):
+    """Ghi bản ghi log vào nhật ký có cấu trúc (xem audit.py), chạy trong thread của QueueListener.
+
+    Mỗi bản ghi được ghi vào logs/<tên logger>.jsonl và logs/_audit.jsonl,
+    các file này được xoay và dọn theo policy.
+    Giữ tối đa max_open file người dùng đang mở (LRU) nên số user không giới
+    hạn số file descriptor. Bản ghi được gom lại và chỉ ghi khi hàng đợi đã
+    trống (hoặc lô đủ lớn), nên một loạt bản ghi liên tiếp chỉ tốn một lần
+    ghi cho mỗi file.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_open=MAX_OPEN_LOG_FILES, policy=None):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_open = max_open
+        self.policy = policy
+        self._files = OrderedDict()  # tên -> IndexedLog
+        self._audit = None
+        self._pending = {}  # tên -> [(ts, dòng JSON)]
+        self._pending_count = 0
+        self._pruned = False
+
+    def _file(self, name):
+        f = self._files.get(name)
+        if f is not None:
+            self._files.move_to_end(name)
+            return f
+        if len(self._files) >= self.max_open:
+            _, old = self._files.popitem(last=False)
+            old.close()
+        f = self._files[name] = IndexedLog(self.log_dir, name, self.policy)
+        return f
+
+    def emit(self, record):
+        try:
+            if not self._pruned and self.policy is not None:
+                # Dọn các đoạn hết hạn của cả những người dùng lâu không hoạt
+                # động, trong thread này thay vì thread gọi logger đầu tiên
+                self._pruned = True
+                prune_all(self.log_dir, self.policy)
+            line = encode({
+                'ts': record.created,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created)),
+                'level': record.levelname,
+                'user': record.name,
+                'op': getattr(record, 'op', None),
+                'title': getattr(record, 'title', None),
+                'actor': getattr(record, 'actor', None),
+                'message': record.getMessage(),
+            })
+            self._pending.setdefault(record.name, []).append((record.created, line))
+            self._pending_count += 1
+            if self._pending_count >= BATCH_LIMIT or _log_queue.empty():
+                self._write_pending()
+        except Exception:
+            self.handleError(record)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        if self._audit is None:
+            self._audit = IndexedLog(self.log_dir, AUDIT_NAME, self.policy)
+        everything = []
+        for name, records in self._pending.items():
+            self._file(name).append(records)
+            everything.extend(records)
+        everything.sort(key=lambda item: item[0])
+        self._audit.append(everything)
+        self._pending.clear()
+        self._pending_count = 0
+
+    def flush(self):
+        with self.lock:
+            self._write_pending()
+
+    def close(self):
+        with self.lock:
+            self._write_pending()
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            if self._audit is not None:
+                self._audit.close()
+                self._audit = None
+        super().close()
+
+
+def _start_listener():
+    global _listener, _router
+    with _setup_lock:
+        if _listener is None:
+            _router = UserFileRouter(policy=_policy)
+            _listener = logging.handlers.QueueListener(_log_queue, _router)
+            _listener.start()
+            atexit.register(stop_logging)
+
+def configure_logging(max_bytes=None, max_age=None, retention=None, keep=None):
+    """Đổi chính sách xoay/lưu giữ nhật ký (có hiệu lực cả khi logger đã chạy).
+
+    max_bytes: byte, max_age/retention: giây, keep: số đoạn giữ lại mỗi file;
+    None là giữ nguyên giá trị hiện tại, 0 là không giới hạn.
+    """
+    for name, value in (('max_bytes', max_bytes), ('max_age', max_age),
+                        ('retention', retention), ('keep', keep)):
+        if value is not None:
+            setattr(_policy, name, value)
+
+def flush_logs():
+    """Chờ mọi bản ghi đang trong hàng đợi được ghi xuống file"""
+    if _listener is not None:
+        _log_queue.join()
+        _router.flush()
+
+def stop_logging():
+    """Ghi nốt hàng đợi rồi đóng các file log (gọi khi thoát)"""
+    global _listener, _router
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _router.close()
+            _listener = _router = None
 
 def get_user_logger(username):
-    """Tạo logger cho user"""
+    """Tạo logger cho user.
+
+    Logger chỉ đưa bản ghi vào hàng đợi (không ghi file), một thread nền ghi
+    ra logs/<username>.jsonl. Nhờ vậy gọi logger trong lúc đang giữ khóa sách
+    không phải chờ đĩa.
+    """
+    _start_listener()
     logger = logging.getLogger(username)
     if not logger.handlers:
         logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(f'logs/{username}.log', encoding='utf-8')
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-    return logger 
\ No newline at end of file
+        logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    return logger
+
+def log_event(username, op, message, title=None, actor=None):
+    """Ghi một hoạt động của username kèm tên thao tác, sách và người thực hiện"""
+    get_user_logger(username).info(message, extra={'op': op, 'title': title, 'actor': actor or username})
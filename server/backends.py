@@ -0,0 +1,39 @@
+"""Các storage backend mà ZEO server có thể phục vụ.
+
+    filestorage  FileStorage thường (mặc định), ghi ra file .fs
+    zlib         FileStorage bọc bởi zc.zlibstorage: nén từng bản ghi bằng
+                 zlib, file nhỏ hơn đổi lấy CPU (cần pip install zc.zlibstorage)
+    mapping      MappingStorage trong bộ nhớ, mất dữ liệu khi tắt (dùng cho test)
+
+Mỗi backend được mô tả bằng một đoạn ZConfig, dùng chung cho runzeo -C và
+ZEO.server(storage_conf=...).
+"""
+import importlib.util
+
+BACKENDS = ('filestorage', 'zlib', 'mapping')
+
+
+class BackendUnavailable(Exception):
+    """Backend cần một gói chưa được cài"""
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {backend} (chọn một trong {', '.join(BACKENDS)})")
+    if backend == 'zlib' and importlib.util.find_spec('zc.zlibstorage') is None:
+        raise BackendUnavailable("Backend zlib cần gói zc.zlibstorage (pip install zc.zlibstorage)")
+
+def storage_zconfig(backend, path=None):
+    """Đoạn ZConfig mô tả storage của backend"""
+    check_backend(backend)
+    if backend == 'mapping':
+        return "<mappingstorage>\n</mappingstorage>"
+    filestorage = f"<filestorage>\n  path {path}\n</filestorage>"
+    if backend == 'zlib':
+        # zlibstorage (không phải serverzlibstorage): server giải nén trước khi
+        # gửi nên client không cần cài gì thêm, và vẫn chạy được _p_resolveConflict
+        return f"%import zc.zlibstorage\n<zlibstorage>\n{filestorage}\n</zlibstorage>"
+    return filestorage
+
+def is_file_backed(backend):
+    return backend != 'mapping'
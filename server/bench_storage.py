@@ -0,0 +1,192 @@
+"""So sánh các storage backend với tải thật của thư viện.
+
+Với mỗi backend: khởi động một ZEO server trong tiến trình (ZEO.server),
+tạo catalog sách, chạy hỗn hợp mượn / trả / vào hàng đợi qua LibraryService
+rồi đo:
+
+- độ trễ commit của từng thao tác (p50/p95/p99, đã gồm thử lại khi xung đột)
+- độ trễ load từng quyển sách từ một client có cache rỗng
+- kích thước file sau khi tạo catalog và sau khi chạy tải
+
+    cd server
+    python bench_storage.py
+    python bench_storage.py --backends filestorage zlib --books 500 --ops 5000 --json bench.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import ZEO
+import ZODB
+import transaction
+from ZEO.ClientStorage import ClientStorage
+
+from backends import BACKENDS, BackendUnavailable, is_file_backed, storage_zconfig
+from zeo_server import CLIENT_DIR
+
+# Server chạy trong tiến trình này cần import được Book để giải quyết xung đột
+sys.path.insert(0, CLIENT_DIR)
+
+from models.user import User  # noqa: E402
+from service import LibraryService  # noqa: E402
+from storage import ensure_books_catalog, ensure_book_index, ensure_pending_index  # noqa: E402
+
+# Tỉ lệ các thao tác trong tải
+WORKLOAD = (('borrow', 0.4), ('return', 0.3), ('join_queue', 0.3))
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Phân vị (mili giây) của danh sách độ trễ tính bằng giây"""
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        i = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        result[f"p{p}"] = round(ordered[i] * 1000, 3)
+    return result
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def setup_catalog(service, admin, n_books):
+    books_root = service.books_root
+    ensure_books_catalog(books_root)
+    ensure_book_index(books_root)
+    ensure_pending_index(books_root)
+    service.transaction_manager.commit()
+    titles = [f"Sách {i:05d}" for i in range(n_books)]
+    for i, title in enumerate(titles):
+        service.add_book(title, f"Tác giả {i % 50}", admin)
+    return titles
+
+def run_workload(service, titles, users, n_ops, rng):
+    latencies = {name: [] for name, _ in WORKLOAD}
+    names = [name for name, _ in WORKLOAD]
+    weights = [weight for _, weight in WORKLOAD]
+    admin = User('admin', 'x', role='admin')
+    for _ in range(n_ops):
+        op = rng.choices(names, weights)[0]
+        title = rng.choice(titles)
+        user = rng.choice(users)
+        start = time.perf_counter()
+        if op == 'borrow':
+            service.borrow(title, user.username, confirm=True)
+        elif op == 'return':
+            service.return_book(title, admin)
+        else:
+            service.join_queue(title, user.username)
+        latencies[op].append(time.perf_counter() - start)
+    return latencies
+
+def measure_loads(address, oids):
+    """Độ trễ load bản ghi từ một client mới (cache ZEO rỗng)"""
+    storage = ClientStorage(address)
+    try:
+        samples = []
+        for oid in oids:
+            start = time.perf_counter()
+            storage.load(oid)
+            samples.append(time.perf_counter() - start)
+        return samples
+    finally:
+        storage.close()
+
+def bench_backend(backend, workdir, args):
+    path = os.path.join(workdir, f"{backend}.fs")
+    address, stop = ZEO.server(storage_conf=storage_zconfig(backend, path))
+    rng = random.Random(args.seed)
+    try:
+        db = ZODB.DB(ClientStorage(address))
+        tm = transaction.TransactionManager()
+        connection = db.open(transaction_manager=tm)
+        service = LibraryService(connection.root(), transaction_manager=tm)
+        admin = User('admin', 'x', role='admin')
+        users = [User(f"user{i:03d}", 'x') for i in range(args.users)]
+
+        start = time.perf_counter()
+        titles = setup_catalog(service, admin, args.books)
+        setup_time = time.perf_counter() - start
+        size_setup = file_size(path) if is_file_backed(backend) else None
+
+        latencies = run_workload(service, titles, users, args.ops, rng)
+        books = service.books_root['books']
+        oids = [books[title]._p_oid for title in rng.sample(titles, min(args.load_samples, len(titles)))]
+        tm.abort()
+        connection.close()
+        db.close()
+        size_after = file_size(path) if is_file_backed(backend) else None
+
+        loads = measure_loads(address, oids)
+    finally:
+        stop()
+
+    all_commits = [sample for samples in latencies.values() for sample in samples]
+    return {
+        'backend': backend,
+        'setup_seconds': round(setup_time, 3),
+        'commit_ms': percentiles(all_commits),
+        'commit_ms_by_op': {op: percentiles(samples) for op, samples in latencies.items()},
+        'load_ms': percentiles(loads),
+        'size_after_setup': size_setup,
+        'size_after_workload': size_after,
+        'growth_bytes': size_after - size_setup if size_after is not None else None,
+        'growth_per_op': round((size_after - size_setup) / args.ops, 1) if size_after is not None else None,
+    }
+
+def print_table(results):
+    print(f"\n{'backend':<12} {'commit p50':>10} {'p95':>8} {'p99':>8} {'load p50':>9} {'p99':>8} "
+          f"{'file (byte)':>12} {'byte/op':>8}")
+    for r in results:
+        size = r['size_after_workload'] if r['size_after_workload'] is not None else '-'
+        per_op = r['growth_per_op'] if r['growth_per_op'] is not None else '-'
+        print(f"{r['backend']:<12} {r['commit_ms']['p50']:>10} {r['commit_ms']['p95']:>8} "
+              f"{r['commit_ms']['p99']:>8} {r['load_ms']['p50']:>9} {r['load_ms']['p99']:>8} "
+              f"{size:>12} {per_op:>8}")
+    print("(độ trễ tính bằng ms)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh các storage backend của ZEO")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--load-samples', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.json) if args.json else None
+    workdir = tempfile.mkdtemp(prefix='bench_storage_')
+    cwd = os.getcwd()
+    # Service ghi log vào logs/<user>.jsonl của thư mục hiện tại
+    os.makedirs(os.path.join(workdir, 'logs'))
+    os.chdir(workdir)
+    results = []
+    try:
+        for backend in args.backends:
+            try:
+                print(f"⏱️ {backend}...")
+                results.append(bench_backend(backend, workdir, args))
+            except BackendUnavailable as e:
+                print(f"⏭️ {backend}: {e}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Pack trực tuyến các FileStorage của thư viện.
+
+FileStorage chỉ ghi nối: mỗi lần mượn/trả sách thêm một bản ghi Book mới,
+nên books.fs và books.fs.index lớn dần mãi. Pack bỏ các bản ghi cũ hơn cửa
+sổ giữ lại (days) mà không còn được tham chiếu. Pack chạy qua kết nối ZEO
+nên server và các client vẫn hoạt động trong lúc pack.
+
+    cd server
+    python packer.py                    # pack các storage vượt ngưỡng kích thước
+    python packer.py --storage books --force
+"""
+import argparse
+import logging
+import os
+import time
+
+from ZEO.ClientStorage import ClientStorage
+
+DAY = 86400
+
+logger = logging.getLogger('packer')
+
+
+class PackSchedule:
+    """Khi nào pack một storage và giữ lại bao nhiêu lịch sử.
+
+    Pack khi đã qua interval giây kể từ lần pack trước và file lớn hơn
+    min_size byte. Các revision mới hơn days ngày được giữ lại.
+    """
+
+    def __init__(self, interval=DAY, days=7, min_size=64 * 1024 * 1024, timeout=3600):
+        self.interval = interval
+        self.days = days
+        self.min_size = min_size
+        self.timeout = timeout  # thời gian tối đa chờ server pack xong
+        self.last_run = None  # time.monotonic() của lần kiểm tra gần nhất
+
+    def due(self, path, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_run is not None and now - self.last_run < self.interval:
+            return False
+        self.last_run = now
+        return file_size(path) >= self.min_size
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def pack_storage(address, path, days, timeout=3600):
+    """Pack storage tại address, trả về kích thước trước/sau và thời gian pack"""
+    before = file_size(path)
+    index_before = file_size(path + '.index')
+    start = time.monotonic()
+    # wait_timeout cũng là thời gian chờ tối đa cho mỗi lời gọi tới server
+    storage = ClientStorage(address, wait_timeout=timeout)
+    try:
+        storage.pack(time.time(), wait=True, days=days)
+    finally:
+        storage.close()
+    duration = time.monotonic() - start
+    after = file_size(path)
+    result = {
+        'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'days': days,
+        'size_before': before,
+        'size_after': after,
+        'bytes_reclaimed': before - after,
+        'index_before': index_before,
+        'index_after': file_size(path + '.index'),
+        'duration': round(duration, 3),
+    }
+    logger.info("%s: pack xong trong %.2fs, %s -> %s byte (thu hồi %s byte)",
+                os.path.basename(path), duration, before, after, before - after)
+    return result
+
+
+def main(argv=None):
+    # Import ở đây để supervisor có thể import packer mà không vòng lặp
+    from backends import is_file_backed
+    from supervisor import DEFAULT_CONFIG, load_config
+
+    parser = argparse.ArgumentParser(description="Pack các ZEO storage của thư viện")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='file cấu hình (mặc định zeo_servers.ini)')
+    parser.add_argument('--storage', action='append', help='chỉ pack storage này (có thể lặp lại)')
+    parser.add_argument('--days', type=float, help='ghi đè số ngày lịch sử giữ lại')
+    parser.add_argument('--force', action='store_true', help='pack kể cả khi chưa tới ngưỡng kích thước')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    supervisor, _ = load_config(args.config)
+    for server in supervisor.servers:
+        if args.storage and server.name not in args.storage:
+            continue
+        if not is_file_backed(server.backend):
+            print(f"⏭️ {server.name}: backend {server.backend} không có file để pack")
+            continue
+        schedule = server.pack_schedule or PackSchedule()
+        if not args.force and file_size(server.path) < schedule.min_size:
+            print(f"⏭️ {server.name}: {file_size(server.path)} byte, chưa tới ngưỡng {schedule.min_size}")
+            continue
+        days = schedule.days if args.days is None else args.days
+        result = pack_storage(server.address, server.path, days, schedule.timeout)
+        print(f"🗜️ {server.name}: thu hồi {result['bytes_reclaimed']} byte "
+              f"({result['size_before']} -> {result['size_after']}) trong {result['duration']}s")
+
+
+if __name__ == '__main__':
+    main()
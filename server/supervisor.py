@@ -0,0 +1,417 @@
+"""Giám sát các ZEO server của thư viện.
+
+Khởi động mỗi storage trong file cấu hình bằng runzeo, chờ đến khi server
+trả lời được, kiểm tra sức khỏe định kỳ, khởi động lại khi tiến trình chết
+hoặc bị treo, và tắt các server một cách an toàn khi nhận SIGINT/SIGTERM.
+
+Trạng thái được phục vụ qua HTTP:
+
+    GET /live    200 nếu mọi tiến trình runzeo còn chạy
+    GET /ready   200 nếu mọi server vừa trả lời probe
+    GET /status  JSON: pid, số lần khởi động lại, độ trễ probe, server_status,
+                 kết quả lần pack gần nhất
+
+Storage có pack_interval sẽ được pack trực tuyến theo lịch (xem packer.py).
+
+    cd server
+    python supervisor.py                      # dùng zeo_servers.ini
+    python supervisor.py --config prod.ini
+"""
+import argparse
+import configparser
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ZEO.ClientStorage import ClientStorage
+
+from backends import check_backend, is_file_backed, storage_zconfig
+from packer import PackSchedule, pack_storage
+from zeo_server import zeo_env
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(SERVER_DIR, 'zeo_servers.ini')
+
+SUPERVISOR_DEFAULTS = {
+    'bind': '127.0.0.1',
+    'data_dir': 'data',
+    'check_interval': '5',
+    'ready_timeout': '30',
+    'probe_failures': '3',
+    'max_restarts': '5',
+    'restart_window': '300',
+    'shutdown_timeout': '10',
+    'status_port': '8100',
+}
+
+logger = logging.getLogger('supervisor')
+
+
+class ManagedServer:
+    """Một tiến trình runzeo phục vụ một file storage"""
+
+    def __init__(self, name, bind, port, path, invalidation_queue_size=100, transaction_timeout=None,
+                 pack_schedule=None, backend='filestorage'):
+        check_backend(backend)
+        self.name = name
+        self.backend = backend
+        self.bind = bind
+        self.port = port
+        self.path = path
+        self.invalidation_queue_size = invalidation_queue_size
+        self.transaction_timeout = transaction_timeout
+        self.process = None
+        self.restarts = deque()  # thời điểm các lần khởi động lại gần đây
+        self.failed = False  # đã vượt giới hạn khởi động lại
+        self.restarting = None  # thread đang khởi động lại server
+        self.probe_failures = 0
+        self.last_probe = None  # (ok, latency, server_status)
+        self._probe_storage = None
+        self.pack_schedule = pack_schedule  # None: không pack tự động
+        self.packing = False
+        self.last_pack = None  # kết quả pack_storage hoặc {'error': ...}
+
+    @property
+    def address(self):
+        # Server lắng nghe trên 0.0.0.0 thì probe qua loopback
+        host = '127.0.0.1' if self.bind in ('', '0.0.0.0') else self.bind
+        return (host, self.port)
+
+    @property
+    def conf_path(self):
+        return f"{self.path}.zeo.conf"
+
+    @property
+    def log_path(self):
+        return f"{self.path}.zeo.log"
+
+    def write_zconfig(self):
+        """Ghi file cấu hình ZConfig cho runzeo -C"""
+        lines = [
+            "<zeo>",
+            f"  address {self.bind}:{self.port}",
+            f"  invalidation-queue-size {self.invalidation_queue_size}",
+        ]
+        if self.transaction_timeout:
+            lines.append(f"  transaction-timeout {self.transaction_timeout}")
+        lines += ["</zeo>", storage_zconfig(self.backend, self.path)]
+        with open(self.conf_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+    def start(self):
+        self.write_zconfig()
+        log = open(self.log_path, 'ab')
+        try:
+            self.process = subprocess.Popen(['runzeo', '-C', self.conf_path], env=zeo_env(),
+                                            stdout=log, stderr=subprocess.STDOUT)
+        finally:
+            log.close()
+        self.probe_failures = 0
+        logger.info("%s: khởi động runzeo (pid %s) trên %s:%s", self.name, self.process.pid, self.bind, self.port)
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def probe(self, timeout=5):
+        """Đo độ trễ một lượt hỏi server_status; trả về (ok, latency, status)"""
+        try:
+            if self._probe_storage is None:
+                self._probe_storage = ClientStorage(self.address, wait_timeout=timeout, read_only=True)
+            start = time.monotonic()
+            status = self._probe_storage.server_status(timeout=timeout)
+            result = (True, time.monotonic() - start, status)
+        except Exception as e:
+            self.close_probe()
+            result = (False, None, {'error': str(e)})
+        self.last_probe = result
+        return result
+
+    def close_probe(self):
+        if self._probe_storage is not None:
+            try:
+                self._probe_storage.close()
+            except Exception:
+                pass
+            self._probe_storage = None
+
+    def wait_ready(self, timeout):
+        """Chờ server trả lời probe hoặc tiến trình thoát"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.is_running():
+                return False
+            ok, _, _ = self.probe(timeout=max(1, min(5, deadline - time.monotonic())))
+            if ok:
+                return True
+            time.sleep(0.5)
+        return False
+
+    def stop(self, timeout):
+        """Gửi SIGTERM để runzeo đóng storage, kill nếu quá thời gian"""
+        self.close_probe()
+        if not self.is_running():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("%s: không tự dừng sau %ss, kill", self.name, timeout)
+            self.process.kill()
+            self.process.wait()
+        logger.info("%s: đã dừng (mã thoát %s)", self.name, self.process.returncode)
+
+    def status(self):
+        ok, latency, server_status = self.last_probe or (False, None, {})
+        return {
+            'pid': self.process.pid if self.process else None,
+            'running': self.is_running(),
+            'ready': ok,
+            'failed': self.failed,
+            'restarting': self.restarting is not None,
+            'address': f"{self.bind}:{self.port}",
+            'backend': self.backend,
+            'restarts': len(self.restarts),
+            'latency_ms': round(latency * 1000, 3) if latency is not None else None,
+            'server_status': server_status,
+            'packing': self.packing,
+            'last_pack': self.last_pack,
+        }
+
+
+class Supervisor:
+    """Khởi động, theo dõi và tắt các ManagedServer"""
+
+    def __init__(self, servers, check_interval=5, ready_timeout=30, probe_failures=3,
+                 max_restarts=5, restart_window=300, shutdown_timeout=10):
+        self.servers = servers
+        self.check_interval = check_interval
+        self.ready_timeout = ready_timeout
+        self.max_probe_failures = probe_failures
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.shutdown_timeout = shutdown_timeout
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()  # bảo vệ trạng thái khi HTTP đọc
+
+    def start(self):
+        for server in self.servers:
+            server.start()
+        for server in self.servers:
+            if server.wait_ready(self.ready_timeout):
+                logger.info("%s: sẵn sàng", server.name)
+            else:
+                logger.error("%s: chưa sẵn sàng sau %ss", server.name, self.ready_timeout)
+
+    def _restart(self, server, reason):
+        # Chỉ giữ khóa khi cập nhật bộ đếm: dừng/khởi động và chờ server sẵn
+        # sàng có thể mất tới ready_timeout nên chạy trong thread riêng, trong
+        # lúc đó HTTP và việc kiểm tra server khác không bị chặn
+        with self._lock:
+            if server.restarting is not None:
+                return
+            now = time.monotonic()
+            while server.restarts and now - server.restarts[0] > self.restart_window:
+                server.restarts.popleft()
+            if len(server.restarts) >= self.max_restarts:
+                if not server.failed:
+                    logger.error("%s: đã khởi động lại %s lần trong %ss, dừng thử lại",
+                                 server.name, len(server.restarts), self.restart_window)
+                    server.failed = True
+                return
+            logger.warning("%s: %s, khởi động lại", server.name, reason)
+            server.restarts.append(now)
+            server.restarting = threading.Thread(target=self._do_restart, args=(server,), daemon=True)
+            server.restarting.start()
+
+    def _do_restart(self, server):
+        try:
+            server.stop(self.shutdown_timeout)
+            if not self.stopping.is_set():
+                server.start()
+                server.wait_ready(self.ready_timeout)
+        finally:
+            with self._lock:
+                server.restarting = None
+
+    def check(self):
+        """Một vòng kiểm tra sức khỏe"""
+        for server in self.servers:
+            if self.stopping.is_set():
+                return
+            with self._lock:
+                if server.failed or server.restarting is not None:
+                    continue
+                running = server.is_running()
+                returncode = server.process.returncode
+            if not running:
+                self._restart(server, f"tiến trình đã thoát (mã {returncode})")
+                continue
+            # Probe (có thể chờ vài giây) chạy ngoài khóa
+            ok, latency, _ = server.probe()
+            with self._lock:
+                if ok:
+                    server.probe_failures = 0
+                    self._maybe_pack(server)
+                    continue
+                server.probe_failures += 1
+                failures = server.probe_failures
+            if failures >= self.max_probe_failures:
+                self._restart(server, f"không trả lời {failures} lần liên tiếp")
+
+    def _maybe_pack(self, server):
+        schedule = server.pack_schedule
+        if schedule is None or server.packing or not schedule.due(server.path):
+            return
+        # Pack có thể mất vài phút: chạy riêng để vẫn kiểm tra sức khỏe được
+        server.packing = True
+        threading.Thread(target=self._pack, args=(server,), daemon=True).start()
+
+    def _pack(self, server):
+        schedule = server.pack_schedule
+        try:
+            server.last_pack = pack_storage(server.address, server.path, schedule.days, schedule.timeout)
+        except Exception as e:
+            logger.error("%s: pack thất bại: %s", server.name, e)
+            server.last_pack = {'at': time.strftime('%Y-%m-%d %H:%M:%S'), 'error': str(e)}
+        finally:
+            server.packing = False
+
+    def run(self):
+        self.start()
+        while not self.stopping.wait(self.check_interval):
+            self.check()
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("Đang tắt các ZEO server...")
+        # Chờ các lần khởi động lại đang chạy xong để không còn tiến trình nào được mở sau đó
+        for server in self.servers:
+            restarting = server.restarting
+            if restarting is not None:
+                restarting.join()
+        with self._lock:
+            for server in reversed(self.servers):
+                server.stop(self.shutdown_timeout)
+
+    def live(self):
+        with self._lock:
+            return all(server.is_running() for server in self.servers)
+
+    def ready(self):
+        with self._lock:
+            return all(server.is_running() and server.last_probe and server.last_probe[0]
+                       for server in self.servers)
+
+    def status(self):
+        with self._lock:
+            return {server.name: server.status() for server in self.servers}
+
+
+def make_status_handler(supervisor):
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/live':
+                ok, body = supervisor.live(), {'live': supervisor.live()}
+            elif self.path == '/ready':
+                ok, body = supervisor.ready(), {'ready': supervisor.ready()}
+            elif self.path == '/status':
+                ok, body = True, supervisor.status()
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(200 if ok else 503)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return StatusHandler
+
+
+def load_config(path):
+    """Đọc file cấu hình, trả về (Supervisor, cổng HTTP trạng thái)"""
+    parser = configparser.ConfigParser()
+    if not parser.read(path, encoding='utf-8'):
+        raise FileNotFoundError(f"Không tìm thấy file cấu hình {path}")
+    settings = dict(SUPERVISOR_DEFAULTS)
+    if parser.has_section('supervisor'):
+        settings.update(parser['supervisor'])
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(path)), settings['data_dir'])
+    os.makedirs(data_dir, exist_ok=True)
+
+    servers = []
+    for section in parser.sections():
+        if not section.startswith('storage:'):
+            continue
+        options = parser[section]
+        timeout = options.getint('transaction_timeout', fallback=0)
+        pack_interval = options.getfloat('pack_interval', fallback=0)  # giờ
+        backend = options.get('backend', 'filestorage')
+        pack_schedule = None
+        if pack_interval and is_file_backed(backend):
+            pack_schedule = PackSchedule(
+                interval=pack_interval * 3600,
+                days=options.getfloat('pack_days', fallback=7),
+                min_size=int(options.getfloat('pack_min_size_mb', fallback=64) * 1024 * 1024),
+                timeout=options.getfloat('pack_timeout', fallback=3600),
+            )
+        servers.append(ManagedServer(
+            name=section.split(':', 1)[1],
+            bind=options.get('bind', settings['bind']),
+            port=options.getint('port'),
+            path=os.path.join(data_dir, options.get('path')),
+            invalidation_queue_size=options.getint('invalidation_queue_size', fallback=100),
+            transaction_timeout=timeout or None,
+            pack_schedule=pack_schedule,
+            backend=backend,
+        ))
+    supervisor = Supervisor(
+        servers,
+        check_interval=float(settings['check_interval']),
+        ready_timeout=float(settings['ready_timeout']),
+        probe_failures=int(settings['probe_failures']),
+        max_restarts=int(settings['max_restarts']),
+        restart_window=float(settings['restart_window']),
+        shutdown_timeout=float(settings['shutdown_timeout']),
+    )
+    return supervisor, int(settings['status_port'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Giám sát các ZEO server của thư viện")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='file cấu hình (mặc định zeo_servers.ini)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    supervisor, status_port = load_config(args.config)
+
+    def stop(signum, frame):
+        supervisor.stopping.set()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    status_server = None
+    if status_port:
+        status_server = ThreadingHTTPServer(('127.0.0.1', status_port), make_status_handler(supervisor))
+        threading.Thread(target=status_server.serve_forever, daemon=True).start()
+        logger.info("Trạng thái: http://127.0.0.1:%s/status", status_port)
+
+    try:
+        supervisor.run()
+    finally:
+        if status_server is not None:
+            status_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
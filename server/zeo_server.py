@@ -1,22 +1,51 @@
+import argparse
 import sys
 import subprocess
 import os
 
-def run_zeo_server(port, storage_file):
+from backends import BACKENDS, storage_zconfig
+
+# Thư mục client chứa các model (Book, BookQueue) mà server cần import để
+# chạy _p_resolveConflict khi hai client ghi cùng một đối tượng
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'client')
+
+def zeo_env():
+    """Môi trường cho runzeo với client/ trong PYTHONPATH"""
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [CLIENT_DIR, env.get('PYTHONPATH')] if p)
+    return env
+
+def run_zeo_server(port, storage_file, backend='filestorage'):
     """Chạy một ZEO server instance cho một storage file cụ thể"""
-    cmd = ['runzeo', '-a', f'127.0.0.1:{port}', '-f', storage_file]
-    subprocess.Popen(cmd)
+    if backend == 'filestorage':
+        cmd = ['runzeo', '-a', f'127.0.0.1:{port}', '-f', storage_file]
+    else:
+        # Backend khác cần cấu hình ZConfig cho runzeo -C
+        conf_path = f"{storage_file}.zeo.conf"
+        with open(conf_path, 'w', encoding='utf-8') as f:
+            f.write(f"<zeo>\n  address 127.0.0.1:{port}\n</zeo>\n{storage_zconfig(backend, storage_file)}\n")
+        cmd = ['runzeo', '-C', conf_path]
+    subprocess.Popen(cmd, env=zeo_env())
+
+def main(argv=None):
+    """Khởi động nhanh hai server rồi thoát (không theo dõi, không khởi động lại).
+
+    Để chạy lâu dài dùng supervisor.py: đọc cấu hình zeo_servers.ini, kiểm
+    tra sức khỏe, khởi động lại khi server chết và tắt an toàn.
+    """
+    parser = argparse.ArgumentParser(description="Khởi động nhanh hai ZEO server")
+    parser.add_argument('--backend', choices=BACKENDS, default='filestorage', help='storage backend')
+    args = parser.parse_args(argv)
 
-def main():
     # Tạo thư mục data nếu chưa tồn tại
     if not os.path.exists('data'):
         os.makedirs('data')
     
     # Chạy ZEO server cho accounts storage
-    run_zeo_server(8000, 'data/accounts.fs')
+    run_zeo_server(8000, 'data/accounts.fs', args.backend)
     
     # Chạy ZEO server cho books storage
-    run_zeo_server(8001, 'data/books.fs')
+    run_zeo_server(8001, 'data/books.fs', args.backend)
 
 if __name__ == '__main__':
     main()